@@ -0,0 +1,158 @@
+import asyncio
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.wsgi import get_wsgi_application
+from django.db import OperationalError, connection
+from products.inventory import set_shards
+from products.models import Product
+from shopify.handlers import ASGIHandler
+from shoppingCart.models import InventoryChanged, ShoppingCart, reserve
+
+def request_body(document, variables):
+    return json.dumps({"query": document, "variables": variables}).encode()
+
+def wsgi_environ(body):
+    return {
+        "REQUEST_METHOD": "POST",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": "/",
+        "QUERY_STRING": "",
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+
+def wsgi_throughput(body, requests, threads, delay):
+    """ Requests per second of a threaded WSGI server, every request holds a thread while its client
+        takes delay seconds to send the body """
+
+    application = get_wsgi_application()
+    statuses = []
+
+    def handle():
+        time.sleep(delay)
+        result = application(wsgi_environ(body), lambda status, headers, exc_info=None: statuses.append(status))
+        b"".join(result)
+        result.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for future in [pool.submit(handle) for i in range(requests)]:
+            future.result()
+
+    return requests / (time.perf_counter() - start), statuses
+
+def asgi_throughput(body, requests, threads, delay, clients):
+    """ Requests per second of ASGIHandler with clients concurrent clients that each take delay seconds
+        to send the body, requests are handled on threads threads """
+
+    handler = ASGIHandler(get_wsgi_application(), threads)
+    statuses = []
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/",
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    }
+
+    async def receive():
+        await asyncio.sleep(delay)
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    async def client(count):
+        for i in range(count):
+            await handler(scope, receive, send)
+
+    async def serve():
+        await asyncio.gather(*(client(requests // clients + (i < requests % clients)) for i in range(clients)))
+
+    start = time.perf_counter()
+    try:
+        asyncio.run(serve())
+    finally:
+        handler.executor.shutdown(wait=True)
+
+    return requests / (time.perf_counter() - start), statuses
+
+def compare(document, variables, requests, threads, delay, clients):
+    """ Throughput of the WSGI and the ASGI entry points serving one operation to slow clients """
+
+    body = request_body(document, variables)
+    wsgiRate, wsgiStatuses = wsgi_throughput(body, requests, threads, delay)
+    asgiRate, asgiStatuses = asgi_throughput(body, requests, threads, delay, clients)
+    wsgiServed = sum(1 for status in wsgiStatuses if str(status).startswith("200"))
+    asgiServed = sum(1 for status in asgiStatuses if status == 200)
+
+    return {
+        "requests": requests,
+        "threads": threads,
+        "clients": clients,
+        "delay_ms": round(delay * 1000, 3),
+        "wsgi_rps": round(wsgiRate, 1),
+        "asgi_rps": round(asgiRate, 1),
+        "wsgi_served": wsgiServed,
+        "asgi_served": asgiServed,
+        "errors": len(wsgiStatuses) - wsgiServed + len(asgiStatuses) - asgiServed,
+    }
+
+def checkout_throughput(shards, checkouts, threads):
+    """ Checkouts per second of carts that each hold a unit of the same product, with the product's stock on its
+        row (shards 0) or spread over shards counters. Checkouts that lose a race for a lock are retried """
+
+    product = Product.objects.create(title=f"Hot product {shards}", price="9.99", inventory_count=checkouts)
+    set_shards(product.id, shards)
+
+    carts = []
+    for i in range(checkouts):
+        cart = ShoppingCart.objects.create(total=0)
+        reserve(cart, {Product.objects.get(id=product.id): 1})
+        cart.items.add(product.id)
+        carts.append(cart)
+
+    def handle(cart):
+        retries = 0
+
+        try:
+            while True:
+                try:
+                    return len(cart.checkout()), retries
+                except (InventoryChanged, OperationalError):
+                    retries = retries + 1
+                    time.sleep(0.001)
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        outcomes = list(pool.map(handle, carts))
+    elapsed = time.perf_counter() - start
+
+    set_shards(product.id, 0)
+
+    return {
+        "shards": shards,
+        "checkouts": checkouts,
+        "threads": threads,
+        "checkouts_per_s": round(checkouts / elapsed, 1),
+        "retries": sum(retries for failed, retries in outcomes),
+        "failed": sum(failed for failed, retries in outcomes),
+        "stock_left": Product.objects.get(id=product.id).inventory_count,
+    }
+
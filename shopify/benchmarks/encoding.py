@@ -0,0 +1,78 @@
+import json
+import time
+from shopify.encoding import brotli, compress, dumps, orjson
+from shopify.schema import schema
+from shopify.views import backend
+from .operations import PRODUCT_FIELDS
+from .runner import BenchmarkContext, BenchmarkError
+
+PAGE_QUERY = f"query Page($after: String) {{ allProducts(after: $after) {{ edges {{ node {{ {PRODUCT_FIELDS} }} }} pageInfo {{ hasNextPage endCursor }} }} }}"
+
+def graphene_dumps(data):
+    """ What graphene's GraphQLView sends, text encoded to bytes by the response """
+
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+def product_payload(rows):
+    """ Response body of an allProducts query returning rows products. Pages are capped at the connection
+        limit, so the edges are gathered a page at a time """
+
+    document = backend.document_from_string(schema, PAGE_QUERY)
+    edges = []
+    after = None
+
+    while len(edges) < rows:
+        result = document.execute(context=BenchmarkContext(), variables={"after": after})
+        if result.errors:
+            raise BenchmarkError(f"{result.errors[0]}")
+
+        connection = result.data["allProducts"]
+        edges.extend(connection["edges"])
+        if not connection["pageInfo"]["hasNextPage"]:
+            break
+        after = connection["pageInfo"]["endCursor"]
+
+    return {"data": {"allProducts": {"edges": edges[:rows], "pageInfo": {"hasNextPage": True, "endCursor": after}}}}
+
+def cpu_ms(run, iterations):
+    """ Median CPU time of run in milliseconds, and its last result """
+
+    timings = []
+    for i in range(iterations):
+        start = time.process_time()
+        result = run()
+        timings.append((time.process_time() - start) * 1000)
+
+    return round(sorted(timings)[len(timings) // 2], 3), result
+
+def encoding_costs(rows, iterations=5):
+    """ CPU time and bytes on the wire of a rows product response for each serializer and content coding,
+        with what each saves over graphene's json.dumps sent uncompressed """
+
+    payload = product_payload(rows)
+    encoders = {"json": graphene_dumps, "orjson" if orjson is not None else "json fallback": dumps}
+    encodings = [None, "gzip"] + (["br"] if brotli is not None else [])
+    results = []
+
+    for encoderName, encode in encoders.items():
+        encodeMs, content = cpu_ms(lambda: encode(payload), iterations)
+
+        for encoding in encodings:
+            compressMs, body = cpu_ms(lambda: compress(content, encoding), iterations) if encoding else (0, content)
+
+            results.append({
+                "rows": len(payload["data"]["allProducts"]["edges"]),
+                "encoder": encoderName,
+                "encoding": encoding or "identity",
+                "encode_ms": encodeMs,
+                "compress_ms": compressMs,
+                "cpu_ms": round(encodeMs + compressMs, 3),
+                "bytes": len(body),
+            })
+
+    baseline = results[0]
+    for result in results:
+        result["cpu_saved_ms"] = round(baseline["cpu_ms"] - result["cpu_ms"], 3)
+        result["bytes_saved"] = baseline["bytes"] - result["bytes"]
+
+    return results
@@ -0,0 +1,60 @@
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from benchmarks.runner import run, check_budgets, make_budgets
+
+DEFAULT_BUDGETS = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "budgets.json")
+
+def sizes(value):
+    return [int(size) for size in value.split(",")]
+
+class Command(BaseCommand):
+    """ Runs every GraphQL operation in process against a throwaway database and checks the results against budgets """
+
+    help = "Benchmarks every query and mutation at several catalog and cart sizes, fails when a budget is exceeded"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=sizes, default=[100, 10000, 1000000], help="Comma separated catalog sizes")
+        parser.add_argument("--items", type=sizes, default=[1, 50, 500], help="Comma separated cart sizes")
+        parser.add_argument("--iterations", type=int, default=20, help="Timed runs per operation and size")
+        parser.add_argument("--operations", type=lambda value: value.split(","), default=None, help="Only run these operations")
+        parser.add_argument("--output", default="bench_output.json", help="File the results are written to as JSON")
+        parser.add_argument("--budgets", default=DEFAULT_BUDGETS, help="JSON file of maximum values per result")
+        parser.add_argument("--write-budgets", action="store_true", help="Replace the budgets with ones derived from this run")
+
+    def handle(self, *args, **options):
+        testDatabase = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        self.stdout.write(f"Benchmarking against {testDatabase}")
+
+        try:
+            results = run(options["products"], options["items"], options["iterations"], options["operations"], self.log)
+        finally:
+            connection.creation.destroy_test_db(testDatabase, verbosity=0)
+
+        with open(options["output"], "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+        self.stdout.write(f"Wrote {len(results)} results to {options['output']}")
+
+        if options["write_budgets"]:
+            with open(options["budgets"], "w") as budgetsFile:
+                json.dump(make_budgets(results), budgetsFile, indent=2, sort_keys=True)
+            self.stdout.write(f"Wrote budgets to {options['budgets']}")
+            return
+
+        budgets = {}
+        if os.path.exists(options["budgets"]):
+            with open(options["budgets"]) as budgetsFile:
+                budgets = json.load(budgetsFile)
+
+        violations = check_budgets(results, budgets)
+        if violations:
+            raise CommandError("Benchmark budgets exceeded:\n" + "\n".join(violations))
+
+        self.stdout.write("All benchmarks within budget")
+
+    def log(self, key, result):
+        self.stdout.write(
+            f"{key}: p50 {result['p50_ms']}ms p95 {result['p95_ms']}ms p99 {result['p99_ms']}ms "
+            f"queries {result['queries']} alloc {result['alloc_peak_kb']}KB"
+        )
@@ -0,0 +1,39 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection
+from benchmarks.concurrency import checkout_throughput
+
+def sizes(value):
+    return [int(size) for size in value.split(",")]
+
+class Command(BaseCommand):
+    """ Measures concurrent checkouts of one product with its stock on the product row and on counter shards """
+
+    help = "Checks out many carts holding the same product from concurrent threads and reports checkouts per second by shard count"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shards", type=sizes, default=[0, 4, 16], help="Comma separated shard counts, 0 counts stock on the product row")
+        parser.add_argument("--checkouts", type=int, default=500, help="Carts checked out for every shard count")
+        parser.add_argument("--threads", type=int, default=8, help="Threads checking carts out")
+        parser.add_argument("--output", default=None, help="File the results are written to as JSON")
+
+    def handle(self, *args, **options):
+        testDatabase = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        self.stdout.write(f"Benchmarking against {testDatabase}")
+        results = []
+
+        try:
+            for shards in options["shards"]:
+                result = checkout_throughput(shards, options["checkouts"], options["threads"])
+                results.append(result)
+
+                self.stdout.write(
+                    f"shards={shards}: {result['checkouts_per_s']} checkouts/s ({result['threads']} threads, "
+                    f"{result['retries']} retries, {result['failed']} failed, {result['stock_left']} units left)"
+                )
+        finally:
+            connection.creation.destroy_test_db(testDatabase, verbosity=0)
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2, sort_keys=True)
@@ -0,0 +1,48 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from benchmarks.concurrency import compare
+from benchmarks.operations import OPERATIONS
+from benchmarks.runner import Fixture, seed_products
+
+class Command(BaseCommand):
+    """ Compares the throughput of the WSGI and ASGI entry points with many slow clients """
+
+    help = "Serves one operation to many concurrent slow clients through shopify.wsgi and shopify.asgi and reports requests per second"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operation", default="product_by_id", help="Operation from benchmarks.operations to serve")
+        parser.add_argument("--products", type=int, default=10000, help="Catalog size")
+        parser.add_argument("--requests", type=int, default=2000, help="Requests to serve with each entry point")
+        parser.add_argument("--clients", type=int, default=500, help="Concurrent clients of the ASGI entry point")
+        parser.add_argument("--threads", type=int, default=8, help="Worker threads of both entry points")
+        parser.add_argument("--delay", type=float, default=0.05, help="Seconds each client takes to send its request")
+        parser.add_argument("--output", default=None, help="File the result is written to as JSON")
+
+    def handle(self, *args, **options):
+        operations = {operation.name: operation for operation in OPERATIONS}
+        operation = operations.get(options["operation"])
+        if operation is None or operation.scope != "products":
+            raise CommandError(f"Unknown products operation {options['operation']}")
+
+        testDatabase = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        self.stdout.write(f"Benchmarking against {testDatabase}")
+
+        try:
+            fixture = Fixture()
+            seed_products(fixture, options["products"])
+            result = compare(
+                operation.document, operation.variables(fixture),
+                options["requests"], options["threads"], options["delay"], options["clients"],
+            )
+        finally:
+            connection.creation.destroy_test_db(testDatabase, verbosity=0)
+
+        self.stdout.write(
+            f"{operation.name}: wsgi {result['wsgi_rps']} requests/s, asgi {result['asgi_rps']} requests/s "
+            f"({result['clients']} clients, {result['threads']} threads, {result['delay_ms']}ms client delay, {result['errors']} errors)"
+        )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(result, output, indent=2, sort_keys=True)
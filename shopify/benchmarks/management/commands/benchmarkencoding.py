@@ -0,0 +1,42 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection
+from benchmarks.encoding import encoding_costs
+from benchmarks.runner import Fixture, seed_products
+
+def sizes(value):
+    return [int(size) for size in value.split(",")]
+
+class Command(BaseCommand):
+    """ Measures the serializers and content codings of large product responses """
+
+    help = "Encodes allProducts responses of several sizes with each serializer and compression and reports CPU time and bytes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=sizes, default=[10000, 100000], help="Comma separated numbers of products in the response")
+        parser.add_argument("--iterations", type=int, default=5, help="Timed runs per serializer and coding")
+        parser.add_argument("--output", default=None, help="File the results are written to as JSON")
+
+    def handle(self, *args, **options):
+        testDatabase = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        self.stdout.write(f"Benchmarking against {testDatabase}")
+        results = []
+
+        try:
+            fixture = Fixture()
+            seed_products(fixture, max(options["rows"]))
+
+            for rows in sorted(options["rows"]):
+                for result in encoding_costs(rows, options["iterations"]):
+                    results.append(result)
+                    self.stdout.write(
+                        f"rows={result['rows']} {result['encoder']} {result['encoding']}: {result['cpu_ms']}ms cpu "
+                        f"({result['encode_ms']}ms encoding, {result['compress_ms']}ms compressing), {result['bytes']} bytes, "
+                        f"saves {result['cpu_saved_ms']}ms and {result['bytes_saved']} bytes"
+                    )
+        finally:
+            connection.creation.destroy_test_db(testDatabase, verbosity=0)
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2, sort_keys=True)
@@ -0,0 +1,125 @@
+from collections import namedtuple
+
+Operation = namedtuple("Operation", "name scope document variables sessionCart expect")
+Operation.__new__.__defaults__ = (True, None)
+Operation.__doc__ = """ A GraphQL document to benchmark. Scope "products" runs once per catalog size,
+    scope "cart" once per catalog and cart size. variables builds the variables from the fixture,
+    sessionCart puts the fixture cart in the session and expect, given the fixture and the result data,
+    checks that the run did what it measures """
+
+PRODUCT_FIELDS = "id title price inventoryCount"
+CART_FIELDS = f"id items {{ {PRODUCT_FIELDS} }} total"
+
+OPERATIONS = [
+    Operation(
+        "product_by_id", "products",
+        f"query Product($id: Int) {{ product(id: $id) {{ {PRODUCT_FIELDS} }} }}",
+        lambda fixture: {"id": fixture.lastProductId},
+    ),
+    Operation(
+        "product_by_title", "products",
+        f"query Product($title: String) {{ product(title: $title) {{ {PRODUCT_FIELDS} }} }}",
+        lambda fixture: {"title": fixture.lastProductTitle},
+    ),
+    Operation(
+        "products_by_keys", "products",
+        f"query Products($ids: [Int!], $titles: [String!]) {{ products(ids: $ids, titles: $titles) {{ {PRODUCT_FIELDS} }} }}",
+        lambda fixture: {
+            "ids": list(range(max(1, fixture.productCount - 19), fixture.productCount + 1)),
+            "titles": [f"Product {i}" for i in range(1, min(fixture.productCount, 20) + 1)],
+        },
+    ),
+    Operation(
+        "all_products_first_page", "products",
+        f"query {{ allProducts {{ edges {{ node {{ {PRODUCT_FIELDS} }} }} pageInfo {{ hasNextPage endCursor }} }} }}",
+        lambda fixture: {},
+    ),
+    Operation(
+        "all_products_last_page", "products",
+        f"query Page($after: String) {{ allProducts(after: $after) {{ edges {{ node {{ {PRODUCT_FIELDS} }} }} }} }}",
+        lambda fixture: {"after": fixture.lastPageCursor},
+    ),
+    Operation(
+        "all_products_in_stock_by_price", "products",
+        f"query {{ allProducts(inventoryCountGt: 0, orderBy: PRICE_ASC) {{ edges {{ node {{ {PRODUCT_FIELDS} }} }} }} }}",
+        lambda fixture: {},
+    ),
+    Operation(
+        "search_products", "products",
+        f"query Search($query: String!) {{ searchProducts(query: $query, first: 20) {{ edges {{ node {{ {PRODUCT_FIELDS} }} }} }} }}",
+        lambda fixture: {"query": str(fixture.productCount // 10)[:-1]},
+    ),
+    Operation(
+        "create_product", "products",
+        f"mutation {{ createProduct(title: \"Benchmark product\", price: 9.99, inventoryCount: 5) {{ product {{ {PRODUCT_FIELDS} }} }} }}",
+        lambda fixture: {},
+    ),
+    Operation(
+        "create_products", "products",
+        f"mutation Create($products: [ProductInput!]!) {{ createProducts(products: $products) {{ products {{ {PRODUCT_FIELDS} }} errors {{ index message }} }} }}",
+        lambda fixture: {"products": [{"title": f"Benchmark product {i}", "price": 9.99, "inventoryCount": 5} for i in range(100)]},
+    ),
+    Operation(
+        "delete_product", "products",
+        "mutation Delete($id: Int!) { deleteProduct(id: $id) { message } }",
+        lambda fixture: {"id": fixture.lastProductId},
+    ),
+    Operation(
+        "shopping_cart", "cart",
+        f"query {{ shoppingCart {{ {CART_FIELDS} }} }}",
+        lambda fixture: {},
+    ),
+    Operation(
+        "all_shopping_carts", "cart",
+        f"query {{ allShoppingCarts {{ edges {{ node {{ {CART_FIELDS} }} }} }} }}",
+        lambda fixture: {},
+    ),
+    Operation(
+        "create_cart", "cart",
+        f"mutation Create($items: [Int]) {{ createCart(items: $items) {{ cart {{ {CART_FIELDS} }} }} }}",
+        lambda fixture: {"items": fixture.cartProductIds},
+        sessionCart=False,
+    ),
+    Operation(
+        "add_to_cart", "cart",
+        f"mutation Add($id: Int!) {{ addToCart(productId: $id) {{ cart {{ {CART_FIELDS} }} }} }}",
+        lambda fixture: {"id": fixture.inStockProductId},
+        expect=lambda fixture, data: str(fixture.inStockProductId) in [item["id"] for item in data["addToCart"]["cart"]["items"]],
+    ),
+    Operation(
+        "add_items_to_cart", "cart",
+        f"mutation Add($items: [CartItemInput!]!) {{ addItemsToCart(items: $items) {{ cart {{ {CART_FIELDS} }} failedItems {{ id }} }} }}",
+        lambda fixture: {"items": [{"productId": productId, "quantity": 2} for productId in fixture.cartProductIds]},
+    ),
+    Operation(
+        "set_cart_items", "cart",
+        f"mutation Set($items: [CartItemInput!]!) {{ setCartItems(items: $items) {{ cart {{ {CART_FIELDS} }} failedItems {{ id }} }} }}",
+        lambda fixture: {"items": [{"productId": productId, "quantity": 3} for productId in fixture.cartProductIds[1:]]},
+    ),
+    Operation(
+        "remove_from_cart", "cart",
+        f"mutation Remove($id: Int!) {{ removeFromCart(productId: $id) {{ cart {{ {CART_FIELDS} }} }} }}",
+        lambda fixture: {"id": fixture.cartProductIds[0]},
+    ),
+    Operation(
+        "submit_cart", "cart",
+        f"mutation {{ submitCart {{ cart {{ {CART_FIELDS} }} failedItems {{ id }} message }} }}",
+        lambda fixture: {},
+    ),
+    Operation(
+        "delete_cart", "cart",
+        "mutation Delete($id: Int!) { deleteCart(id: $id) { message } }",
+        lambda fixture: {"id": fixture.cartId},
+    ),
+]
+
+# Operations also run as full HTTP requests with each session engine, to compare the session queries
+REQUEST_OPERATIONS = ["shopping_cart", "create_cart"]
+# Product reads also run against a warm catalog snapshot
+SNAPSHOT_OPERATIONS = ["product_by_id", "product_by_title", "products_by_keys", "all_products_first_page", "all_products_last_page", "all_products_in_stock_by_price"]
+# Public product reads also run as GET requests, fresh and revalidated with the ETag of a previous response
+GET_OPERATIONS = ["product_by_id", "all_products_first_page"]
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cache": "shopify.sessions",
+}
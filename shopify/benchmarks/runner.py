@@ -0,0 +1,281 @@
+import json
+import math
+import time
+import tracemalloc
+from decimal import Decimal
+from importlib import import_module
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from graphene_django.settings import graphene_settings
+from products.cache import get_result_cache
+from products.models import Product
+from products.snapshot import get_snapshot
+from shoppingCart.models import CartLine, ShoppingCart
+from shoppingCart.schema import SESSION_CART
+from shopify.pagination import to_cursor
+from shopify.schema import schema
+from shopify.views import backend
+from .operations import GET_OPERATIONS, OPERATIONS, REQUEST_OPERATIONS, SESSION_ENGINES, SNAPSHOT_OPERATIONS
+
+SEED_BATCH_SIZE = 10000
+CART_COUNT = 100
+# Units of the product carts add, enough that no run finds it sold out
+IN_STOCK_INVENTORY = 1000000
+
+class BenchmarkError(Exception):
+    """ Raised when a benchmarked operation returns errors """
+
+class BenchmarkContext:
+    """ Stands in for the request, the session lives in memory so it costs no queries """
+
+    def __init__(self, cartId=None):
+        self.session = {}
+
+        if cartId is not None:
+            self.session[SESSION_CART] = cartId
+
+class Fixture:
+    """ Data the benchmarked operations run against """
+
+    def __init__(self):
+        self.productCount = 0
+        self.lastProductId = None
+        self.lastProductTitle = None
+        self.inStockProductId = None
+        self.lastPageCursor = None
+        self.cartId = None
+        self.cartProductIds = []
+
+def seed_products(fixture, count):
+    """ Grows the catalog to count products, sizes are seeded in increasing order so rows are only ever added.
+        The last product is the one carts add and is stocked for every run """
+
+    for start in range(fixture.productCount, count, SEED_BATCH_SIZE):
+        stop = min(count, start + SEED_BATCH_SIZE)
+        Product.objects.bulk_create(
+            Product(id=i, title=f"Product {i}", price=Decimal(i * 7919 % 10000) / 100, inventory_count=i % 50)
+            for i in range(start + 1, stop + 1)
+        )
+
+    Product.objects.filter(id=count).update(inventory_count=IN_STOCK_INVENTORY)
+
+    fixture.productCount = count
+    fixture.lastProductId = count
+    fixture.inStockProductId = count
+    fixture.lastProductTitle = f"Product {count}"
+    fixture.lastPageCursor = to_cursor(Product(id=max(0, count - graphene_settings.RELAY_CONNECTION_MAX_LIMIT)))
+
+def seed_carts(fixture, items):
+    """ Replaces the carts with CART_COUNT carts holding the first items products """
+
+    ShoppingCart.objects.all().delete()
+
+    productIds = list(Product.objects.order_by("id").values_list("id", flat=True)[:items])
+    total = sum(Product.objects.filter(id__in=productIds).values_list("price", flat=True), Decimal(0))
+    carts = ShoppingCart.objects.bulk_create(ShoppingCart(id=i, total=total) for i in range(1, CART_COUNT + 1))
+
+    CartLine.objects.bulk_create(
+        CartLine(cart_id=cart.id, product_id=productId) for cart in carts for productId in productIds
+    )
+
+    fixture.cartId = carts[0].id
+    fixture.cartProductIds = productIds
+
+def percentile(timings, p):
+    ordered = sorted(timings)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+def run_once(document, variables, context, expect=None):
+    """ Executes a document in a transaction that is rolled back, so every run sees the same data.
+        expect checks the result data, a run it fails raises BenchmarkError """
+
+    get_result_cache().clear()
+
+    with transaction.atomic():
+        result = document.execute(context=context, variables=variables)
+        transaction.set_rollback(True)
+
+    if result.errors:
+        raise BenchmarkError(f"{result.errors[0]}")
+
+    if expect is not None and not expect(result.data):
+        raise BenchmarkError(f"Unexpected result {result.data}")
+
+def profile(runOnce, iterations):
+    """ Latency percentiles, SQL query count and allocated memory of runOnce """
+
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        runOnce()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    with CaptureQueriesContext(connection) as captured:
+        runOnce()
+    queries = len(captured)
+
+    tracemalloc.start()
+    try:
+        runOnce()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "p50_ms": round(percentile(timings, 0.5), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "queries": queries,
+        "alloc_peak_kb": round(peak / 1024, 1),
+    }
+
+def measure(operation, fixture, iterations):
+    """ Measurements of one operation executed directly against the schema.
+        Every run starts with cold result caches and loaders """
+
+    document = backend.document_from_string(schema, operation.document)
+    variables = operation.variables(fixture)
+    cartId = fixture.cartId if operation.sessionCart else None
+    expect = (lambda data: operation.expect(fixture, data)) if operation.expect is not None else None
+
+    return profile(lambda: run_once(document, variables, BenchmarkContext(cartId), expect), iterations)
+
+def measure_snapshot(operation, fixture, iterations):
+    """ Measurements of one operation answered from the catalog snapshot. The snapshot copies the
+        catalog before the measured runs, seeding doesn't log changes so it starts from scratch """
+
+    with override_settings(CATALOG_SNAPSHOT=dict(settings.CATALOG_SNAPSHOT, ENABLED=True)):
+        get_snapshot().clear()
+        run_once(backend.document_from_string(schema, operation.document), operation.variables(fixture), BenchmarkContext())
+
+        return measure(operation, fixture, iterations)
+
+def measure_request(operation, fixture, engine, iterations):
+    """ Measurements of one operation sent through the whole request cycle, session middleware
+        included, with the given session engine. Clients of sessionCart operations reuse one
+        session holding the fixture cart, the others start a new session every run """
+
+    body = json.dumps({"query": operation.document, "variables": operation.variables(fixture)})
+
+    with override_settings(SESSION_ENGINE=engine):
+        session = None
+        if operation.sessionCart:
+            session = import_module(engine).SessionStore()
+            session[SESSION_CART] = fixture.cartId
+            session.save()
+
+        def runOnce():
+            client = Client()
+            if session is not None:
+                client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+            get_result_cache().clear()
+
+            with transaction.atomic():
+                response = client.post("/", body, content_type="application/json")
+                transaction.set_rollback(True)
+
+            errors = response.json().get("errors")
+            if errors:
+                raise BenchmarkError(errors[0]["message"])
+
+        return profile(runOnce, iterations)
+
+def measure_get(operation, fixture, iterations, revalidate=False):
+    """ Measurements of a public query sent as a GET request, with revalidate by a client holding the
+        ETag of the current response, which gets a 304 """
+
+    params = {"query": operation.document, "variables": json.dumps(operation.variables(fixture))}
+    client = Client()
+    etag = client.get("/", params, HTTP_ACCEPT="application/json")["ETag"]
+    headers = {"HTTP_IF_NONE_MATCH": etag} if revalidate else {}
+
+    def runOnce():
+        get_result_cache().clear()
+        response = client.get("/", params, HTTP_ACCEPT="application/json", **headers)
+
+        if response.status_code != (304 if revalidate else 200):
+            raise BenchmarkError(f"{operation.name} GET returned {response.status_code}")
+
+    return profile(runOnce, iterations)
+
+def run(productSizes, cartSizes, iterations, names=None, log=None):
+    """ Benchmarks every operation at every catalog size, and cart operations at every cart size
+        that fits in the catalog. Returns results keyed by operation and size """
+
+    fixture = Fixture()
+    results = {}
+    operations = [operation for operation in OPERATIONS if names is None or operation.name in names]
+
+    for productCount in sorted(productSizes):
+        seed_products(fixture, productCount)
+
+        for operation in operations:
+            if operation.scope == "products":
+                key = f"{operation.name}[products={productCount}]"
+                results[key] = measure(operation, fixture, iterations)
+                if log:
+                    log(key, results[key])
+
+            if operation.name in SNAPSHOT_OPERATIONS:
+                key = f"{operation.name}_snapshot[products={productCount}]"
+                results[key] = measure_snapshot(operation, fixture, iterations)
+                if log:
+                    log(key, results[key])
+
+            if operation.name in GET_OPERATIONS:
+                for suffix, revalidate in (("get", False), ("revalidate", True)):
+                    key = f"{operation.name}_{suffix}[products={productCount}]"
+                    results[key] = measure_get(operation, fixture, iterations, revalidate)
+                    if log:
+                        log(key, results[key])
+
+        for items in sorted(cartSizes):
+            if items > productCount:
+                continue
+
+            seed_carts(fixture, items)
+
+            for operation in operations:
+                if operation.scope == "cart":
+                    key = f"{operation.name}[products={productCount},items={items}]"
+                    results[key] = measure(operation, fixture, iterations)
+                    if log:
+                        log(key, results[key])
+
+                if operation.name in REQUEST_OPERATIONS:
+                    for engineName, engine in SESSION_ENGINES.items():
+                        key = f"{operation.name}_request[products={productCount},items={items},sessions={engineName}]"
+                        results[key] = measure_request(operation, fixture, engine, iterations)
+                        if log:
+                            log(key, results[key])
+
+    return results
+
+def check_budgets(results, budgets):
+    """ Descriptions of every measurement over its budget, budgets map result keys to maximum values """
+
+    violations = []
+
+    for key, budget in sorted(budgets.items()):
+        if key not in results:
+            continue
+
+        for metric, limit in sorted(budget.items()):
+            value = results[key].get(metric)
+            if value is not None and value > limit:
+                violations.append(f"{key}: {metric} {value} exceeds budget {limit}")
+
+    return violations
+
+def make_budgets(results, latencyMargin=3):
+    """ Budgets that pin the current query counts and allow latency to grow by latencyMargin """
+
+    return {
+        key: {"queries": result["queries"], "p95_ms": round(result["p95_ms"] * latencyMargin, 1)}
+        for key, result in sorted(results.items())
+    }
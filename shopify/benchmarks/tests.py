@@ -0,0 +1,89 @@
+from django.test import TestCase, TransactionTestCase
+from .concurrency import checkout_throughput, compare
+from .encoding import encoding_costs
+from .operations import OPERATIONS
+from products.models import Product
+from .runner import BenchmarkError, Fixture, run, check_budgets, make_budgets, measure, seed_carts, seed_products
+
+class BenchmarkRunnerTest(TestCase):
+    def test_run_small(self):
+        """ Every operation runs at small sizes and reports its measurements """
+
+        results = run([20], [1, 5], iterations=2)
+
+        self.assertIn("all_products_first_page[products=20]", results)
+        self.assertIn("submit_cart[products=20,items=5]", results)
+        self.assertEqual(results["all_shopping_carts[products=20,items=1]"]["queries"], results["all_shopping_carts[products=20,items=5]"]["queries"])
+
+        dbSessions = results["shopping_cart_request[products=20,items=1,sessions=db]"]["queries"]
+        cacheSessions = results["shopping_cart_request[products=20,items=1,sessions=cache]"]["queries"]
+        self.assertEqual(dbSessions - cacheSessions, 1)
+        self.assertLess(results["product_by_id_snapshot[products=20]"]["queries"], results["product_by_id[products=20]"]["queries"])
+        self.assertEqual(results["product_by_id_revalidate[products=20]"]["queries"], 0)
+        self.assertGreater(results["product_by_id_get[products=20]"]["queries"], 0)
+
+        for result in results.values():
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertGreater(result["alloc_peak_kb"], 0)
+
+    def test_add_to_cart_adds(self):
+        """ add_to_cart measures a product really being added, an add that does nothing fails the run """
+
+        fixture = Fixture()
+        seed_products(fixture, 50)
+        seed_carts(fixture, 1)
+        operation = next(operation for operation in OPERATIONS if operation.name == "add_to_cart")
+
+        self.assertGreater(measure(operation, fixture, 1)["queries"], 4)
+
+        Product.objects.filter(id=fixture.inStockProductId).update(inventory_count=0)
+        with self.assertRaises(BenchmarkError):
+            measure(operation, fixture, 1)
+
+    def test_encoding_costs(self):
+        """ Responses larger than a page are measured with every serializer and coding """
+
+        seed_products(Fixture(), 150)
+        results = encoding_costs(150, iterations=1)
+        identity = [result for result in results if result["encoding"] == "identity"]
+        gzipped = [result for result in results if result["encoding"] == "gzip"]
+
+        self.assertEqual({result["rows"] for result in results}, {150})
+        self.assertEqual(len(identity), 2)
+        self.assertEqual(identity[0]["bytes"], identity[1]["bytes"])
+        self.assertLess(gzipped[0]["bytes"], identity[0]["bytes"])
+        self.assertEqual(gzipped[0]["bytes_saved"], identity[0]["bytes"] - gzipped[0]["bytes"])
+
+    def test_budgets(self):
+        """ Results over budget are reported, results within budget aren't """
+
+        results = {"op[products=1]": {"queries": 3, "p95_ms": 2.0}}
+        budgets = make_budgets(results)
+
+        self.assertEqual(check_budgets(results, budgets), [])
+
+        results["op[products=1]"]["queries"] = 4
+        self.assertEqual(check_budgets(results, budgets), ["op[products=1]: queries 4 exceeds budget 3"])
+
+class ConcurrencyBenchmarkTest(TransactionTestCase):
+    def test_compare(self):
+        """ Both entry points serve every request to slow clients """
+
+        fixture = Fixture()
+        seed_products(fixture, 20)
+        operation = next(operation for operation in OPERATIONS if operation.name == "product_by_id")
+
+        result = compare(operation.document, operation.variables(fixture), requests=40, threads=2, delay=0.01, clients=20)
+
+        self.assertEqual(result["wsgi_served"], 40)
+        self.assertEqual(result["asgi_served"], 40)
+        self.assertEqual(result["errors"], 0)
+
+    def test_checkout_throughput(self):
+        """ Concurrent checkouts sell every unit of a sharded product exactly once """
+
+        result = checkout_throughput(shards=2, checkouts=10, threads=2)
+
+        self.assertEqual(result["failed"], 0)
+        self.assertEqual(result["stock_left"], 0)
+
@@ -0,0 +1,152 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from shopify.routers import use_primary
+from .catalog import get_version
+
+MISSING = object()
+
+class ResultCache:
+    """ Base for result cache backends """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def get_or_set(self, key, compute):
+        value = self.get(key)
+
+        if value is MISSING:
+            value = compute()
+            self.set(key, value)
+
+        return value
+
+class LRUResultCache(ResultCache):
+    """ In-process least recently used cache with a time to live """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return MISSING
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return MISSING
+
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class DjangoResultCache(ResultCache):
+    """ Cache backed by one of Django's configured caches, values must be picklable. The cache may be shared
+        with sessions and the catalog version, so entries carry a generation that clear moves past instead of
+        flushing the cache """
+
+    GENERATION_KEY = "products:generation"
+
+    def __init__(self, alias="default", ttl=300):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def generation(self):
+        generation = self.cache.get(self.GENERATION_KEY)
+
+        if generation is None:
+            # Like the catalog version, a restarted generation never repeats one that was evicted
+            self.cache.add(self.GENERATION_KEY, time.time_ns(), timeout=None)
+            generation = self.cache.get(self.GENERATION_KEY)
+
+        return generation
+
+    def make_key(self, key):
+        return f"products:{self.generation()}:" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        return self.cache.get(self.make_key(key), MISSING)
+
+    def set(self, key, value):
+        self.cache.set(self.make_key(key), value, timeout=self.ttl)
+
+    def clear(self):
+        try:
+            self.cache.incr(self.GENERATION_KEY)
+        except ValueError:
+            self.cache.add(self.GENERATION_KEY, time.time_ns(), timeout=None)
+
+_result_cache = None
+
+def get_result_cache():
+    """ Result cache backend configured by PRODUCT_RESULT_CACHE """
+
+    global _result_cache
+
+    if _result_cache is None:
+        config = getattr(settings, "PRODUCT_RESULT_CACHE", {})
+        backend = import_string(config.get("BACKEND", "products.cache.LRUResultCache"))
+        _result_cache = backend(**config.get("OPTIONS", {}))
+
+    return _result_cache
+
+def result_key(version, field, kwargs):
+    arguments = ",".join(f"{name}={kwargs[name]!r}" for name in sorted(kwargs))
+    return f"products:{version}:{field}:{arguments}"
+
+def cached_result(field, kwargs, compute):
+    """ Result of compute for a query field and its arguments at the current catalog version. compute reads
+        the primary, a lagging replica's rows would be kept under a version they predate """
+
+    def compute_on_primary():
+        with use_primary():
+            return compute()
+
+    return get_result_cache().get_or_set(result_key(get_version(), field, kwargs), compute_on_primary)
+
+def cached_results(field, argument, values, compute):
+    """ Results of a query field for every value of one argument at the current catalog version, in the
+        order of values. compute gets the values missing from the cache and returns their results keyed
+        by value, values it leaves out are cached as None. Like cached_result it reads the primary """
+
+    cache = get_result_cache()
+    version = get_version()
+    keys = {value: result_key(version, field, {argument: value}) for value in values}
+    results = {value: cache.get(key) for value, key in keys.items()}
+    missing = [value for value, result in results.items() if result is MISSING]
+
+    if missing:
+        with use_primary():
+            computed = compute(missing)
+        for value in missing:
+            results[value] = computed.get(value)
+            cache.set(keys[value], results[value])
+
+    return [results[value] for value in values]
@@ -0,0 +1,79 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_KEY = "catalog:version"
+CHANGES_KEY = "catalog:changes"
+CHANGE_PREFIX = "catalog:change:"
+
+def version_cache():
+    """ Cache holding the catalog version, must be shared by every process serving the catalog """
+
+    return caches[getattr(settings, "CATALOG_VERSION_CACHE", "default")]
+
+def get_version():
+    """ Current catalog version, anything cached against an older version is stale """
+
+    cache = version_cache()
+    version = cache.get(VERSION_KEY)
+
+    if version is None:
+        # A fresh version never repeats one that was evicted, so old entries can't come back to life
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+
+    return version
+
+def _bump():
+    cache = version_cache()
+
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+
+def get_change_count():
+    """ Number of the last logged product change, see log_changes """
+
+    cache = version_cache()
+    count = cache.get(CHANGES_KEY)
+
+    if count is None:
+        cache.add(CHANGES_KEY, time.time_ns(), timeout=None)
+        count = cache.get(CHANGES_KEY)
+
+    return count
+
+def _log(productIds):
+    cache = version_cache()
+
+    try:
+        count = cache.incr(CHANGES_KEY)
+    except ValueError:
+        # Changes before a restarted count are lost, readers rebuild whatever they copied
+        cache.add(CHANGES_KEY, time.time_ns(), timeout=None)
+        return
+
+    ttl = getattr(settings, "CATALOG_SNAPSHOT", {}).get("CHANGE_TTL", 3600)
+    cache.set(f"{CHANGE_PREFIX}{count}", productIds, timeout=ttl)
+
+def log_changes(productIds=None):
+    """ Logs that the rows of productIds changed under a new change count, for in-process copies of the
+        catalog to patch themselves. None means any product may have changed. Logs now and again on commit,
+        like bump_version, so copies that read the rows before the commit read them again """
+
+    if productIds is not None:
+        productIds = sorted(set(productIds))
+
+    _log(productIds)
+    transaction.on_commit(lambda: _log(productIds))
+
+def bump_version(productIds=None):
+    """ Invalidates everything cached against the catalog. Bumps now so this transaction reads fresh
+        results, and again on commit so results other transactions cached in between are dropped too.
+        productIds are the products that changed, None if they aren't known """
+
+    _bump()
+    transaction.on_commit(_bump)
+    log_changes(productIds)
@@ -0,0 +1,96 @@
+import csv
+import json
+from decimal import Decimal
+from itertools import islice
+from django.db import transaction
+from shopify.routers import use_primary
+from .inventory import set_shards
+from .models import Product
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ("id", "title", "price", "inventory_count")
+
+def guess_format(path, default="jsonl"):
+    """ File format from the extension of path """
+
+    for fmt in FORMATS:
+        if path.endswith("." + fmt):
+            return fmt
+
+    return default
+
+def read_records(lines, fmt):
+    """ Generates (title, price, inventory_count) for every product in a CSV or JSONL stream,
+        negative or missing price and inventory are clamped to 0 """
+
+    if fmt == "csv":
+        rows = csv.DictReader(lines)
+    else:
+        rows = (json.loads(line) for line in lines if line.strip())
+
+    for row in rows:
+        price = Decimal(str(row.get("price") or 0))
+        inventory_count = int(row.get("inventory_count") or 0)
+        yield row["title"], max(price, Decimal(0)), max(inventory_count, 0)
+
+def batched(iterable, size):
+    """ Lists of up to size items from iterable, without reading ahead of the current batch """
+
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+def upsert_batch(records):
+    """ Creates or updates one batch of products matched on title in one transaction, returns (created, updated).
+        Existing products are read from the primary, a lagging replica would have them created again """
+
+    latest = {title: (price, inventory_count) for title, price, inventory_count in records}
+
+    with use_primary(), transaction.atomic():
+        existing = Product.objects.in_bulk(list(latest), field_name="title")
+        toCreate = []
+        toUpdate = []
+        restocked = []
+
+        for title, (price, inventory_count) in latest.items():
+            product = existing.get(title)
+
+            if product is None:
+                toCreate.append(Product(title=title, price=price, inventory_count=inventory_count))
+            elif product.price != price or product.inventory_count != inventory_count:
+                if product.shard_count and product.inventory_count != inventory_count:
+                    restocked.append(product)
+
+                product.price = price
+                product.inventory_count = inventory_count
+                toUpdate.append(product)
+
+        Product.objects.bulk_create(toCreate)
+        Product.objects.bulk_update(toUpdate, ["price", "inventory_count"])
+
+        # Stock of sharded products lives in their shards, the row only holds a copy of the totals
+        for product in restocked:
+            set_shards(product.id, product.shard_count, inventory=product.inventory_count)
+
+    return len(toCreate), len(toUpdate)
+
+def write_records(output, fmt, rows):
+    """ Writes (id, title, price, inventory_count) rows to a CSV or JSONL stream, returns the row count """
+
+    count = 0
+
+    if fmt == "csv":
+        writer = csv.writer(output)
+        writer.writerow(FIELDS)
+
+    for row in rows:
+        if fmt == "csv":
+            writer.writerow(row)
+        else:
+            output.write(json.dumps(dict(zip(FIELDS, (row[0], row[1], str(row[2]), row[3])))) + "\n")
+        count = count + 1
+
+    return count
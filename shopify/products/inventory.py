@@ -0,0 +1,187 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q, Subquery, Sum
+from shopify.periodic import PeriodicTask
+from shopify.routers import use_primary
+from .catalog import bump_version
+from .models import InventoryShard, Product
+
+TOTALS_PREFIX = "inventory-totals:"
+
+def inventory_settings():
+    return getattr(settings, "INVENTORY_SHARDS", {})
+
+def spread(units, shards):
+    """ units split into shards parts that differ by at most one, larger parts first """
+
+    return [units // shards + (index < units % shards) for index in range(shards)]
+
+def set_shards(productId, shards, inventory=None):
+    """ Spreads the stock and reserved units of a product evenly over shards counters, or moves them back
+        onto the product row when shards is 0. inventory replaces the stock, reserved units above it are dropped """
+
+    with use_primary(), transaction.atomic():
+        product = Product.objects.select_for_update().get(id=productId)
+
+        if product.shard_count:
+            totals = InventoryShard.objects.filter(product_id=productId).aggregate(inventory=Sum("count"), reserved=Sum("reserved"))
+            current, reserved = totals["inventory"] or 0, totals["reserved"] or 0
+        else:
+            current, reserved = product.inventory_count, product.reserved_count
+
+        if inventory is not None:
+            current = inventory
+        reserved = min(reserved, current)
+
+        InventoryShard.objects.filter(product_id=productId).delete()
+        InventoryShard.objects.bulk_create(
+            InventoryShard(product_id=productId, index=index, count=count, reserved=held)
+            for index, (count, held) in enumerate(zip(spread(current, shards), spread(reserved, shards)))
+        )
+        Product.objects.filter(id=productId).update(shard_count=shards, inventory_count=current, reserved_count=reserved)
+
+        bump_version([productId])
+
+    forget_totals(productId)
+
+def forget_totals(productId):
+    """ Drops the cached totals of a product whose shards changed, now for the reads of this transaction and
+        again once it commits, for reads that cached the old totals meanwhile """
+
+    key = TOTALS_PREFIX + str(productId)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+def update_random_shard(productId, condition, **changes):
+    """ Applies changes to a random shard of a product among those matching condition with one conditional update.
+        Picks again when concurrent checkouts changed the shard first, returns False when no shard matches """
+
+    shards = InventoryShard.objects.filter(condition, product_id=productId)
+
+    for attempt in range(inventory_settings().get("RETRIES", 3)):
+        if shards.filter(id=Subquery(shards.order_by("?").values("id")[:1])).update(**changes):
+            return True
+
+        if not shards.exists():
+            return False
+
+    return False
+
+def hold_unit(productId):
+    """ Counts a unit of a sharded product as reserved, False when every unit in stock is reserved """
+
+    return update_random_shard(productId, Q(count__gt=F("reserved")), reserved=F("reserved") + 1)
+
+def take_unit(productId, reserved=False):
+    """ Takes a unit of a sharded product out of stock, a reserved unit or one nobody holds.
+        False when there is no such unit """
+
+    if reserved:
+        return update_random_shard(productId, Q(reserved__gt=0), count=F("count") - 1, reserved=F("reserved") - 1)
+
+    return update_random_shard(productId, Q(count__gt=F("reserved")), count=F("count") - 1)
+
+class NotEnoughUnits(Exception):
+    """ Raised to roll back the units taken so far when a sharded product runs out part way """
+
+def take_units(productId, reserved=0, free=0, hold=0):
+    """ Takes reserved and unreserved units of a sharded product out of stock and holds more for a cart, all
+        of them or none, a unit at a time. Returns False, with the shards unchanged, when a unit is missing """
+
+    try:
+        with transaction.atomic():
+            for unit in range(reserved):
+                if not take_unit(productId, reserved=True):
+                    raise NotEnoughUnits(productId)
+
+            for unit in range(free):
+                if not take_unit(productId):
+                    raise NotEnoughUnits(productId)
+
+            for unit in range(hold):
+                if not hold_unit(productId):
+                    raise NotEnoughUnits(productId)
+    except NotEnoughUnits:
+        return False
+
+    forget_totals(productId)
+    return True
+
+def release_units(productId, units):
+    """ Gives reserved units of a sharded product back to stock, returns the units released """
+
+    released = 0
+
+    while released < units:
+        shards = list(InventoryShard.objects.filter(product_id=productId, reserved__gt=0).order_by("?").values_list("id", "reserved"))
+
+        if not shards:
+            break
+
+        for shardId, reserved in shards:
+            count = min(units - released, reserved)
+
+            if InventoryShard.objects.filter(id=shardId, reserved__gte=count).update(reserved=F("reserved") - count):
+                released = released + count
+            if released == units:
+                break
+
+    if released:
+        forget_totals(productId)
+
+    return released
+
+def shard_totals(productIds):
+    """ (inventory, reserved) of sharded products summed over their shards, keyed on product id. Sums are cached
+        for TOTAL_TTL seconds so reading the stock of a hot product doesn't scan its shards on every request,
+        they are summed on the primary and dropped whenever units are taken, held or released """
+
+    keys = {TOTALS_PREFIX + str(productId): productId for productId in productIds}
+    totals = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+    missing = [productId for productId in productIds if productId not in totals]
+
+    if missing:
+        computed = {productId: (0, 0) for productId in missing}
+        rows = (
+            InventoryShard.objects.filter(product_id__in=missing).values("product_id")
+            .annotate(inventory=Sum("count"), reserved=Sum("reserved")).order_by()
+        )
+        with use_primary():
+            computed.update({row["product_id"]: (row["inventory"], row["reserved"]) for row in rows})
+
+        cache.set_many({TOTALS_PREFIX + str(productId): value for productId, value in computed.items()}, timeout=inventory_settings().get("TOTAL_TTL", 2))
+        totals.update(computed)
+
+    return totals
+
+def sync_totals():
+    """ Copies the shard totals of every sharded product onto its row, so listings that filter or order
+        on inventory see them. Returns the number of products whose counts changed """
+
+    with use_primary():
+        rows = InventoryShard.objects.values("product_id").annotate(inventory=Sum("count"), reserved=Sum("reserved")).order_by()
+        totals = {row["product_id"]: (row["inventory"], row["reserved"]) for row in rows}
+        current = Product.objects.filter(shard_count__gt=0).values_list("id", "inventory_count", "reserved_count")
+
+        changed = [
+            Product(id=productId, inventory_count=totals[productId][0], reserved_count=totals[productId][1])
+            for productId, inventory, reserved in current
+            if productId in totals and totals[productId] != (inventory, reserved)
+        ]
+
+        if changed:
+            Product.objects.filter(shard_count__gt=0).bulk_update(changed, ["inventory_count", "reserved_count"])
+            bump_version([product.id for product in changed])
+
+    return len(changed)
+
+def start_inventory_sync():
+    """ Syncs the counts of sharded products onto their rows every INVENTORY_SHARDS['SYNC_INTERVAL'] seconds in this process """
+
+    interval = inventory_settings().get("SYNC_INTERVAL")
+
+    if not interval:
+        return None
+
+    return PeriodicTask(sync_totals, interval, name="inventory-sync", runOnStop=False).start()
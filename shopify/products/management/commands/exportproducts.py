@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand
+from products.catalog_files import FIELDS, FORMATS, guess_format, write_records
+from products.models import Product
+
+class Command(BaseCommand):
+    """ Streams every product in the db to a CSV or JSONL file """
+
+    help = "Exports products to CSV or JSONL, reading the table in chunks so memory use stays flat"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to write, - for stdout")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension, or jsonl")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched from the db at a time")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or guess_format(path)
+        start = time.perf_counter()
+
+        rows = Product.objects.order_by("id").values_list(*FIELDS).iterator(chunk_size=options["chunk_size"])
+        output = self.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+
+        try:
+            count = write_records(output, fmt, rows)
+        finally:
+            if output is not self.stdout:
+                output.close()
+
+        if output is not self.stdout:
+            self.stdout.write(f"Exported {count} products in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,41 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from products.catalog import bump_version
+from products.catalog_files import FORMATS, batched, guess_format, read_records, upsert_batch
+
+class Command(BaseCommand):
+    """ Streams products from a CSV or JSONL file into the db, matching existing products on title """
+
+    help = "Imports products from CSV or JSONL in fixed size batches, updating products whose title already exists"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, - for stdin")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension, or jsonl")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Products per insert and transaction")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or guess_format(path)
+        start = time.perf_counter()
+        created = 0
+        updated = 0
+
+        source = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+
+        try:
+            for batch in batched(read_records(source, fmt), options["batch_size"]):
+                batchCreated, batchUpdated = upsert_batch(batch)
+                created = created + batchCreated
+                updated = updated + batchUpdated
+        except (KeyError, ValueError, ArithmeticError) as e:
+            raise CommandError(f"Invalid product record after {created + updated} imported: {e!r}")
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if created or updated:
+                bump_version()
+
+        elapsed = time.perf_counter() - start
+        rate = (created + updated) / elapsed if elapsed else 0
+        self.stdout.write(f"Created {created} and updated {updated} products in {elapsed:.1f}s ({rate:.0f} products/s)")
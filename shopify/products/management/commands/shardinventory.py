@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.inventory import set_shards
+from products.models import Product
+
+class Command(BaseCommand):
+    """ Spreads the stock of hot products over counter shards, or counts it on the product row again """
+
+    help = "Moves the stock of products into SHARDS counter rows so concurrent checkouts don't wait on one row, 0 moves it back"
+
+    def add_arguments(self, parser):
+        parser.add_argument("shards", type=int, help="Number of shards, 0 to unshard")
+        parser.add_argument("ids", type=int, nargs="+", help="Ids of the products")
+
+    def handle(self, *args, **options):
+        shards = options["shards"]
+
+        if not 0 <= shards <= 1000:
+            raise CommandError("The number of shards must be between 0 and 1000")
+
+        for productId in options["ids"]:
+            try:
+                set_shards(productId, shards)
+            except Product.DoesNotExist:
+                raise CommandError(f"No product with id {productId}")
+
+            if shards:
+                self.stdout.write(f"Spread the stock of product {productId} over {shards} shards")
+            else:
+                self.stdout.write(f"Moved the stock of product {productId} back onto its row")
@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:46
+
+from django.db import migrations, models
+from products.search import create_search_triggers
+
+
+def recreate_search_triggers(apps, schema_editor):
+    # SQLite adds the column by rebuilding products_product, which drops the search index triggers
+    create_search_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reserved_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(recreate_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.28 on 2026-10-18 13:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+from products.search import create_search_triggers
+
+
+def recreate_search_triggers(apps, schema_editor):
+    # SQLite adds the column by rebuilding products_product, which drops the search index triggers
+    create_search_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_reserved_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='InventoryShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('reserved', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='products.Product')),
+            ],
+            options={
+                'unique_together': {('product', 'index')},
+            },
+        ),
+        migrations.RunPython(recreate_search_triggers, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .catalog import bump_version
 
 class Product(models.Model):
     """ Product entity """
@@ -7,6 +10,36 @@ class Product(models.Model):
     title = models.TextField(unique=True)
     price = models.DecimalField(decimal_places=2, max_digits=10)
     inventory_count = models.IntegerField()
+    # Units held by cart reservations, available stock is inventory_count - reserved_count
+    reserved_count = models.IntegerField(default=0)
+    # Number of InventoryShard rows this product's stock is spread across, 0 when it is counted on this row.
+    # The counts on a sharded product's row are a copy of the shard totals refreshed by products.inventory.sync_totals
+    shard_count = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["price", "id"], name="product_price_idx"),
+            models.Index(fields=["inventory_count", "id"], name="product_inventory_idx"),
+        ]
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+class InventoryShard(models.Model):
+    """ One of the counters the stock of a hot product is spread across. Checkouts take a unit from a random
+        shard instead of the product row, so concurrent checkouts of the product don't wait on a single row lock """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="shards")
+    index = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [("product", "index")]
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def productChanged(sender, instance, **kwargs):
+    """ Any saved or deleted product invalidates cached catalog results """
+
+    bump_version([instance.id])
@@ -1,20 +1,120 @@
 import sys
+from decimal import Decimal
 import graphene
 from graphql import GraphQLError
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from graphene_django import DjangoObjectType
+from promise import Promise
+from promise.dataloader import DataLoader
+from shopify.loaders import get_loader
+from shopify.pagination import connection_field, fetch_page, build_connection, page_size
+from .cache import cached_result, cached_results
+from .catalog import bump_version
+from .inventory import shard_totals
 from .models import Product
+from .search import RANK_FIELD, search_products
+from .snapshot import ProductRecord, get_snapshot
+
+class ShardTotalsLoader(DataLoader):
+    """ Loads the cached (inventory, reserved) totals of a batch of sharded products, keyed on product id """
+
+    def batch_load_fn(self, keys):
+        totals = shard_totals(keys)
+        return Promise.resolve([totals[key] for key in keys])
+
+class StockLoader(DataLoader):
+    """ Loads the current (inventory, reserved) counts of a batch of unsharded products, keyed on product id """
+
+    def batch_load_fn(self, keys):
+        stock = {productId: (inventory, reserved) for productId, inventory, reserved in
+                 Product.objects.filter(id__in=keys).values_list("id", "inventory_count", "reserved_count")}
+        return Promise.resolve([stock.get(key, (0, 0)) for key in keys])
+
+def load_products(field, keys):
+    """ Products whose field, id or title, is each of keys, None for missing products. Read from the catalog
+        snapshot when it is enabled, else from the result cache and one query for the keys it misses """
+
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.get_many(field, keys)
+
+    return cached_results("product", field, keys, lambda missing: Product.objects.in_bulk(missing, field_name=field))
+
+class ProductByIdLoader(DataLoader):
+    """ Loads the products of a batch of ids, None for ids without a product """
+
+    def batch_load_fn(self, keys):
+        return Promise.resolve(load_products("id", keys))
+
+class ProductByTitleLoader(DataLoader):
+    """ Loads the products of a batch of titles, None for titles without a product """
+
+    def batch_load_fn(self, keys):
+        return Promise.resolve(load_products("title", keys))
+
+def product_or_error(product):
+    """ Fails a product query that found nothing, like Product.objects.get """
+
+    if product is None:
+        raise Product.DoesNotExist("Product matching query does not exist.")
+
+    return product
 
 class ProductType(DjangoObjectType):
+    """ Stock of sharded products is read from the cached sum of their shards, of others from the product row.
+        Holds don't move the catalog version, so availableCount isn't taken from cached rows but read for
+        every query. Resolves Product instances and the records of the catalog snapshot """
+
+    available_count = graphene.Int(description="Units in stock that no cart holds a reservation for")
+
     class Meta:
         model = Product
+        exclude_fields = ("cart_lines",)
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        return isinstance(root, ProductRecord) or super().is_type_of(root, info)
+
+    def resolve_inventory_count(self, info, **kwargs):
+        if self.shard_count:
+            return get_loader(info, ShardTotalsLoader).load(self.id).then(lambda totals: totals[0])
+
+        return self.inventory_count
+
+    def resolve_available_count(self, info, **kwargs):
+        if self.shard_count:
+            return get_loader(info, ShardTotalsLoader).load(self.id).then(lambda totals: max(totals[0] - totals[1], 0))
+
+        return get_loader(info, StockLoader).load(self.id).then(lambda stock: max(stock[0] - stock[1], 0))
+
+class ProductConnection(graphene.relay.Connection):
+    class Meta:
+        node = ProductType
+
+class ProductOrder(graphene.Enum):
+    """ Orderings for product listings, ties are broken by id """
+
+    ID = "id"
+    PRICE_ASC = "price"
+    PRICE_DESC = "-price"
+    INVENTORY_ASC = "inventory_count"
+    INVENTORY_DESC = "-inventory_count"
 
 #Queries
 class Query(graphene.ObjectType):
     """ All Queries declared in Products API """
 
     product = graphene.Field(ProductType, id=graphene.Int(), title=graphene.String())
-    all_products = graphene.List(ProductType, inventory_count_gt=graphene.Int())
+    products = graphene.List(ProductType, ids=graphene.List(graphene.NonNull(graphene.Int)), titles=graphene.List(graphene.NonNull(graphene.String)))
+    all_products = connection_field(
+        ProductConnection,
+        inventory_count_gt=graphene.Int(),
+        in_stock=graphene.Boolean(),
+        min_price=graphene.Float(),
+        max_price=graphene.Float(),
+        order_by=ProductOrder(),
+    )
+    search_products = connection_field(ProductConnection, query=graphene.String(required=True))
 
     def resolve_product(self, info, **kwargs):
         """ Query for getting product by id, id takes precedence over title """
@@ -23,22 +123,89 @@ class Query(graphene.ObjectType):
         title = kwargs.get('title')
 
         if id is not None:
-            return Product.objects.get(id=id)
+            return get_loader(info, ProductByIdLoader).load(id).then(product_or_error)
         
         if title is not None:
-            return Product.objects.get(title=title)
+            return get_loader(info, ProductByTitleLoader).load(title).then(product_or_error)
+
+    def resolve_products(self, info, **kwargs):
+        """ Query for products by ids and titles, results follow the ids and then the titles in request order
+            with nulls for the ones without a product. Keys of the whole document are fetched together """
+
+        ids = kwargs.get('ids') or []
+        titles = kwargs.get('titles') or []
+        page_size(len(ids) + len(titles))
+
+        return Promise.all([
+            get_loader(info, ProductByIdLoader).load_many(ids),
+            get_loader(info, ProductByTitleLoader).load_many(titles),
+        ]).then(lambda found: found[0] + found[1])
 
     def resolve_all_products(self, info, **kwargs):
-        """ Query for getting all products in db, optional argument for product inventories greater than x """
+        """ Query for paging through all products in db, optional arguments for product inventories greater than x,
+            products in stock, a price range and the ordering """
 
         inventory_gt = kwargs.get('inventory_count_gt')
+        min_price = kwargs.get('min_price')
+        max_price = kwargs.get('max_price')
+        order_by = kwargs.get('order_by') or ProductOrder.ID.value
+        products = Product.objects.all()
         
         if inventory_gt is not None:
-            return Product.objects.all().filter(inventory_count__gt=inventory_gt)
+            products = products.filter(inventory_count__gt=inventory_gt)
+
+        if kwargs.get('in_stock'):
+            products = products.filter(inventory_count__gt=0)
+
+        if min_price is not None:
+            products = products.filter(price__gte=Decimal(str(min_price)))
+
+        if max_price is not None:
+            products = products.filter(price__lte=Decimal(str(max_price)))
+
+        orderField = order_by.lstrip('-') if order_by != ProductOrder.ID.value else None
+        descending = order_by.startswith('-')
+        first = kwargs.get('first')
+        after = kwargs.get('after')
+        snapshot = get_snapshot()
 
-        return Product.objects.all()
+        if snapshot is not None:
+            if kwargs.get('in_stock'):
+                inventory_gt = 0 if inventory_gt is None else max(inventory_gt, 0)
+
+            rows, hasNextPage = snapshot.page(
+                first, after, orderField, descending, inventory_gt,
+                None if min_price is None else Decimal(str(min_price)),
+                None if max_price is None else Decimal(str(max_price)),
+            )
+            return build_connection(ProductConnection, rows, hasNextPage, after, orderField)
+
+        rows, hasNextPage = cached_result("allProducts", kwargs, lambda: fetch_page(products, first, after, orderField, descending))
+        return build_connection(ProductConnection, rows, hasNextPage, after, orderField)
+
+    def resolve_search_products(self, info, **kwargs):
+        """ Query for products whose title has every word of the query as a prefix of one of its words,
+            case insensitive, best matches first """
+
+        query = kwargs.get('query')
+        first = kwargs.get('first')
+        after = kwargs.get('after')
+
+        rows, hasNextPage = cached_result("searchProducts", kwargs, lambda: search_products(query, first, after))
+        return build_connection(ProductConnection, rows, hasNextPage, after, RANK_FIELD)
 
 #Mutations
+def new_product(title, price, inventory_count):
+    """ Unsaved product, negative or missing price and inventory are clamped to 0 """
+
+    if inventory_count is None or inventory_count < 0:
+        inventory_count = 0
+
+    if price is None or price < 0:
+        price = 0.00
+
+    return Product(title=title, price=price, inventory_count=inventory_count)
+
 class CreateProduct(graphene.Mutation):
     """ Creates a product in db """
 
@@ -53,15 +220,9 @@ class CreateProduct(graphene.Mutation):
         title = kwargs.get('title')
         price = kwargs.get('price')
         inventory_count = kwargs.get('inventory_count')
-
-        if inventory_count is None or inventory_count < 0:
-            inventory_count = 0
-
-        if price is None or price < 0:
-            price = 0.00
         
         try:
-            product = Product(title=title, price=price, inventory_count=inventory_count)
+            product = new_product(title, price, inventory_count)
             product.save()
             return CreateProduct(product=product)
         except IntegrityError as e:
@@ -70,6 +231,83 @@ class CreateProduct(graphene.Mutation):
      
         return CreateProduct(product=None)
         
+class ProductInput(graphene.InputObjectType):
+    """ Fields of a product to create """
+
+    title = graphene.String(required=True)
+    price = graphene.Float(required=True)
+    inventory_count = graphene.Int(required=False)
+
+class ProductError(graphene.ObjectType):
+    """ Why a product of a bulk create wasn't created, index is its position in the input """
+
+    index = graphene.Int()
+    title = graphene.String()
+    message = graphene.String()
+
+class CreateProducts(graphene.Mutation):
+    """ Creates many products in db with bulk inserts, one transaction per batch. Products that can't be
+        created are reported in errors without stopping the rest """
+
+    BATCH_SIZE = 500
+
+    products = graphene.List(ProductType)
+    errors = graphene.List(ProductError)
+
+    class Arguments:
+        products = graphene.List(graphene.NonNull(ProductInput), required=True)
+
+    def mutate(self, info, **kwargs):
+        inputs = list(enumerate(kwargs.get('products')))
+        created = []
+        errors = []
+
+        for start in range(0, len(inputs), CreateProducts.BATCH_SIZE):
+            batch = inputs[start:start + CreateProducts.BATCH_SIZE]
+            batchCreated, batchErrors = CreateProducts.create_batch(batch)
+            created = created + batchCreated
+            errors = errors + batchErrors
+
+        if created:
+            bump_version([product.id for product in created])
+
+        return CreateProducts(products=created, errors=errors)
+
+    @staticmethod
+    def create_batch(batch):
+        """ Inserts one batch, returns the created products in input order and the errors """
+
+        titles = [item.title for index, item in batch]
+        existing = set(Product.objects.filter(title__in=titles).values_list('title', flat=True))
+        seen = set()
+        toCreate = []
+        errors = []
+
+        for index, item in batch:
+            if item.title in existing or item.title in seen:
+                errors.append(ProductError(index=index, title=item.title, message=f"Product with title {item.title} already exists"))
+            else:
+                seen.add(item.title)
+                toCreate.append((index, new_product(item.title, item.price, item.inventory_count)))
+
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create([product for index, product in toCreate])
+        except IntegrityError:
+            # A concurrent insert took one of the titles, insert one by one to find it
+            remaining = []
+            for index, product in toCreate:
+                try:
+                    with transaction.atomic():
+                        product.save()
+                    remaining.append((index, product))
+                except IntegrityError as e:
+                    errors.append(ProductError(index=index, title=product.title, message=e.args[0]))
+            toCreate = remaining
+
+        saved = Product.objects.in_bulk([product.title for index, product in toCreate], field_name='title')
+        return [saved[product.title] for index, product in toCreate], sorted(errors, key=lambda error: error.index)
+
 class DeleteProduct(graphene.Mutation):
     """ Delete product from db by id """
 
@@ -96,5 +334,6 @@ class Mutation(graphene.ObjectType):
     """ All Mutations declared in Products API """
     
     create_product = CreateProduct.Field()       
+    create_products = CreateProducts.Field()
     delete_product = DeleteProduct.Field() 
 
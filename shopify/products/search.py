@@ -0,0 +1,142 @@
+import re
+from django.db import connections, router
+from django.db.models import FloatField, Value
+from shopify.pagination import fetch_page, from_cursor, page_size
+from .models import Product
+
+SEARCH_TABLE = "products_product_search"
+RANK_FIELD = "rank"
+
+SQLITE_TRIGGERS = [
+    f"""CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, title) VALUES (new.id, new.title);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_delete AFTER DELETE ON products_product BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    f"""CREATE TRIGGER {SEARCH_TABLE}_update AFTER UPDATE OF title ON products_product BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO {SEARCH_TABLE}(rowid, title) VALUES (new.id, new.title);
+    END""",
+]
+
+def create_search_index(schema_editor):
+    """ Full text index over product titles, kept in sync with products_product by triggers. SQLite gets an
+        FTS5 table with prefix indexes, Postgres a tsvector column with a GIN index, other databases nothing """
+
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(title, content='products_product', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        create_search_triggers(schema_editor)
+        schema_editor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+    elif vendor == "postgresql":
+        schema_editor.execute("ALTER TABLE products_product ADD COLUMN search_vector tsvector")
+        schema_editor.execute("UPDATE products_product SET search_vector = to_tsvector('simple', title)")
+        schema_editor.execute(f"CREATE INDEX {SEARCH_TABLE}_idx ON products_product USING GIN (search_vector)")
+        schema_editor.execute(
+            f"CREATE TRIGGER {SEARCH_TABLE}_update BEFORE INSERT OR UPDATE OF title ON products_product "
+            f"FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.simple', title)"
+        )
+
+def create_search_triggers(schema_editor):
+    """ (Re)creates the SQLite triggers, needed after a migration rebuilds products_product as SQLite drops its triggers """
+
+    if schema_editor.connection.vendor == "sqlite":
+        for trigger in SQLITE_TRIGGERS:
+            schema_editor.execute(trigger.replace("CREATE TRIGGER", "CREATE TRIGGER IF NOT EXISTS", 1))
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "sqlite":
+        for name in ("insert", "delete", "update"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{name}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    elif vendor == "postgresql":
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update ON products_product")
+        schema_editor.execute("ALTER TABLE products_product DROP COLUMN IF EXISTS search_vector")
+
+def search_terms(query):
+    """ Lower case words of a search query, punctuation and operators are dropped """
+
+    return re.findall(r"\w+", query.lower())
+
+def ranked_sql(vendor, terms, limit, cursor=None):
+    """ SQL selecting (id, rank) of the limit best products matching every term, the last one as a prefix
+        since it may still be being typed, after the (rank, id) cursor when given. Lower ranks are better.
+        Matches are ranked by the full text index before the limit applies. None if the database has
+        no full text index """
+
+    if vendor == "sqlite":
+        match = " ".join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+        sql = f"SELECT rowid AS id, rank FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+        params = [match]
+        keyset = " AND (rank > %s OR (rank = %s AND rowid > %s))"
+        order = " ORDER BY rank, rowid LIMIT %s"
+
+    elif vendor == "postgresql":
+        tsquery = " & ".join(terms[:-1] + [f"{terms[-1]}:*"])
+        sql = (
+            "SELECT id, rank FROM (SELECT id, -ts_rank(search_vector, to_tsquery('simple', %s))::float8 AS rank "
+            "FROM products_product WHERE search_vector @@ to_tsquery('simple', %s)) AS matches WHERE true"
+        )
+        params = [tsquery, tsquery]
+        keyset = " AND (rank > %s OR (rank = %s AND id > %s))"
+        order = " ORDER BY rank, id LIMIT %s"
+
+    else:
+        return None
+
+    if cursor is not None:
+        pk, rank = cursor
+        sql = sql + keyset
+        params = params + [rank, rank, pk]
+
+    return sql + order, params + [limit]
+
+def search_products(query, first=None, after=None):
+    """ Page of products whose title has every word of query, the last one as a prefix, case insensitive,
+        best matches first. Returns (products, hasNextPage), each product has its rank for the cursor """
+
+    first = page_size(first)
+    terms = search_terms(query)
+
+    if not terms or first == 0:
+        return [], False
+
+    alias = router.db_for_read(Product)
+    connection = connections[alias]
+    cursor = None
+
+    if after is not None:
+        pk, rank = from_cursor(after, RANK_FIELD)
+        cursor = (pk, float(rank))
+
+    ranked = ranked_sql(connection.vendor, terms, first + 1, cursor)
+
+    if ranked is None:
+        products = Product.objects.using(alias).annotate(**{RANK_FIELD: Value(0.0, output_field=FloatField())})
+        for term in terms:
+            products = products.filter(title__icontains=term)
+        return fetch_page(products, first, after, RANK_FIELD)
+
+    with connection.cursor() as dbCursor:
+        dbCursor.execute(*ranked)
+        matches = dbCursor.fetchall()
+
+    products = Product.objects.using(alias).in_bulk([id for id, rank in matches[:first]])
+    rows = []
+
+    for id, rank in matches[:first]:
+        if id in products:
+            product = products[id]
+            setattr(product, RANK_FIELD, rank)
+            rows.append(product)
+
+    return rows, len(matches) > first
@@ -0,0 +1,282 @@
+import threading
+from decimal import Decimal
+from operator import attrgetter
+from django.conf import settings
+from django.db import transaction
+from graphql import GraphQLError
+from shopify.pagination import from_cursor, page_size
+from shopify.routers import use_primary
+from .catalog import CHANGE_PREFIX, get_change_count, version_cache
+from .models import Product
+
+FIELDS = ("id", "title", "price", "inventory_count", "reserved_count", "shard_count")
+# Fields the snapshot keeps sorted, records are ordered on the field and then on id
+INDEXED_FIELDS = ("price", "inventory_count")
+PATCH_BATCH_SIZE = 500
+LAST = float("inf")
+
+class ProductRecord:
+    """ Read only copy of a product row. Slots instead of an instance dict and model state make it
+        a fraction of the size of a Product instance, changes replace the record instead of mutating it """
+
+    __slots__ = FIELDS
+
+    def __init__(self, id, title, price, inventory_count, reserved_count, shard_count):
+        self.id = id
+        self.title = title
+        self.price = price
+        self.inventory_count = inventory_count
+        self.reserved_count = reserved_count
+        self.shard_count = shard_count
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __repr__(self):
+        return f"ProductRecord({self.id}, {self.title!r})"
+
+def sort_key(orderField=None):
+    """ Key records are sorted on for an ordering field, id alone when there is none """
+
+    if orderField is None:
+        return attrgetter("id")
+
+    return attrgetter(orderField, "id")
+
+def find(index, key, sortKey, after=False):
+    """ Position of the first record of index, a list sorted on sortKey, whose sort key isn't below key,
+        or is above key with after """
+
+    lo, hi = 0, len(index)
+
+    while lo < hi:
+        mid = (lo + hi) // 2
+        value = sortKey(index[mid])
+        if value < key or after and value == key:
+            lo = mid + 1
+        else:
+            hi = mid
+
+    return lo
+
+class CatalogSnapshot:
+    """ Copy of every product in this process, indexed on id, title and the fields listings filter and
+        order on. Reads bring it up to the change count logged by products.catalog.log_changes, patching
+        the products that changed since, or rebuilding it when the changes can't be found in the log.
+        Records and indexes are only touched with the lock held """
+
+    def __init__(self, maxPatch=1000):
+        self.maxPatch = maxPatch
+        self.lock = threading.Lock()
+        self.count = None
+        self.byId = {}
+        self.byTitle = {}
+        self.indexes = {field: [] for field in (None,) + INDEXED_FIELDS}
+        self.prices = {}
+        # Products read inside a transaction that may roll back, and whether the whole catalog was
+        self.unsettled = set()
+        self.unsettledAll = False
+
+    def make_record(self, row):
+        # Products share a few thousand distinct prices, keep one Decimal for each
+        record = ProductRecord(*row)
+        record.price = self.prices.setdefault(record.price, record.price)
+        return record
+
+    def rebuild(self):
+        """ Copies every product row, in id order so the id index is built without sorting """
+
+        self.prices = {}
+        with use_primary():
+            records = [self.make_record(row) for row in Product.objects.order_by("id").values_list(*FIELDS).iterator()]
+
+        self.byId = {record.id: record for record in records}
+        self.byTitle = {record.title: record for record in records}
+        self.indexes = {None: records}
+        for field in INDEXED_FIELDS:
+            self.indexes[field] = sorted(records, key=sort_key(field))
+
+    def remove(self, record):
+        del self.byId[record.id]
+        if self.byTitle.get(record.title) is record:
+            del self.byTitle[record.title]
+
+        for field, index in self.indexes.items():
+            position = find(index, sort_key(field)(record), sort_key(field))
+            del index[position]
+
+    def add(self, record):
+        self.byId[record.id] = record
+        self.byTitle[record.title] = record
+
+        for field, index in self.indexes.items():
+            index.insert(find(index, sort_key(field)(record), sort_key(field)), record)
+
+    def patch(self, productIds):
+        """ Reads the rows of productIds again, products that are gone are dropped """
+
+        productIds = sorted(productIds)
+
+        for start in range(0, len(productIds), PATCH_BATCH_SIZE):
+            batch = productIds[start:start + PATCH_BATCH_SIZE]
+
+            with use_primary():
+                rows = {row[0]: row for row in Product.objects.filter(id__in=batch).values_list(*FIELDS)}
+
+            for productId in batch:
+                if productId in self.byId:
+                    self.remove(self.byId[productId])
+                if productId in rows:
+                    self.add(self.make_record(rows[productId]))
+
+    def catch_up(self, count):
+        """ Applies the changes logged up to count, rebuilds when the log misses one of them.
+            Returns the ids of the products read again, None after a rebuild """
+
+        if self.count is None or count - self.count > self.maxPatch:
+            self.rebuild()
+            return None
+
+        keys = [f"{CHANGE_PREFIX}{number}" for number in range(self.count + 1, count + 1)]
+        changes = version_cache().get_many(keys)
+
+        if len(changes) < len(keys) or any(productIds is None for productIds in changes.values()):
+            self.rebuild()
+            return None
+
+        productIds = set().union(*changes.values())
+        self.patch(productIds)
+        return productIds
+
+    def refresh(self):
+        """ Brings the copy up to the current change count, call with the lock held. Rows read inside a
+            transaction can be rolled back without a logged change, the first refresh outside of one
+            reads them again """
+
+        count = get_change_count()
+        inTransaction = transaction.get_connection().in_atomic_block
+
+        if not inTransaction and self.unsettledAll:
+            self.count = None
+        elif not inTransaction and self.unsettled:
+            self.patch(self.unsettled)
+        if not inTransaction:
+            self.unsettled, self.unsettledAll = set(), False
+
+        if self.count is None or count > self.count:
+            productIds = self.catch_up(count)
+            self.count = count
+
+            if inTransaction and productIds is None:
+                self.unsettledAll = True
+            elif inTransaction:
+                self.unsettled.update(productIds)
+
+    def clear(self):
+        """ Drops the copy, the next read copies the catalog again """
+
+        with self.lock:
+            self.count = None
+            self.unsettled, self.unsettledAll = set(), False
+
+    def get_many(self, field, keys):
+        """ Records of the products whose field, id or title, is each of keys, None for missing products """
+
+        with self.lock:
+            self.refresh()
+            index = self.byId if field == "id" else self.byTitle
+            return [index.get(key) for key in keys]
+
+    def page(self, first=None, after=None, orderField=None, descending=False, inventoryGt=None, minPrice=None, maxPrice=None):
+        """ Records after the after cursor and whether there are more, ordered and paged like
+            pagination.fetch_page over the products with inventory above inventoryGt and a price
+            between minPrice and maxPrice """
+
+        first = page_size(first)
+        sortKey = sort_key(orderField)
+        afterKey = None
+
+        if after is not None:
+            pk, value = from_cursor(after, orderField)
+
+            try:
+                afterKey = pk if orderField is None else (Decimal(value) if orderField == "price" else int(value), pk)
+            except (ArithmeticError, ValueError):
+                raise GraphQLError(message=f"Invalid cursor {after}")
+
+        bounds = {"inventory_count": (None if inventoryGt is None else (inventoryGt, LAST), None), "price": (minPrice, maxPrice)}
+
+        with self.lock:
+            self.refresh()
+            index = self.indexes[orderField]
+
+            # A filter on another field that keeps few products is cheaper to read from that field's index
+            for field, (low, high) in bounds.items():
+                if field == orderField or (low is None and high is None):
+                    continue
+
+                fieldIndex = self.indexes[field]
+                start, stop = self.span(fieldIndex, field, low, high)
+                if (stop - start) ** 2 < (first + 1) * len(fieldIndex) and stop - start < len(index):
+                    index = sorted(fieldIndex[start:stop], key=sortKey)
+
+            start, stop = 0, len(index)
+            if orderField is not None:
+                start, stop = self.span(index, orderField, *bounds[orderField])
+
+            if afterKey is not None:
+                if descending:
+                    stop = min(stop, find(index, afterKey, sortKey))
+                else:
+                    start = max(start, find(index, afterKey, sortKey, after=True))
+
+            positions = range(stop - 1, start - 1, -1) if descending else range(start, stop)
+            rows = []
+
+            for position in positions:
+                record = index[position]
+
+                if inventoryGt is not None and record.inventory_count <= inventoryGt:
+                    continue
+                if minPrice is not None and record.price < minPrice:
+                    continue
+                if maxPrice is not None and record.price > maxPrice:
+                    continue
+
+                rows.append(record)
+                if len(rows) > first:
+                    break
+
+        return rows[:first], len(rows) > first
+
+    def span(self, index, field, low=None, high=None):
+        """ Positions of the records of an index sorted on field with low <= value <= high, a (value, LAST)
+            low keeps the values above value """
+
+        sortKey = sort_key(field)
+        start = 0 if low is None else find(index, low if isinstance(low, tuple) else (low,), sortKey)
+        stop = len(index) if high is None else find(index, (high, LAST), sortKey)
+
+        return start, stop
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def snapshot_settings():
+    return getattr(settings, "CATALOG_SNAPSHOT", {})
+
+def get_snapshot():
+    """ The catalog snapshot of this process, None unless CATALOG_SNAPSHOT['ENABLED'] """
+
+    global _snapshot
+
+    config = snapshot_settings()
+    if not config.get("ENABLED"):
+        return None
+
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = CatalogSnapshot(maxPatch=config.get("MAX_PATCH", 1000))
+
+    return _snapshot
@@ -1,7 +1,17 @@
 import json
+import os
+import tempfile
 from collections import OrderedDict
-from django.test import TestCase
-from .models import Product
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache as defaultCache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from .cache import get_result_cache, DjangoResultCache, LRUResultCache
+from .catalog import get_version, log_changes
+from .models import InventoryShard, Product
+from .snapshot import get_snapshot
 from shopify.schema import schema
 
 class ProductQueryTest(TestCase):
@@ -19,42 +29,58 @@ class ProductQueryTest(TestCase):
             {
                 allProducts
                 {
-                    id
-                    title
-                    price
-                    inventoryCount
+                    edges
+                    {
+                        node
+                        {
+                            id
+                            title
+                            price
+                            inventoryCount
+                        }
+                    }
                 }
             }
         """
         expected_result = """
             {
                 "data": {
-                    "allProducts": [
-                        {
-                            "id": "1",
-                            "title": "FIFA 19",
-                            "price": 29.99,
-                            "inventoryCount": 5
-                        },
-                        {
-                            "id": "2",
-                            "title": "Fallout 4",
-                            "price": 39.99,
-                            "inventoryCount": 5
-                        },
-                        {
-                            "id": "3",
-                            "title": "Star Wars Battlefront ||",
-                            "price": 19.99,
-                            "inventoryCount": 5
-                        },
-                        {
-                            "id": "4",
-                            "title": "Gears of War 3",
-                            "price": 9.99,
-                            "inventoryCount": 0
-                        }
-                    ]
+                    "allProducts": {
+                        "edges": [
+                            {
+                                "node": {
+                                    "id": "1",
+                                    "title": "FIFA 19",
+                                    "price": 29.99,
+                                    "inventoryCount": 5
+                                }
+                            },
+                            {
+                                "node": {
+                                    "id": "2",
+                                    "title": "Fallout 4",
+                                    "price": 39.99,
+                                    "inventoryCount": 5
+                                }
+                            },
+                            {
+                                "node": {
+                                    "id": "3",
+                                    "title": "Star Wars Battlefront ||",
+                                    "price": 19.99,
+                                    "inventoryCount": 5
+                                }
+                            },
+                            {
+                                "node": {
+                                    "id": "4",
+                                    "title": "Gears of War 3",
+                                    "price": 9.99,
+                                    "inventoryCount": 0
+                                }
+                            }
+                        ]
+                    }
                 }
             }
         """
@@ -73,36 +99,50 @@ class ProductQueryTest(TestCase):
             {
                 allProducts(inventoryCountGt: 0)
                 {
-                    id
-                    title
-                    price
-                    inventoryCount
+                    edges
+                    {
+                        node
+                        {
+                            id
+                            title
+                            price
+                            inventoryCount
+                        }
+                    }
                 }
             }
         """
         expected_result = """
             {
                 "data": {
-                    "allProducts": [
-                        {
-                            "id": "1",
-                            "title": "FIFA 19",
-                            "price": 29.99,
-                            "inventoryCount": 5
-                        },
-                        {
-                            "id": "2",
-                            "title": "Fallout 4",
-                            "price": 39.99,
-                            "inventoryCount": 5
-                        },
-                        {
-                            "id": "3",
-                            "title": "Star Wars Battlefront ||",
-                            "price": 19.99,
-                            "inventoryCount": 5
-                        }
-                    ]
+                    "allProducts": {
+                        "edges": [
+                            {
+                                "node": {
+                                    "id": "1",
+                                    "title": "FIFA 19",
+                                    "price": 29.99,
+                                    "inventoryCount": 5
+                                }
+                            },
+                            {
+                                "node": {
+                                    "id": "2",
+                                    "title": "Fallout 4",
+                                    "price": 39.99,
+                                    "inventoryCount": 5
+                                }
+                            },
+                            {
+                                "node": {
+                                    "id": "3",
+                                    "title": "Star Wars Battlefront ||",
+                                    "price": 19.99,
+                                    "inventoryCount": 5
+                                }
+                            }
+                        ]
+                    }
                 }
             }
         """
@@ -181,6 +221,101 @@ class ProductQueryTest(TestCase):
         self.assertNotEqual(actual_result.errors, True)
         self.assertEqual(actual_result.data, expected_result)
 
+    def test_all_products_pages(self):
+        """ Page through products with first and after, filter still applies """
+
+        query = """
+            query Page($after: String)
+            {
+                allProducts(first: 2, after: $after, inventoryCountGt: 0)
+                {
+                    edges
+                    {
+                        node
+                        {
+                            id
+                        }
+                    }
+                    pageInfo
+                    {
+                        hasNextPage
+                        endCursor
+                    }
+                }
+            }
+        """
+
+        first_page = schema.execute(query).data["allProducts"]
+        self.assertEqual([edge["node"]["id"] for edge in first_page["edges"]], ["1", "2"])
+        self.assertTrue(first_page["pageInfo"]["hasNextPage"])
+
+        second_page = schema.execute(query, variable_values={"after": first_page["pageInfo"]["endCursor"]}).data["allProducts"]
+        self.assertEqual([edge["node"]["id"] for edge in second_page["edges"]], ["3"])
+        self.assertFalse(second_page["pageInfo"]["hasNextPage"])
+
+    def test_products_by_keys(self):
+        """ Products of ids and then titles in request order, null for keys without a product """
+
+        actual_result = schema.execute("query { products(ids: [3, 99, 1, 3], titles: [\"Fallout 4\", \"Nope\"]) { id } }")
+
+        self.assertEqual(actual_result.data["products"], [{"id": "3"}, None, {"id": "1"}, {"id": "3"}, {"id": "2"}, None])
+        self.assertEqual(schema.execute("query { products { id } }").data["products"], [])
+
+        actual_result = schema.execute("query Products($ids: [Int!]) { products(ids: $ids) { id } }", variable_values={"ids": list(range(101))})
+        self.assertEqual(actual_result.errors[0].message, "Requesting 101 records exceeds the page size limit of 100 records")
+
+    def test_all_products_page_size_limit(self):
+        """ Pages larger than the server limit are rejected """
+
+        actual_result = schema.execute("query { allProducts(first: 1000) { edges { node { id } } } }")
+
+        self.assertEqual(len(actual_result.errors), 1)
+        self.assertIn("exceeds the page size limit", str(actual_result.errors[0]))
+
+    def test_all_products_order_and_price_range(self):
+        """ Page through products by descending price within a price range """
+
+        query = """
+            query Page($after: String)
+            {
+                allProducts(first: 1, after: $after, minPrice: 10, maxPrice: 35, orderBy: PRICE_DESC)
+                {
+                    edges
+                    {
+                        node
+                        {
+                            title
+                        }
+                    }
+                    pageInfo
+                    {
+                        hasNextPage
+                        endCursor
+                    }
+                }
+            }
+        """
+
+        titles = []
+        after = None
+        while True:
+            page = schema.execute(query, variable_values={"after": after}).data["allProducts"]
+            titles += [edge["node"]["title"] for edge in page["edges"]]
+            after = page["pageInfo"]["endCursor"]
+            if not page["pageInfo"]["hasNextPage"]:
+                break
+
+        self.assertEqual(titles, ["FIFA 19", "Star Wars Battlefront ||"])
+
+    def test_all_products_in_stock_by_inventory(self):
+        """ In stock filter and inventory ordering are served by the inventory index """
+
+        actual_result = schema.execute("query { allProducts(inStock: true, orderBy: INVENTORY_ASC) { edges { node { id } } } }")
+        self.assertEqual([edge["node"]["id"] for edge in actual_result.data["allProducts"]["edges"]], ["1", "2", "3"])
+
+        plan = Product.objects.filter(inventory_count__gt=0).order_by("inventory_count", "id").explain()
+        self.assertIn("product_inventory_idx", plan)
+
 class ProductMutationTest(TestCase):
     def setUp(self):
         Product.objects.create(id=50, title="Fallout 4", price="39.99", inventory_count=5)
@@ -293,6 +428,73 @@ class ProductMutationTest(TestCase):
         self.assertNotEqual(actual_result.errors, True)
         self.assertEqual(actual_result.data, expected_result)
 
+    def test_create_products_bulk(self):
+        """ Create many products at once, duplicates are reported per item and the rest are created """
+
+        mutation = """
+            mutation
+            {
+                createProducts(products: [
+                    {title: "Test 1", price: 1.5, inventoryCount: 3},
+                    {title: "Fallout 4", price: 39.99},
+                    {title: "Test 2", price: -4, inventoryCount: -1},
+                    {title: "Test 1", price: 2}
+                ])
+                {
+                    products
+                    {
+                        title
+                        price
+                        inventoryCount
+                    }
+                    errors
+                    {
+                        index
+                        title
+                        message
+                    }
+                }
+            }
+        """
+        expected_result = """
+            {
+                "data": {
+                    "createProducts": {
+                        "products": [
+                            {
+                                "title": "Test 1",
+                                "price": 1.5,
+                                "inventoryCount": 3
+                            },
+                            {
+                                "title": "Test 2",
+                                "price": 0,
+                                "inventoryCount": 0
+                            }
+                        ],
+                        "errors": [
+                            {
+                                "index": 1,
+                                "title": "Fallout 4",
+                                "message": "Product with title Fallout 4 already exists"
+                            },
+                            {
+                                "index": 3,
+                                "title": "Test 1",
+                                "message": "Product with title Test 1 already exists"
+                            }
+                        ]
+                    }
+                }
+            }
+        """
+
+        expected_result = json.loads(expected_result, object_pairs_hook=OrderedDict).get("data")
+        actual_result = schema.execute(mutation)
+        self.assertIsNone(actual_result.errors)
+        self.assertEqual(actual_result.data, expected_result)
+        self.assertEqual(Product.objects.count(), 3)
+
     def test_delete_product_by_id(self):
         """ Delete product using its id """
 
@@ -318,4 +520,332 @@ class ProductMutationTest(TestCase):
         expected_result = json.loads(expected_result, object_pairs_hook=OrderedDict).get("data")
         actual_result = schema.execute(mutation)
         self.assertNotEqual(actual_result.errors, True)
-        self.assertEqual(actual_result.data, expected_result)
\ No newline at end of file
+        self.assertEqual(actual_result.data, expected_result)
+
+class ProductLoaderTest(TestCase):
+    def setUp(self):
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        Product.objects.create(id=2, title="Fallout 4", price="39.99", inventory_count=5)
+        get_result_cache().clear()
+
+    def test_keys_fetched_once(self):
+        """ product and products share loaders, every key of a document is fetched once with one query a field """
+
+        query = """
+            query {
+                product(id: 1) { title }
+                byTitle: product(title: "Fallout 4") { id }
+                products(ids: [1, 2, 3], titles: ["FIFA 19"]) { id }
+            }
+        """
+
+        with self.assertNumQueries(2):
+            actual_result = schema.execute(query, context_value=RequestFactory().get("/"))
+        self.assertEqual(actual_result.data["products"], [{"id": "1"}, {"id": "2"}, None, {"id": "1"}])
+
+        with self.assertNumQueries(0):
+            schema.execute(query, context_value=RequestFactory().get("/"))
+
+class ProductResultCacheTest(TestCase):
+    def setUp(self):
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        get_result_cache().clear()
+
+    def test_product_cached(self):
+        """ Repeated product queries are served from cache until the catalog changes """
+
+        query = "query { product(id: 1) { inventoryCount } allProducts { edges { node { id } } } }"
+        schema.execute(query)
+
+        with self.assertNumQueries(0):
+            actual_result = schema.execute(query)
+        self.assertEqual(actual_result.data["product"], {"inventoryCount": 5})
+
+        version = get_version()
+        Product.objects.filter(id=1).update(inventory_count=4)
+        Product.objects.get(id=1).save()
+        self.assertNotEqual(get_version(), version)
+
+        actual_result = schema.execute(query)
+        self.assertEqual(actual_result.data["product"], {"inventoryCount": 4})
+
+    def test_lru_eviction_and_ttl(self):
+        """ LRU backend keeps maxsize entries and expires them after ttl """
+
+        cache = LRUResultCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get_or_set("b", lambda: 20), 20)
+
+        cache.ttl = -1
+        cache.set("d", 4)
+        self.assertEqual(cache.get_or_set("d", lambda: 40), 40)
+
+    def test_django_cache_clear(self):
+        """ Clearing the Django backed cache drops its entries and leaves the rest of the cache alone """
+
+        cache = DjangoResultCache(ttl=60)
+        cache.set("a", 1)
+        defaultCache.set("session", "kept")
+        version = get_version()
+
+        cache.clear()
+
+        self.assertEqual(cache.get_or_set("a", lambda: 10), 10)
+        self.assertEqual(defaultCache.get("session"), "kept")
+        self.assertEqual(get_version(), version)
+
+@override_settings(CATALOG_SNAPSHOT={"ENABLED": True})
+class ProductSnapshotQueryTest(ProductQueryTest):
+    """ The product queries give the same results from the catalog snapshot """
+
+    def setUp(self):
+        super().setUp()
+        get_snapshot().clear()
+
+@override_settings(CATALOG_SNAPSHOT={"ENABLED": True, "MAX_PATCH": 5})
+class ProductSnapshotTest(TestCase):
+    def setUp(self):
+        Product.objects.bulk_create(
+            Product(id=i, title=f"Product {i}", price=Decimal(i * 37 % 11) + Decimal("0.99"), inventory_count=i % 4)
+            for i in range(1, 31)
+        )
+        get_snapshot().clear()
+
+    def pages(self, arguments):
+        """ Node ids and cursors of every page of allProducts with arguments, 4 products a page """
+
+        query = "query Page($after: String) { allProducts(first: 4, after: $after, %s) { edges { node { id } cursor } pageInfo { hasNextPage endCursor } } }" % arguments
+        after = None
+        pages = []
+
+        while True:
+            result = schema.execute(query, variable_values={"after": after}).data["allProducts"]
+            pages.append(result["edges"])
+            if not result["pageInfo"]["hasNextPage"]:
+                return pages
+            after = result["pageInfo"]["endCursor"]
+
+    def test_pages_match_the_db(self):
+        """ Every ordering and filter pages through the same products with the same cursors as the db """
+
+        for arguments in [
+            "orderBy: ID", "orderBy: PRICE_DESC", "orderBy: INVENTORY_ASC, inventoryCountGt: 1",
+            "orderBy: PRICE_ASC, inStock: true", "orderBy: INVENTORY_DESC, minPrice: 3, maxPrice: 7.99",
+            "orderBy: ID, inventoryCountGt: 2, maxPrice: 5",
+        ]:
+            snapshotPages = self.pages(arguments)
+
+            with self.settings(CATALOG_SNAPSHOT={"ENABLED": False}):
+                get_result_cache().clear()
+                self.assertEqual(snapshotPages, self.pages(arguments), arguments)
+
+    def test_reads_skip_the_db(self):
+        """ Once copied, reads cost no queries until a product changes """
+
+        query = "query { product(title: \"Product 7\") { id } allProducts(first: 2, orderBy: PRICE_ASC) { edges { node { id } } } }"
+        schema.execute(query)
+
+        with self.assertNumQueries(0):
+            result = schema.execute(query)
+        self.assertEqual(result.data["product"], {"id": "7"})
+
+    def test_patched_after_changes(self):
+        """ Mutations, renames and deletes reach the snapshot by reading the changed rows only """
+
+        schema.execute("query { product(id: 1) { id } }")
+
+        product = Product.objects.get(id=1)
+        product.title = "Renamed"
+        product.inventory_count = 9
+        product.save()
+        schema.execute("mutation { createProduct(title: \"New\", price: 1.00, inventoryCount: 99) { product { id } } }")
+        Product.objects.get(id=2).delete()
+
+        with self.assertNumQueries(1):
+            result = schema.execute("query { allProducts(first: 2, orderBy: INVENTORY_DESC) { edges { node { title inventoryCount } } } }")
+        self.assertEqual([edge["node"] for edge in result.data["allProducts"]["edges"]], [
+            {"title": "New", "inventoryCount": 99}, {"title": "Renamed", "inventoryCount": 9},
+        ])
+        self.assertEqual(schema.execute("query { product(title: \"Product 1\") { id } }").errors[0].message, "Product matching query does not exist.")
+        self.assertEqual(schema.execute("query { product(id: 2) { id } }").errors[0].message, "Product matching query does not exist.")
+
+    def test_rebuilt_when_changes_are_missed(self):
+        """ More changes than MAX_PATCH, or changes gone from the log, copy the whole catalog again """
+
+        schema.execute("query { product(id: 1) { id } }")
+
+        for i in range(6):
+            Product.objects.filter(id=3).update(inventory_count=i)
+            log_changes([3])
+        self.assertEqual(schema.execute("query { product(id: 3) { inventoryCount } }").data["product"], {"inventoryCount": 5})
+
+        Product.objects.filter(id=3).update(inventory_count=42)
+        log_changes()
+        self.assertEqual(schema.execute("query { product(id: 3) { inventoryCount } }").data["product"], {"inventoryCount": 42})
+
+    def test_records_are_small(self):
+        """ Records keep the fields in slots and share equal prices """
+
+        records = get_snapshot().get_many("id", [1, 12])
+
+        self.assertFalse(hasattr(records[0], "__dict__"))
+        self.assertIs(records[0].price, records[1].price)
+
+@override_settings(CATALOG_SNAPSHOT={"ENABLED": True})
+class ProductSnapshotRollbackTest(TransactionTestCase):
+    def setUp(self):
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        get_snapshot().clear()
+
+    def test_rolled_back_rows_are_read_again(self):
+        """ A transaction sees its own changes, after it rolls back the snapshot reads the rows again """
+
+        query = "query { allProducts { edges { node { title inventoryCount } } } }"
+
+        with transaction.atomic():
+            Product.objects.create(id=2, title="Fallout 4", price="39.99", inventory_count=5)
+            Product.objects.filter(id=1).update(inventory_count=0)
+            log_changes([1])
+            self.assertEqual(len(schema.execute(query).data["allProducts"]["edges"]), 2)
+            transaction.set_rollback(True)
+
+        self.assertEqual([edge["node"] for edge in schema.execute(query).data["allProducts"]["edges"]], [{"title": "FIFA 19", "inventoryCount": 5}])
+
+class ProductImportExportTest(TestCase):
+    def setUp(self):
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        Product.objects.create(id=2, title="Fallout 4", price="39.99", inventory_count=5)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_import_updates_matching_titles(self):
+        """ Import creates new titles, updates existing ones and clamps negative values """
+
+        path = os.path.join(self.directory.name, "products.csv")
+        with open(path, "w") as f:
+            f.write("title,price,inventory_count\nFIFA 19,19.99,3\nHalo 5,49.99,-2\nHalo 5,44.99,7\nGears of War 3,-1,1\n")
+
+        version = get_version()
+        out = StringIO()
+        call_command("importproducts", path, batch_size=2, stdout=out)
+
+        self.assertIn("Created 2 and updated 2 products", out.getvalue())
+        self.assertNotEqual(get_version(), version)
+        self.assertEqual(Product.objects.count(), 4)
+        self.assertEqual(Product.objects.get(title="FIFA 19").price, Decimal("19.99"))
+        self.assertEqual(Product.objects.get(title="Fallout 4").price, Decimal("39.99"))
+        self.assertEqual(Product.objects.get(title="Halo 5").inventory_count, 7)
+        self.assertEqual(Product.objects.get(title="Gears of War 3").price, Decimal("0"))
+
+    def test_import_restocks_shards(self):
+        """ New stock of a sharded product is spread over its shards """
+
+        call_command("shardinventory", 2, 1, stdout=StringIO())
+
+        path = os.path.join(self.directory.name, "products.csv")
+        with open(path, "w") as f:
+            f.write("title,price,inventory_count\nFIFA 19,29.99,9\n")
+
+        call_command("importproducts", path, stdout=StringIO())
+
+        self.assertEqual(sorted(InventoryShard.objects.filter(product_id=1).values_list("count", flat=True)), [4, 5])
+        self.assertEqual(Product.objects.get(id=1).inventory_count, 9)
+
+    def test_export_round_trip(self):
+        """ Exported files import back without changes, in either format """
+
+        for fmt in ("csv", "jsonl"):
+            path = os.path.join(self.directory.name, "products." + fmt)
+            call_command("exportproducts", path, chunk_size=1, stdout=StringIO())
+
+            out = StringIO()
+            call_command("importproducts", path, stdout=out)
+
+            self.assertIn("Created 0 and updated 0 products", out.getvalue())
+
+        with open(os.path.join(self.directory.name, "products.jsonl")) as f:
+            self.assertEqual(json.loads(f.readline()), {"id": 1, "title": "FIFA 19", "price": "29.99", "inventory_count": 5})
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        Product.objects.create(id=2, title="Fallout 4", price="39.99", inventory_count=5)
+        Product.objects.create(id=3, title="Star Wars Battlefront ||", price="19.99", inventory_count=5)
+        Product.objects.create(id=4, title="Gears of War 3", price="9.99", inventory_count=0)
+        Product.objects.create(id=5, title="Star Trek", price="9.99", inventory_count=1)
+
+    def search(self, query, first=10, after=None):
+        result = schema.execute(
+            "query Search($query: String!, $first: Int, $after: String) { searchProducts(query: $query, first: $first, after: $after) "
+            "{ edges { node { title } } pageInfo { hasNextPage endCursor } } }",
+            variable_values={"query": query, "first": first, "after": after},
+        )
+        self.assertIsNone(result.errors)
+        connection = result.data["searchProducts"]
+        return [edge["node"]["title"] for edge in connection["edges"]], connection["pageInfo"]
+
+    def test_prefix_and_case(self):
+        """ Every word of the query matches a title word and the last one the start of a title word, ignoring case and punctuation """
+
+        self.assertEqual(self.search("FAL")[0], ["Fallout 4"])
+        self.assertEqual(self.search("war gea")[0], ["Gears of War 3"])
+        self.assertEqual(self.search("wa gears")[0], [])
+        self.assertEqual(sorted(self.search("star")[0]), ["Star Trek", "Star Wars Battlefront ||"])
+        self.assertEqual(self.search("ars")[0], [])
+        self.assertEqual(self.search("|| *")[0], [])
+
+    def test_ranking_and_pages(self):
+        """ Closer matches rank first and pages continue after the cursor """
+
+        self.assertEqual(self.search("star tre")[0], ["Star Trek"])
+        self.assertEqual(self.search("star")[0][0], "Star Trek")
+
+        first, pageInfo = self.search("star", first=1)
+        self.assertTrue(pageInfo["hasNextPage"])
+        second, pageInfo = self.search("star", first=1, after=pageInfo["endCursor"])
+        self.assertFalse(pageInfo["hasNextPage"])
+        self.assertEqual(first + second, self.search("star")[0])
+
+    def test_rank_before_limit(self):
+        """ The best match comes first whatever its id, and pages through close ranks return every match once """
+
+        Product.objects.bulk_create([
+            Product(id=id, title=f"Star Wars Battlefront || Edition {id}", price="19.99", inventory_count=1) for id in range(10, 260)
+        ])
+        Product.objects.create(id=1000, title="Star", price="9.99", inventory_count=1)
+
+        self.assertEqual(self.search("star", first=1)[0], ["Star"])
+
+        titles, after = [], None
+        while True:
+            page, pageInfo = self.search("star", first=100, after=after)
+            titles.extend(page)
+            if not pageInfo["hasNextPage"]:
+                break
+            after = pageInfo["endCursor"]
+
+        self.assertEqual(len(titles), 253)
+        self.assertEqual(len(set(titles)), 253)
+
+    def test_index_follows_mutations(self):
+        """ Created, renamed and deleted products are found, or not, straight away """
+
+        self.search("starf")
+        result = schema.execute('mutation { createProduct(title: "Starfield", price: 69.99) { product { id } } }')
+        productId = int(result.data["createProduct"]["product"]["id"])
+        self.assertEqual(self.search("starf")[0], ["Starfield"])
+
+        Product.objects.filter(id=productId).update(title="Halo Infinite")
+        Product.objects.get(id=productId).save()
+        self.assertEqual(self.search("starf")[0], [])
+        self.assertEqual(self.search("inf")[0], ["Halo Infinite"])
+
+        schema.execute(f"mutation {{ deleteProduct(id: {productId}) {{ message }} }}")
+        self.assertEqual(self.search("inf")[0], [])
@@ -0,0 +1,32 @@
+"""
+ASGI config for shopify project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.2 has no ASGI support and its ORM is synchronous, so the WSGI application
+is served through shopify.handlers.ASGIHandler, which handles requests on a pool
+of ASGI_THREADS threads. Run it with any ASGI server, for example
+``uvicorn shopify.asgi:application``.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopify.settings')
+
+wsgiApplication = get_wsgi_application()
+
+from django.conf import settings
+from products.inventory import start_inventory_sync
+from shoppingCart.purge import start_purge_scheduler
+from shoppingCart.reservations import start_reservation_sweeper
+from .handlers import ASGIHandler
+from .sessions import start_session_flusher
+
+application = ASGIHandler(wsgiApplication, getattr(settings, "ASGI_THREADS", 8))
+
+start_session_flusher()
+start_purge_scheduler()
+start_reservation_sweeper()
+start_inventory_sync()
@@ -0,0 +1,56 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import execute, ExecutionResult
+from graphql.language.base import parse
+from graphql.validation import validate
+
+def query_hash(query):
+    """ sha256 hex digest of a query string, the key persisted queries are sent by """
+
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+def execute_validated(schema, document_ast, validation_errors, *args, **kwargs):
+    """ Executes a document that was validated when it was parsed """
+
+    if validation_errors:
+        return ExecutionResult(errors=validation_errors, invalid=True)
+
+    return execute(schema, document_ast, *args, **kwargs)
+
+class LRUCachedBackend(GraphQLCoreBackend):
+    """ Core backend that keeps the most recently used documents parsed and validated, keyed by query hash """
+
+    def __init__(self, maxsize=256, executor=None):
+        super().__init__(executor=executor)
+        self.maxsize = maxsize
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+
+    def document_from_string(self, schema, document_string):
+        key = (schema, query_hash(document_string))
+
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+                return document
+
+        document_ast = parse(document_string)
+        validation_errors = validate(schema, document_ast)
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=partial(execute_validated, schema, document_ast, validation_errors, **self.execute_params),
+        )
+
+        with self.lock:
+            self.documents[key] = document
+            if len(self.documents) > self.maxsize:
+                self.documents.popitem(last=False)
+
+        return document
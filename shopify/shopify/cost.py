@@ -0,0 +1,157 @@
+from django.conf import settings
+from graphql import GraphQLError
+from graphql.language import ast
+from graphql.type.definition import GraphQLList, GraphQLNonNull, is_leaf_type
+from graphene_django.settings import graphene_settings
+
+def cost_settings():
+    return getattr(settings, "GRAPHQL_COST", {})
+
+def unwrap(fieldType):
+    """ Named type of a field type and whether it is a list """
+
+    isList = False
+
+    while isinstance(fieldType, (GraphQLList, GraphQLNonNull)):
+        if isinstance(fieldType, GraphQLList):
+            isList = True
+        fieldType = fieldType.of_type
+
+    return fieldType, isList
+
+def argument_value(field, name, variables):
+    """ Value of an argument given as a literal or a variable, None if absent """
+
+    for argument in field.arguments or []:
+        if argument.name.value == name:
+            value = argument.value
+
+            if isinstance(value, ast.Variable):
+                return (variables or {}).get(value.name.value)
+            if isinstance(value, ast.IntValue):
+                return int(value.value)
+            if isinstance(value, ast.ListValue):
+                return value.values
+
+    return None
+
+class CostAnalysis:
+    """ Static depth and cost of an operation, computed from the document before it runs.
+
+        Every object a field returns costs its weight, 1 by default, 0 for scalars and for the
+        edges and nodes of relay connections, which only wrap what the connection field already paid for.
+        Connection fields return first (or the maximum page size) objects, fields of KEY_ARGUMENTS one
+        object for every key in those list arguments, other list fields LIST_SIZES or DEFAULT_LIST_SIZE
+        objects, and nested fields pay for every parent object """
+
+    def __init__(self, schema, document_ast, variables=None):
+        config = cost_settings()
+
+        self.schema = schema
+        self.variables = variables
+        self.weights = config.get("FIELD_WEIGHTS", {})
+        self.listSizes = config.get("LIST_SIZES", {})
+        self.keyArguments = config.get("KEY_ARGUMENTS", {})
+        self.defaultListSize = config.get("DEFAULT_LIST_SIZE", 10)
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document_ast.definitions
+            if isinstance(definition, ast.FragmentDefinition)
+        }
+
+    def operation_cost(self, operation):
+        """ (depth, cost) of an operation definition """
+
+        if operation.operation == "mutation":
+            rootType = self.schema.get_mutation_type()
+        else:
+            rootType = self.schema.get_query_type()
+
+        return self.selection_cost(rootType, operation.selection_set, 1, set())
+
+    def fields(self, selectionSet, visited):
+        """ Fields of a selection set with fragments spread in """
+
+        for selection in selectionSet.selections:
+            if isinstance(selection, ast.Field):
+                yield selection
+            elif isinstance(selection, ast.InlineFragment):
+                yield from self.fields(selection.selection_set, visited)
+            elif isinstance(selection, ast.FragmentSpread):
+                name = selection.name.value
+                if name in self.fragments and name not in visited:
+                    yield from self.fields(self.fragments[name].selection_set, visited | {name})
+
+    def list_size(self, parentName, field, definition, isList):
+        first = argument_value(field, "first", self.variables)
+        if isinstance(first, int):
+            return max(first, 0)
+        if "first" in definition.args:
+            return graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        if not isList or parentName.endswith("Connection"):
+            return 1
+
+        key = f"{parentName}.{field.name.value}"
+        if key in self.keyArguments:
+            return sum(len(argument_value(field, name, self.variables) or []) for name in self.keyArguments[key])
+
+        return self.listSizes.get(key, self.defaultListSize)
+
+    def weight(self, parentName, fieldType, name):
+        key = f"{parentName}.{name}"
+
+        if key in self.weights:
+            return self.weights[key]
+        if is_leaf_type(fieldType) or parentName.endswith(("Connection", "Edge")):
+            return 0
+
+        return 1
+
+    def selection_cost(self, parentType, selectionSet, multiplier, visited):
+        depth = 0
+        cost = 0
+
+        for field in self.fields(selectionSet, visited):
+            name = field.name.value
+            definition = getattr(parentType, "fields", {}).get(name)
+
+            if name.startswith("__") or definition is None:
+                continue
+
+            fieldType, isList = unwrap(definition.type)
+            count = multiplier * self.list_size(parentType.name, field, definition, isList)
+            fieldDepth = 1
+            cost = cost + count * self.weight(parentType.name, fieldType, name)
+
+            if field.selection_set is not None:
+                childDepth, childCost = self.selection_cost(fieldType, field.selection_set, count, visited)
+                fieldDepth = fieldDepth + childDepth
+                cost = cost + childCost
+
+            depth = max(depth, fieldDepth)
+
+        return depth, cost
+
+def check_cost(schema, document_ast, operation_name=None, variables=None):
+    """ GraphQLError for an operation deeper than MAX_DEPTH or costlier than MAX_COST, None if it is within budget """
+
+    config = cost_settings()
+    maxDepth = config.get("MAX_DEPTH")
+    maxCost = config.get("MAX_COST")
+    analysis = CostAnalysis(schema, document_ast, variables)
+
+    for definition in document_ast.definitions:
+        if not isinstance(definition, ast.OperationDefinition):
+            continue
+        if operation_name and (definition.name is None or definition.name.value != operation_name):
+            continue
+
+        depth, cost = analysis.operation_cost(definition)
+
+        if maxDepth is not None and depth > maxDepth:
+            return GraphQLError(message=f"Query depth {depth} exceeds the maximum depth of {maxDepth}")
+
+        if maxCost is not None and cost > maxCost:
+            return GraphQLError(message=f"Query cost {cost} exceeds the maximum cost of {maxCost}")
+
+    return None
@@ -0,0 +1,115 @@
+import gzip
+import json
+from decimal import Decimal
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+# orjson and brotli are optional, responses fall back to the json module and gzip without them
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def compression_settings():
+    return getattr(settings, "GRAPHQL_COMPRESSION", {})
+
+def encode_default(value):
+    """ JSON value of types the encoders don't know, Decimals are written as numbers like the Float scalar """
+
+    if isinstance(value, Decimal):
+        return float(value)
+
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(data, pretty=False):
+    """ UTF-8 JSON of data, compact or indented with sorted keys. Uses orjson when it is installed and
+        the json module for what orjson can't encode (integers over 64 bits) """
+
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=encode_default, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if pretty else 0)
+        except orjson.JSONEncodeError:
+            pass
+
+    if pretty:
+        return json.dumps(data, default=encode_default, sort_keys=True, indent=2, separators=(",", ": ")).encode("utf-8")
+
+    return json.dumps(data, default=encode_default, separators=(",", ":")).encode("utf-8")
+
+def accepted_encodings(request):
+    """ Content codings of the request's Accept-Encoding header with their q values """
+
+    accepted = {}
+
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        name, _, parameters = part.partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+
+        for parameter in parameters.split(";"):
+            key, _, value = parameter.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if name:
+            accepted[name] = quality
+
+    return accepted
+
+def response_encoding(request):
+    """ Coding responses to request are compressed with, brotli when it is installed and accepted, then gzip.
+        None when GRAPHQL_COMPRESSION is off or the client accepts neither """
+
+    if not compression_settings().get("ENABLED"):
+        return None
+
+    accepted = accepted_encodings(request)
+
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+
+    return None
+
+def compress(content, encoding):
+    """ content compressed with encoding. The output only depends on content, so compressed responses
+        keep strong ETags """
+
+    config = compression_settings()
+
+    if encoding == "br":
+        return brotli.compress(content, quality=config.get("BROTLI_QUALITY", 4))
+
+    return gzip.compress(content, compresslevel=config.get("GZIP_LEVEL", 6), mtime=0)
+
+def compress_response(request, response):
+    """ Compresses successful responses of at least MIN_SIZE bytes for clients that accept it. Responses
+        vary on Accept-Encoding whenever compression is on, for caches to keep each coding apart """
+
+    if not compression_settings().get("ENABLED") or response.streaming or response.status_code not in (200, 304):
+        return response
+
+    patch_vary_headers(response, ("Accept-Encoding",))
+    encoding = response_encoding(request)
+
+    if encoding is None or response.status_code != 200 or response.has_header("Content-Encoding"):
+        return response
+    if len(response.content) < compression_settings().get("MIN_SIZE", 1024):
+        return response
+
+    response.content = compress(response.content, encoding)
+    response["Content-Encoding"] = encoding
+    if response.has_header("Content-Length"):
+        response["Content-Length"] = str(len(response.content))
+
+    return response
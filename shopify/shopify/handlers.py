@@ -0,0 +1,117 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+class ASGIHandler:
+    """ ASGI application running a WSGI application on a bounded thread pool. The event loop reads
+        requests and writes responses, so clients that are slow to send or receive hold a coroutine,
+        only the handling of a request holds one of the maxThreads threads """
+
+    def __init__(self, wsgiApplication, maxThreads):
+        self.wsgiApplication = wsgiApplication
+        self.executor = ThreadPoolExecutor(max_workers=maxThreads, thread_name_prefix="asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']}")
+
+        body = await self.read_body(receive)
+        if body is None:
+            return
+
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(self.executor, self.run, self.environ(scope, body))
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def read_body(receive):
+        """ Request body, None if the client disconnected before sending all of it """
+
+        chunks = []
+
+        while True:
+            message = await receive()
+
+            if message["type"] == "http.disconnect":
+                return None
+
+            chunks.append(message.get("body", b""))
+
+            if not message.get("more_body", False):
+                return b"".join(chunks)
+
+    @staticmethod
+    def environ(scope, body):
+        """ WSGI environ for an ASGI http scope """
+
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+            "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin1").lower()
+            value = value.decode("latin1")
+
+            if name == "content-type":
+                key = "CONTENT_TYPE"
+            elif name == "content-length":
+                continue
+            else:
+                key = "HTTP_" + name.upper().replace("-", "_")
+
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+        environ["CONTENT_LENGTH"] = str(len(body))
+
+        return environ
+
+    def run(self, environ):
+        """ Status, headers and body of the WSGI application's response """
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(name.lower().encode("latin1"), value.strip().encode("latin1")) for name, value in headers]
+
+        result = self.wsgiApplication(environ, start_response)
+        try:
+            content = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+        return response["status"], response["headers"], content
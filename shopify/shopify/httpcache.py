@@ -0,0 +1,72 @@
+import hashlib
+import json
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from graphql.language import ast
+from products.catalog import get_change_count, get_version
+from .cost import CostAnalysis
+
+def http_cache_settings():
+    return getattr(settings, "GRAPHQL_HTTP_CACHE", {})
+
+def selects_live_field(analysis, selectionSet, liveFields):
+    """ Whether a selection set selects any of liveFields at any depth """
+
+    for field in analysis.fields(selectionSet, set()):
+        if field.name.value in liveFields:
+            return True
+        if field.selection_set is not None and selects_live_field(analysis, field.selection_set, liveFields):
+            return True
+
+    return False
+
+def public_operation(schema, document_ast, operation_name=None):
+    """ Whether the operation to run is a query of PUBLIC_FIELDS alone, whose response is the same for
+        every session and changes only with the catalog. Introspection fields count as public, queries
+        selecting LIVE_FIELDS anywhere don't """
+
+    operations = [
+        definition for definition in document_ast.definitions
+        if isinstance(definition, ast.OperationDefinition)
+        and (not operation_name or definition.name is not None and definition.name.value == operation_name)
+    ]
+
+    if len(operations) != 1 or operations[0].operation != "query":
+        return False
+
+    config = http_cache_settings()
+    publicFields = set(config.get("PUBLIC_FIELDS", []))
+    analysis = CostAnalysis(schema, document_ast)
+    fields = analysis.fields(operations[0].selection_set, set())
+
+    if not all(field.name.value.startswith("__") or f"Query.{field.name.value}" in publicFields for field in fields):
+        return False
+
+    return not selects_live_field(analysis, operations[0].selection_set, set(config.get("LIVE_FIELDS", [])))
+
+def catalog_etag(query, variables, operation_name, pretty=False, encoding=None):
+    """ Strong ETag of the response to a public query in a content coding, it changes whenever a product
+        changes or is sold """
+
+    key = json.dumps(
+        [get_version(), get_change_count(), query, variables, operation_name, bool(pretty), encoding],
+        sort_keys=True, separators=(",", ":"),
+    )
+
+    return '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+def patch_public(response, etag):
+    """ Lets browsers and shared caches keep a response for MAX_AGE seconds and revalidate it with its ETag """
+
+    config = http_cache_settings()
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=config.get("MAX_AGE", 0))
+
+    if config.get("STALE_WHILE_REVALIDATE"):
+        patch_cache_control(response, stale_while_revalidate=config["STALE_WHILE_REVALIDATE"])
+
+def patch_private(response):
+    """ Keeps a response that depends on the session or changes data out of every cache """
+
+    if not response.has_header("Cache-Control"):
+        patch_cache_control(response, private=True, no_store=True)
@@ -0,0 +1,172 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from promise import Promise, is_thenable
+
+logger = logging.getLogger("shopify.graphql.trace")
+
+def trace_settings():
+    return getattr(settings, "GRAPHQL_TRACE", {})
+
+def trace_requested(request):
+    """ Whether the client asked for the trace in the response extensions """
+
+    header = "HTTP_" + trace_settings().get("HEADER", "X-GraphQL-Trace").upper().replace("-", "_")
+    return request.META.get(header, "").lower() in ("1", "true")
+
+def trace_sampled():
+    """ Whether to trace a request for the log, LOG_SAMPLE_RATE of requests are """
+
+    return random.random() < trace_settings().get("LOG_SAMPLE_RATE", 0)
+
+class FieldStats:
+    """ Accumulated cost of every call to one resolver """
+
+    __slots__ = ("calls", "duration", "maxDuration", "queries", "sqlDuration")
+
+    def __init__(self):
+        self.calls = 0
+        self.duration = 0.0
+        self.maxDuration = 0.0
+        self.queries = 0
+        self.sqlDuration = 0.0
+
+class PendingField:
+    """ SQL run while no resolver is on the stack, by batched loaders, during the wait of a resolver's promise """
+
+    __slots__ = ("queries", "sqlDuration")
+
+    def __init__(self):
+        self.queries = 0
+        self.sqlDuration = 0.0
+
+class RequestTrace:
+    """ Resolver timings and SQL counts of one GraphQL request. SQL run while a resolver is on the stack
+        is charged to it. A resolver returning a promise is timed until the promise settles, and charged
+        the SQL batched loaders run in the meantime, which every field waiting on the batch shares """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.sqlDuration = 0.0
+        self.fields = {}
+        self.running = 0
+        self.pending = set()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries = self.queries + 1
+            self.sqlDuration = self.sqlDuration + elapsed
+
+            if not self.running:
+                for waiting in self.pending:
+                    waiting.queries = waiting.queries + 1
+                    waiting.sqlDuration = waiting.sqlDuration + elapsed
+
+    def wait(self):
+        """ Starts charging loader SQL to a resolver whose promise is pending """
+
+        waiting = PendingField()
+        self.pending.add(waiting)
+        return waiting
+
+    def settle(self, field, waiting, start, queries, sqlDuration):
+        """ Records a resolver whose promise settled, with the SQL its call and its wait ran """
+
+        self.pending.discard(waiting)
+        self.record(field, time.perf_counter() - start, queries + waiting.queries, sqlDuration + waiting.sqlDuration)
+
+    def record(self, field, duration, queries, sqlDuration):
+        stats = self.fields.get(field)
+        if stats is None:
+            stats = self.fields[field] = FieldStats()
+
+        stats.calls = stats.calls + 1
+        stats.duration = stats.duration + duration
+        stats.maxDuration = max(stats.maxDuration, duration)
+        stats.queries = stats.queries + queries
+        stats.sqlDuration = stats.sqlDuration + sqlDuration
+
+    def run(self, execute):
+        """ Runs execute with every database connection reporting to this trace """
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.execute_wrapper))
+
+            try:
+                return execute()
+            finally:
+                self.duration = time.perf_counter() - self.start
+
+    def as_dict(self):
+        fields = sorted(self.fields.items(), key=lambda item: item[1].duration, reverse=True)
+
+        return {
+            "duration_ms": round(self.duration * 1000, 3),
+            "sql": {"count": self.queries, "duration_ms": round(self.sqlDuration * 1000, 3)},
+            "resolvers": [
+                {
+                    "field": field,
+                    "calls": stats.calls,
+                    "duration_ms": round(stats.duration * 1000, 3),
+                    "max_ms": round(stats.maxDuration * 1000, 3),
+                    "sql": {"count": stats.queries, "duration_ms": round(stats.sqlDuration * 1000, 3)},
+                }
+                for field, stats in fields
+            ],
+        }
+
+    def log(self, operationName=None):
+        logger.info(json.dumps(dict(self.as_dict(), operation=operationName)))
+
+class TracingMiddleware:
+    """ Graphene middleware timing each resolver of a traced request, untraced requests pass straight through """
+
+    def resolve(self, next, root, info, **args):
+        trace = getattr(info.context, "graphql_trace", None)
+
+        if trace is None:
+            return next(root, info, **args)
+
+        field = f"{info.parent_type.name}.{info.field_name}"
+        queries = trace.queries
+        sqlDuration = trace.sqlDuration
+        start = time.perf_counter()
+        trace.running = trace.running + 1
+
+        try:
+            result = next(root, info, **args)
+        except Exception:
+            trace.record(field, time.perf_counter() - start, trace.queries - queries, trace.sqlDuration - sqlDuration)
+            raise
+        finally:
+            trace.running = trace.running - 1
+
+        queries = trace.queries - queries
+        sqlDuration = trace.sqlDuration - sqlDuration
+
+        if not is_thenable(result):
+            trace.record(field, time.perf_counter() - start, queries, sqlDuration)
+            return result
+
+        waiting = trace.wait()
+
+        def settled(value):
+            trace.settle(field, waiting, start, queries, sqlDuration)
+            return value
+
+        def failed(error):
+            trace.settle(field, waiting, start, queries, sqlDuration)
+            raise error
+
+        return Promise.resolve(result).then(settled, failed)
@@ -0,0 +1,52 @@
+from promise import Promise
+from promise.dataloader import DataLoader
+
+def get_loader(info, loaderClass):
+    """ Returns the request scoped instance of loaderClass, creating it on first use """
+
+    context = info.context
+    if context is None:
+        # Documents executed without a context don't share loaders between fields
+        return loaderClass()
+
+    loaders = getattr(context, "loaders", None)
+
+    if loaders is None:
+        loaders = {}
+        context.loaders = loaders
+
+    if loaderClass not in loaders:
+        loaders[loaderClass] = loaderClass()
+
+    return loaders[loaderClass]
+
+def clear_loader(info, loaderClass, key=None):
+    """ Drops cached values of a request scoped loader after a mutation, all values if no key is given """
+
+    loaders = getattr(info.context, "loaders", None)
+
+    if loaders is not None and loaderClass in loaders:
+        if key is None:
+            loaders[loaderClass].clear_all()
+        else:
+            loaders[loaderClass].clear(key)
+
+class ManyToManyLoader(DataLoader):
+    """ Loads a many to many relation for a batch of instances with one query on the through table, keyed on instance id """
+
+    model = None
+    field_name = None
+
+    def batch_load_fn(self, keys):
+        field = self.model._meta.get_field(self.field_name)
+        through = field.remote_field.through
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+
+        related = {key: [] for key in keys}
+        rows = through.objects.filter(**{f"{source}_id__in": keys}).select_related(target).order_by("pk")
+
+        for row in rows:
+            related[getattr(row, f"{source}_id")].append(getattr(row, target))
+
+        return Promise.resolve([related[key] for key in keys])
@@ -0,0 +1,95 @@
+import graphene
+from django.db.models import Q
+from graphql import GraphQLError
+from graphql_relay.utils import base64, unbase64
+from graphene_django.settings import graphene_settings
+
+CURSOR_PREFIX = "keyset:"
+
+def to_cursor(row, orderField=None):
+    """ Opaque cursor for a row, the keyset is the primary key and the ordering field if there is one """
+
+    if orderField is None:
+        return base64(f"{CURSOR_PREFIX}{row.pk}")
+
+    return base64(f"{CURSOR_PREFIX}{row.pk}:{getattr(row, orderField)}")
+
+def from_cursor(cursor, orderField=None):
+    """ Primary key and ordering field value encoded in a cursor made by to_cursor """
+
+    try:
+        value = unbase64(cursor)
+        if not value.startswith(CURSOR_PREFIX):
+            raise ValueError(cursor)
+
+        keyset = value[len(CURSOR_PREFIX):].split(":", 1)
+        if (orderField is None) != (len(keyset) == 1):
+            raise ValueError(cursor)
+
+        return int(keyset[0]), keyset[1] if orderField else None
+    except (ValueError, TypeError):
+        raise GraphQLError(message=f"Invalid cursor {cursor}")
+
+def connection_field(connectionType, **kwargs):
+    """ Field for a connection paginated forwards with first and after """
+
+    return graphene.Field(connectionType, first=graphene.Int(), after=graphene.String(), **kwargs)
+
+def page_size(first=None):
+    """ Rows to return for the first argument of a connection, the page size limit when it is missing """
+
+    maxPageSize = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+    if first is None:
+        return maxPageSize
+
+    if first < 0:
+        raise GraphQLError(message="Argument first must be a non-negative integer")
+
+    if first > maxPageSize:
+        raise GraphQLError(message=f"Requesting {first} records exceeds the page size limit of {maxPageSize} records")
+
+    return first
+
+def fetch_page(queryset, first=None, after=None, orderField=None, descending=False):
+    """ Rows of queryset after the given cursor, and whether there are more rows. Rows are in primary key
+        order, or ordered by orderField with the primary key breaking ties. Pages are found with
+        WHERE (field, pk) > cursor so cost doesn't grow with the position in the table """
+
+    first = page_size(first)
+
+    afterLookup = "lt" if descending else "gt"
+    ordering = ["-pk"] if descending else ["pk"]
+
+    if orderField is not None:
+        ordering = [("-" if descending else "") + orderField] + ordering
+
+    if after is not None:
+        pk, value = from_cursor(after, orderField)
+
+        if orderField is None:
+            queryset = queryset.filter(**{f"pk__{afterLookup}": pk})
+        else:
+            queryset = queryset.filter(Q(**{f"{orderField}__{afterLookup}": value}) | Q(**{orderField: value, f"pk__{afterLookup}": pk}))
+
+    rows = list(queryset.order_by(*ordering)[:first + 1])
+    return rows[:first], len(rows) > first
+
+def build_connection(connectionType, rows, hasNextPage, after=None, orderField=None):
+    """ Wraps a page of rows in a relay connection with pageInfo """
+
+    edges = [connectionType.Edge(node=row, cursor=to_cursor(row, orderField)) for row in rows]
+    pageInfo = graphene.relay.PageInfo(
+        start_cursor=edges[0].cursor if edges else None,
+        end_cursor=edges[-1].cursor if edges else None,
+        has_next_page=hasNextPage,
+        has_previous_page=after is not None,
+    )
+
+    return connectionType(edges=edges, page_info=pageInfo)
+
+def paginate(connectionType, queryset, first=None, after=None, orderField=None, descending=False):
+    """ Keyset paginated connection over queryset """
+
+    rows, hasNextPage = fetch_page(queryset, first, after, orderField, descending)
+    return build_connection(connectionType, rows, hasNextPage, after, orderField)
@@ -0,0 +1,55 @@
+import atexit
+import logging
+import threading
+from django.db import connections
+
+logger = logging.getLogger("shopify.periodic")
+
+class PeriodicTask:
+    """ Calls function every interval seconds on a daemon thread, and with runOnStop once more when
+        stopped or when the process exits. Errors are logged and don't stop the schedule """
+
+    def __init__(self, function, interval, name=None, runOnStop=True):
+        self.function = function
+        self.interval = interval
+        self.runOnStop = runOnStop
+        self.name = name or getattr(function, "__name__", "periodic-task")
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return self
+
+            self.thread = threading.Thread(target=self.loop, name=self.name, daemon=True)
+            self.thread.start()
+            atexit.register(self.stop)
+
+        return self
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        try:
+            return self.function()
+        except Exception:
+            logger.exception("Periodic task %s failed", self.name)
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        """ Stops the schedule and with runOnStop runs the function a last time """
+
+        with self.lock:
+            if self.thread is None or self.stopped.is_set():
+                return
+
+            self.stopped.set()
+
+        self.thread.join()
+        if self.runOnStop:
+            self.run_once()
@@ -0,0 +1,57 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+
+PRIMARY = "default"
+SESSION_PRIMARY_UNTIL = "primaryUntil"
+
+# Whether reads in the current thread or task have to see the primary
+primaryPinned = ContextVar("primaryPinned", default=False)
+
+@contextmanager
+def use_primary(pin=True):
+    """ Sends reads to the primary while the block runs, if pin is set """
+
+    token = primaryPinned.set(pin or primaryPinned.get())
+    try:
+        yield
+    finally:
+        primaryPinned.reset(token)
+
+def session_pinned(session):
+    """ Whether the session mutated within the last DATABASE_REPLICA_STICKY_SECONDS """
+
+    return session.get(SESSION_PRIMARY_UNTIL, 0) > time.time()
+
+def pin_session(session):
+    """ Sends the session's reads to the primary for DATABASE_REPLICA_STICKY_SECONDS, so it reads its own writes
+        while the replicas catch up """
+
+    session[SESSION_PRIMARY_UNTIL] = time.time() + getattr(settings, "DATABASE_REPLICA_STICKY_SECONDS", 10)
+
+class ReplicaRouter:
+    """ Sends writes to the primary and reads to a random alias of DATABASE_REPLICAS. Reads go to the
+        primary when there are no replicas, inside use_primary, and for PRIMARY_APPS whose rows have
+        to be current, like sessions that are written behind and read on a cache miss """
+
+    PRIMARY_APPS = {"sessions"}
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, "DATABASE_REPLICAS", [])
+
+        if not replicas or primaryPinned.get() or model._meta.app_label in self.PRIMARY_APPS:
+            return PRIMARY
+
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
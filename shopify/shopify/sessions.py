@@ -0,0 +1,132 @@
+import threading
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.models import Session
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from .periodic import PeriodicTask
+
+KEY_PREFIX = "shopify.sessions"
+
+# Sessions saved to the cache but not yet to the db, session key to (session data, expire date)
+pending = {}
+pendingLock = threading.Lock()
+flusher = None
+
+def flush_sessions():
+    """ Writes every pending session to the db in one transaction, returns the number written """
+
+    global pending
+
+    with pendingLock:
+        batch, pending = pending, {}
+
+    if not batch:
+        return 0
+
+    sessions = [Session(session_key=key, session_data=data, expire_date=expireDate) for key, (data, expireDate) in batch.items()]
+
+    try:
+        with transaction.atomic():
+            existing = set(Session.objects.filter(session_key__in=batch).values_list("session_key", flat=True))
+            Session.objects.bulk_update([s for s in sessions if s.session_key in existing], ["session_data", "expire_date"])
+            Session.objects.bulk_create([s for s in sessions if s.session_key not in existing])
+    except Exception:
+        # Put the batch back unless a newer save of the same session came in meanwhile
+        with pendingLock:
+            for key, value in batch.items():
+                pending.setdefault(key, value)
+        raise
+
+    return len(sessions)
+
+def check_session_cache(app_configs, **kwargs):
+    """ System check refusing this engine with a local memory cache, which every process keeps apart """
+
+    if settings.SESSION_ENGINE != __name__ or not isinstance(caches[settings.SESSION_CACHE_ALIAS], LocMemCache):
+        return []
+
+    return [checks.Error(
+        f"SESSION_ENGINE {__name__} needs a cache shared by all server processes, "
+        f"the '{settings.SESSION_CACHE_ALIAS}' cache is a local memory cache",
+        hint="Configure a shared cache (memcached, redis) as SESSION_CACHE_ALIAS or use the db session engine",
+        id="shopify.E001",
+    )]
+
+def start_session_flusher():
+    """ Starts flushing pending sessions every SESSION_WRITE_BEHIND_INTERVAL seconds, and at exit, when
+        sessions use this engine """
+
+    global flusher
+
+    if settings.SESSION_ENGINE != __name__:
+        return None
+
+    if flusher is None:
+        flusher = PeriodicTask(flush_sessions, getattr(settings, "SESSION_WRITE_BEHIND_INTERVAL", 5), name="session-flusher", runOnStop=True)
+
+    return flusher.start()
+
+class SessionStore(CachedDBStore):
+    """ Sessions read from and written to the cache, and written behind to the db.
+
+        Requests don't query the db for a session unless it is missing from the cache, which is
+        also how sessions saved by the db or cached_db engines carry over. Saves are queued and
+        written to the db in batches by flush_sessions, so a session survives a cache restart
+        after the next flush. The cache must be shared by every server process """
+
+    cache_key_prefix = KEY_PREFIX
+
+    def load(self):
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            data = None
+
+        if data is not None:
+            return data
+
+        with pendingLock:
+            queued = pending.get(self._session_key)
+
+        if queued is not None:
+            return self.decode(queued[0])
+
+        return super().load()
+
+    def exists(self, session_key):
+        # Only used to pick new session keys, a random 32 character key that was flushed and then
+        # evicted from the cache colliding isn't worth a query on every new session
+        with pendingLock:
+            if session_key in pending:
+                return True
+
+        return bool(session_key) and (self.cache_key_prefix + session_key) in self._cache
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        data = self._get_session(no_load=must_create)
+
+        if must_create:
+            if not self._cache.add(self.cache_key, data, self.get_expiry_age()):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, data, self.get_expiry_age())
+
+        with pendingLock:
+            pending[self.session_key] = (self.encode(data), self.get_expiry_date())
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            session_key = self.session_key
+
+        if session_key is not None:
+            with pendingLock:
+                pending.pop(session_key, None)
+
+        super().delete(session_key)
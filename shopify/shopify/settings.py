@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     'graphene_django',
     'products',
     'shoppingCart',
+    'benchmarks',
 ]
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -65,15 +66,31 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'shopify.wsgi.application'
 
+# Threads handling requests in each process served by shopify.asgi, database connections per process grow with it
+ASGI_THREADS = 8
+
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # Stand-in read replica on the primary's file, point it at a real replica (e.g. a Postgres
+    # standby) in production. Tests mirror it to the primary's test database
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+# Queries read from a random alias of DATABASE_REPLICAS, mutations and sessions use the primary (default).
+# A session reads from the primary for DATABASE_REPLICA_STICKY_SECONDS after it mutates, to see its own writes
+DATABASE_ROUTERS = ['shopify.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+DATABASE_REPLICA_STICKY_SECONDS = 10
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -104,4 +121,114 @@ USE_TZ = True
 STATIC_URL = '/static/'
 GRAPHENE = {
     'SCHEMA': 'shopify.schema.schema',
+    'MIDDLEWARE': [
+        'shopify.instrumentation.TracingMiddleware',
+    ],
+}
+
+# Static limits checked before a query runs. Each object a field returns costs its weight (1 unless set in
+# FIELD_WEIGHTS), connection fields return first objects, KEY_ARGUMENTS fields one for each key they are
+# given and other lists LIST_SIZES or DEFAULT_LIST_SIZE
+GRAPHQL_COST = {
+    'MAX_DEPTH': 10,
+    'MAX_COST': 10000,
+    'DEFAULT_LIST_SIZE': 10,
+    'LIST_SIZES': {
+        'ShoppingCartType.items': 50,
+        'ShoppingCartType.lines': 50,
+    },
+    'FIELD_WEIGHTS': {
+        'Query.allShoppingCarts': 2,
+    },
+    'KEY_ARGUMENTS': {
+        'Query.products': ['ids', 'titles'],
+    },
+}
+
+# Per resolver timings and SQL counts. Requests sending HEADER: 1 get them in the response extensions,
+# LOG_SAMPLE_RATE of all requests are logged to the shopify.graphql.trace logger
+GRAPHQL_TRACE = {
+    'HEADER': 'X-GraphQL-Trace',
+    'LOG_SAMPLE_RATE': 0.0,
+}
+
+# Parsed and validated GraphQL documents kept in memory, keyed by query hash
+GRAPHQL_DOCUMENT_CACHE_SIZE = 256
+
+# GET queries of PUBLIC_FIELDS alone are the same for every session. They get a strong ETag of the catalog
+# version and may be kept by browsers and shared caches for MAX_AGE seconds (and served while they revalidate
+# for STALE_WHILE_REVALIDATE more), requests whose If-None-Match matches get a 304 without running the query.
+# LIVE_FIELDS change without the catalog version (availableCount moves with every hold), queries selecting
+# them are private
+GRAPHQL_HTTP_CACHE = {
+    'PUBLIC_FIELDS': ['Query.product', 'Query.products', 'Query.allProducts', 'Query.searchProducts'],
+    'LIVE_FIELDS': ['availableCount'],
+    'MAX_AGE': 60,
+    'STALE_WHILE_REVALIDATE': 30,
+}
+
+# With ENABLED, GraphQL responses of at least MIN_SIZE bytes are compressed for clients that accept it, with
+# brotli at BROTLI_QUALITY when the brotli package is installed and gzip at GZIP_LEVEL otherwise
+GRAPHQL_COMPRESSION = {
+    'ENABLED': False,
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+}
+
+# Cache for product query results, LRUResultCache keeps them in process, DjangoResultCache in CACHES.
+# Entries are keyed by the catalog version kept in CATALOG_VERSION_CACHE, which has to be shared
+# by all server processes for invalidation to reach them
+PRODUCT_RESULT_CACHE = {
+    'BACKEND': 'products.cache.LRUResultCache',
+    'OPTIONS': {'maxsize': 1024, 'ttl': 300},
+}
+CATALOG_VERSION_CACHE = 'default'
+
+# With ENABLED, product and allProducts queries read an in-process copy of every product instead of the db.
+# Each process patches its copy from the product changes logged in CATALOG_VERSION_CACHE for CHANGE_TTL
+# seconds, and reads the whole catalog again when it missed more than MAX_PATCH changes
+CATALOG_SNAPSHOT = {
+    'ENABLED': False,
+    'MAX_PATCH': 1000,
+    'CHANGE_TTL': 3600,
+}
+
+# Sessions are kept in the db. With a cache shared by all server processes (memcached, redis) configured as
+# SESSION_CACHE_ALIAS, set SESSION_ENGINE to 'shopify.sessions' to read sessions from the cache and write them
+# to the db in batches every SESSION_WRITE_BEHIND_INTERVAL seconds (see shopify.wsgi). Sessions missing from
+# the cache are read from the db, so existing db sessions keep working. The system check refuses the engine
+# with a local memory cache, where each process would keep its own sessions and lose the others' carts
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+SESSION_WRITE_BEHIND_INTERVAL = 5
+
+# With CART_ID_CACHE an empty cart only lives in the session, with an id from a counter in that cache, until the
+# first product is added to it. The cache has to be shared by all server processes so they don't hand out the
+# same ids, the system check refuses a local memory cache. With None carts are saved when they are created
+CART_ID_CACHE = None
+
+# Adding a product to a cart holds a unit of it for TTL seconds, server processes release expired holds
+# every SWEEP_INTERVAL seconds (or run manage.py sweepreservations)
+RESERVATIONS = {
+    'TTL': 900,
+    'SWEEP_INTERVAL': 30,
+}
+
+# Stock of products sharded with manage.py shardinventory is read as the sum of their shards, cached for
+# TOTAL_TTL seconds, and copied onto the product rows every SYNC_INTERVAL seconds for listings. Checkouts
+# pick another random shard up to RETRIES times when a concurrent checkout took the last unit of theirs
+INVENTORY_SHARDS = {
+    'TOTAL_TTL': 2,
+    'SYNC_INTERVAL': 10,
+    'RETRIES': 3,
+}
+
+# Deleting expired sessions and carts no live session points to, with manage.py purgecarts or every
+# INTERVAL seconds in each server process when set. Carts younger than GRACE seconds are kept. Needs a
+# SESSION_ENGINE keeping sessions in django_session, the purge can't see the others
+CART_PURGE = {
+    'INTERVAL': None,
+    'BATCH_SIZE': 1000,
+    'SLEEP': 0.1,
+    'GRACE': 3600,
 }
@@ -0,0 +1,551 @@
+import asyncio
+import gzip
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.core.wsgi import get_wsgi_application
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from products.cache import get_result_cache
+from products.catalog_files import upsert_batch
+from products.models import Product
+from shoppingCart.models import CartLine, Reservation, ShoppingCart, reserve
+from shoppingCart.purge import purge
+from shoppingCart.reservations import sweep_reservations
+from shopify.schema import schema
+from graphql.language.base import parse
+from .backend import query_hash
+from .cost import CostAnalysis
+from .encoding import accepted_encodings, dumps
+from .handlers import ASGIHandler
+from .periodic import PeriodicTask
+from .routers import ReplicaRouter, use_primary
+from .sessions import SessionStore, check_session_cache, flush_sessions, pending
+from .views import backend
+
+PRODUCT_QUERY = "query { product(id: 1) { title } }"
+
+class GraphQLViewTest(TestCase):
+    def setUp(self):
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        backend.documents.clear()
+        cache.clear()
+
+    def post(self, body):
+        return self.client.post("/", json.dumps(body), content_type="application/json")
+
+    def test_document_cache(self):
+        """ Repeated queries are parsed and validated once """
+
+        first = self.post({"query": PRODUCT_QUERY})
+        document = next(iter(backend.documents.values()))
+        second = self.post({"query": PRODUCT_QUERY})
+
+        self.assertEqual(first.json(), {"data": {"product": {"title": "FIFA 19"}}})
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(len(backend.documents), 1)
+        self.assertIs(next(iter(backend.documents.values())), document)
+
+    def test_invalid_document_cached(self):
+        """ Validation errors are kept with the cached document """
+
+        for i in range(2):
+            response = self.post({"query": "query { product(id: 1) { missing } }"})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("missing", response.json()["errors"][0]["message"])
+
+    def test_persisted_query(self):
+        """ Unknown hashes are reported, registered hashes replace the query text """
+
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": query_hash(PRODUCT_QUERY)}}
+
+        response = self.post({"extensions": extensions})
+        self.assertEqual(response.json(), {"errors": [{"message": "PersistedQueryNotFound"}]})
+
+        response = self.post({"query": PRODUCT_QUERY, "extensions": extensions})
+        self.assertEqual(response.json(), {"data": {"product": {"title": "FIFA 19"}}})
+
+        response = self.client.get("/", {"extensions": json.dumps(extensions)}, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json(), {"data": {"product": {"title": "FIFA 19"}}})
+
+    def test_persisted_query_hash_mismatch(self):
+        """ A query sent with another query's hash is rejected """
+
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": query_hash("query { allProducts { edges { cursor } } }")}}
+        response = self.post({"query": PRODUCT_QUERY, "extensions": extensions})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_graphiql(self):
+        """ graphiql shows the result of the query in the page as JSON text """
+
+        response = self.client.get("/graphiql/", {"query": PRODUCT_QUERY}, HTTP_ACCEPT="text/html")
+        content = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("response: '{\\u000A  \\u0022data\\u0022", content)
+        self.assertIn("\\u0022title\\u0022: \\u0022FIFA 19\\u0022", content)
+
+
+class GraphQLTraceTest(TestCase):
+    def setUp(self):
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        cache.clear()
+
+    def post(self, body, **extra):
+        return self.client.post("/", json.dumps(body), content_type="application/json", **extra)
+
+    def test_trace_extensions(self):
+        """ Requests with the trace header get resolver timings and SQL counts back """
+
+        response = self.post({"query": "query { allProducts { edges { node { title } } } }"}, HTTP_X_GRAPHQL_TRACE="1")
+        tracing = response.json()["extensions"]["tracing"]
+        resolvers = {resolver["field"]: resolver for resolver in tracing["resolvers"]}
+
+        self.assertEqual(tracing["sql"]["count"], 1)
+        self.assertEqual(resolvers["Query.allProducts"]["sql"]["count"], 1)
+        self.assertEqual(resolvers["ProductType.title"]["calls"], 1)
+
+        response = self.post({"query": "query { allProducts { edges { node { title } } } }"})
+        self.assertNotIn("extensions", response.json())
+
+    @override_settings(GRAPHQL_TRACE={"LOG_SAMPLE_RATE": 1.0})
+    def test_trace_log(self):
+        """ Sampled requests are logged without changing the response """
+
+        with self.assertLogs("shopify.graphql.trace", level="INFO") as logs:
+            response = self.post({"query": "query Product { product(id: 1) { title } }", "operationName": "Product"})
+
+        self.assertNotIn("extensions", response.json())
+        logged = json.loads(logs.records[0].getMessage())
+        resolvers = {resolver["field"]: resolver for resolver in logged["resolvers"]}
+        self.assertEqual(logged["operation"], "Product")
+        self.assertEqual(set(resolvers), {"Query.product", "ProductType.title"})
+        self.assertEqual(resolvers["Query.product"]["sql"]["count"], 1)
+
+    def test_trace_batched_resolvers(self):
+        """ Resolvers returning loader promises are charged the batch they wait on """
+
+        query = "query { first: product(id: 1) { title } second: product(title: \"FIFA 19\") { title } products(ids: [1]) { title } }"
+        response = self.post({"query": query}, HTTP_X_GRAPHQL_TRACE="1")
+        tracing = response.json()["extensions"]["tracing"]
+        resolvers = {resolver["field"]: resolver for resolver in tracing["resolvers"]}
+
+        self.assertEqual(tracing["sql"]["count"], 2)
+        self.assertEqual(resolvers["Query.product"]["calls"], 2)
+        # Both batches run while all three fields wait, each field is charged both
+        self.assertEqual(resolvers["Query.product"]["sql"]["count"], 4)
+        self.assertEqual(resolvers["Query.products"]["sql"]["count"], 2)
+        self.assertGreater(resolvers["Query.product"]["duration_ms"], 0)
+
+
+class GraphQLHTTPCacheTest(TestCase):
+    def setUp(self):
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        cache.clear()
+
+    def get(self, query, **extra):
+        return self.client.get("/", {"query": query}, HTTP_ACCEPT="application/json", **extra)
+
+    def test_public_query(self):
+        """ Product queries over GET are cacheable by anyone and don't set or vary on cookies """
+
+        response = self.get(PRODUCT_QUERY)
+
+        self.assertEqual(response.json(), {"data": {"product": {"title": "FIFA 19"}}})
+        self.assertRegex(response["ETag"], r'^"[0-9a-f]{32}"$')
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.assertFalse(response.cookies)
+        self.assertNotIn("Cookie", response.get("Vary", ""))
+        self.assertEqual(self.get(PRODUCT_QUERY)["ETag"], response["ETag"])
+        self.assertNotEqual(self.get("query { allProducts { edges { node { title } } } }")["ETag"], response["ETag"])
+
+    def test_not_modified(self):
+        """ A matching If-None-Match gets a 304 without running the query, until the catalog changes """
+
+        etag = self.get(PRODUCT_QUERY)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.get(PRODUCT_QUERY, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertIn("public", response["Cache-Control"])
+
+        Product.objects.filter(id=1).update(title="FIFA 20")
+        Product.objects.get(id=1).save()
+
+        response = self.get(PRODUCT_QUERY, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json(), {"data": {"product": {"title": "FIFA 20"}}})
+
+    def test_private_responses(self):
+        """ Session queries, queries of live fields, traced queries and POSTs are not stored by any cache """
+
+        responses = [
+            self.get("query { shoppingCart { id } product(id: 1) { title } }"),
+            self.get("query { product(id: 1) { title ... on ProductType { availableCount } } }"),
+            self.get(PRODUCT_QUERY, HTTP_X_GRAPHQL_TRACE="1"),
+            self.client.post("/", json.dumps({"query": PRODUCT_QUERY}), content_type="application/json"),
+        ]
+
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("ETag", response)
+            self.assertIn("no-store", response["Cache-Control"])
+            self.assertIn("private", response["Cache-Control"])
+
+    def test_mutation_over_get(self):
+        """ Mutations still have to be POSTed """
+
+        response = self.get("mutation { createCart(items: [1]) { cart { id } } }")
+
+        self.assertEqual(response.status_code, 405)
+        self.assertNotIn("ETag", response)
+
+
+class GraphQLEncodingTest(TestCase):
+    def setUp(self):
+        Product.objects.bulk_create(Product(id=i, title=f"Product {i}", price="29.99", inventory_count=5) for i in range(1, 51))
+        cache.clear()
+
+    def get(self, query, **extra):
+        return self.client.get("/", {"query": query}, HTTP_ACCEPT="application/json", **extra)
+
+    def test_dumps(self):
+        """ Decimals are written as numbers, pretty output sorts keys and values orjson can't encode still are """
+
+        self.assertEqual(json.loads(dumps({"price": Decimal("29.99"), "title": "FIFA 19"})), {"price": 29.99, "title": "FIFA 19"})
+        self.assertEqual(dumps({"b": 1, "a": [2]}, pretty=True).decode(), '{\n  "a": [\n    2\n  ],\n  "b": 1\n}')
+        self.assertEqual(dumps({"big": 2 ** 70}), b'{"big":1180591620717411303424}')
+
+        with self.assertRaises(TypeError):
+            dumps({"product": Product(id=1)})
+
+    def test_accepted_encodings(self):
+        """ Codings are read with their q values """
+
+        request = self.client.get("/").wsgi_request
+        request.META["HTTP_ACCEPT_ENCODING"] = "gzip;q=0.5, br ;q=0, *"
+
+        self.assertEqual(accepted_encodings(request), {"gzip": 0.5, "br": 0.0, "*": 1.0})
+
+    @override_settings(GRAPHQL_COMPRESSION={"ENABLED": True, "MIN_SIZE": 1024})
+    def test_compressed_response(self):
+        """ Large responses are compressed for clients accepting gzip and keep an ETag of their own """
+
+        query = "query { allProducts { edges { node { id title price } } } }"
+        plain = self.get(query)
+        compressed = self.get(query, HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+        self.assertLess(len(compressed.content), len(plain.content))
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed["ETag"], plain["ETag"])
+
+        response = self.get(query, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=compressed["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        refused = self.get(query, HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertNotIn("Content-Encoding", refused)
+
+        small = self.get(PRODUCT_QUERY, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertNotIn("Content-Encoding", small)
+        self.assertIn("Accept-Encoding", small["Vary"])
+
+    def test_compression_off(self):
+        """ Responses aren't compressed or varied on Accept-Encoding unless compression is enabled """
+
+        response = self.get("query { allProducts { edges { node { id title price } } } }", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertNotIn("Content-Encoding", response)
+        self.assertNotIn("Accept-Encoding", response.get("Vary", ""))
+
+
+class GraphQLCostTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def cost(self, query, variables=None):
+        document = parse(query)
+        return CostAnalysis(schema, document, variables).operation_cost(document.definitions[0])
+
+    def test_cost_multiplies_lists(self):
+        """ Nested list fields pay for every parent object """
+
+        query = """
+            query Carts($first: Int)
+            {
+                allShoppingCarts(first: $first) { edges { node { id items { ...item } } } }
+            }
+            fragment item on ProductType { id title }
+        """
+
+        self.assertEqual(self.cost(query, {"first": 10}), (5, 10 * 2 + 10 * 50))
+        self.assertEqual(self.cost(query), (5, 100 * 2 + 100 * 50))
+        self.assertEqual(self.cost("query { product(id: 1) { id } }"), (2, 1))
+        self.assertEqual(self.cost("query Products($ids: [Int!]) { products(ids: $ids, titles: [\"FIFA 19\"]) { id } }", {"ids": [1, 2, 3]}), (2, 4))
+
+    @override_settings(GRAPHQL_COST={"MAX_DEPTH": 10, "MAX_COST": 5000, "LIST_SIZES": {"ShoppingCartType.items": 50}})
+    def test_expensive_query_rejected(self):
+        """ Queries over the cost budget are rejected before they run """
+
+        query = "query { allShoppingCarts { edges { node { items { id } } } } }"
+
+        with self.assertNumQueries(0):
+            response = self.client.post("/", json.dumps({"query": query}), content_type="application/json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"errors": [{"message": "Query cost 5100 exceeds the maximum cost of 5000"}]})
+
+        query = "query { allShoppingCarts(first: 10) { edges { node { items { id } } } } }"
+        response = self.client.post("/", json.dumps({"query": query}), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(GRAPHQL_COST={"MAX_DEPTH": 3})
+    def test_deep_query_rejected(self):
+        """ Queries nested deeper than the maximum depth are rejected """
+
+        query = "query { allProducts { edges { node { id } } } }"
+        response = self.client.post("/", json.dumps({"query": query}), content_type="application/json")
+
+        self.assertEqual(response.json(), {"errors": [{"message": "Query depth 4 exceeds the maximum depth of 3"}]})
+
+@override_settings(SESSION_ENGINE="shopify.sessions")
+class SessionStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        pending.clear()
+
+    def test_write_behind(self):
+        """ Sessions are saved and loaded without queries and written to the db when flushed """
+
+        with self.assertNumQueries(0):
+            session = SessionStore()
+            session["cartId"] = 1
+            session.save()
+            self.assertEqual(SessionStore(session.session_key)["cartId"], 1)
+
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(flush_sessions(), 1)
+        self.assertEqual(flush_sessions(), 0)
+
+        session["cartId"] = 2
+        session.save()
+        flush_sessions()
+        cache.clear()
+
+        self.assertEqual(SessionStore(session.session_key)["cartId"], 2)
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_db_sessions_carry_over(self):
+        """ Sessions saved by the db engine are read from the db once, then from the cache """
+
+        session = DBStore()
+        session["cartId"] = 3
+        session.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(SessionStore(session.session_key)["cartId"], 3)
+            self.assertEqual(SessionStore(session.session_key)["cartId"], 3)
+
+    def test_request_without_session_queries(self):
+        """ A request carrying a session cookie doesn't query the db for its session """
+
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        self.client.post("/", json.dumps({"query": "mutation { createCart(items: [1]) { cart { id } } }"}), content_type="application/json")
+        self.assertIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+        with self.assertNumQueries(1):
+            response = self.client.post("/", json.dumps({"query": "query { shoppingCart { id } }"}), content_type="application/json")
+        self.assertIsNotNone(response.json()["data"]["shoppingCart"]["id"])
+
+    def test_shared_cache_check(self):
+        """ The system check refuses the engine with a local memory cache only """
+
+        self.assertEqual([error.id for error in check_session_cache(None)], ["shopify.E001"])
+
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "sessions"}}):
+            self.assertEqual(check_session_cache(None), [])
+
+        with override_settings(SESSION_ENGINE="django.contrib.sessions.backends.db"):
+            self.assertEqual(check_session_cache(None), [])
+
+class PeriodicTaskTest(TestCase):
+    def test_run_on_stop(self):
+        """ Stopping runs the function a last time only with runOnStop """
+
+        calls = []
+        PeriodicTask(lambda: calls.append("flush"), 3600).start().stop()
+        PeriodicTask(lambda: calls.append("purge"), 3600, runOnStop=False).start().stop()
+
+        self.assertEqual(calls, ["flush"])
+
+class ASGIHandlerTest(TransactionTestCase):
+    def setUp(self):
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        cache.clear()
+
+    def test_request(self):
+        """ Requests sent in several chunks are served by the WSGI application on the thread pool """
+
+        handler = ASGIHandler(get_wsgi_application(), 2)
+        body = json.dumps({"query": PRODUCT_QUERY}).encode()
+        messages = [
+            {"type": "http.request", "body": body[:10], "more_body": True},
+            {"type": "http.request", "body": body[10:]},
+        ]
+        sent = []
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": "/",
+            "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+        }
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        try:
+            asyncio.run(handler(scope, receive, send))
+        finally:
+            handler.executor.shutdown(wait=True)
+
+        self.assertEqual(sent[0]["status"], 200)
+        self.assertIn((b"content-type", b"application/json"), sent[0]["headers"])
+        self.assertEqual(json.loads(sent[1]["body"]), {"data": {"product": {"title": "FIFA 19"}}})
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRouterTest(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+        cache.clear()
+
+    def post(self, query):
+        with CaptureQueriesContext(connections["default"]) as primary, CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.post("/", json.dumps({"query": query}), content_type="application/json")
+
+        self.assertNotIn("errors", response.json())
+        return len(primary), len(replica)
+
+    def test_routing(self):
+        """ Queries read from the replica, mutations and the session's next queries from the primary. Product
+            results cached under the catalog version are computed on the primary """
+
+        primary, replica = self.post("query { allShoppingCarts { edges { node { id } } } }")
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+        primary, replica = self.post("query { allProducts { edges { node { id } } } }")
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        primary, replica = self.post("mutation { createCart(items: [1]) { cart { id total } } }")
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        primary, replica = self.post("query { shoppingCart { id items { id } } }")
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_router(self):
+        """ Sessions always read from the primary, other models unless reads are pinned """
+
+        router = ReplicaRouter()
+
+        self.assertEqual(router.db_for_read(Product), "replica")
+        self.assertEqual(router.db_for_read(Session), "default")
+        self.assertEqual(router.db_for_write(Product), "default")
+
+        with use_primary():
+            self.assertEqual(router.db_for_read(Product), "default")
+
+
+@override_settings(DATABASE_REPLICAS=["lagging"])
+class PrimaryReadsTest(TestCase):
+    """ Jobs that read what they are about to write, and results kept under the catalog version, read
+        the primary. The replica of these tests is an empty database, any read routed to it fails """
+
+    def setUp(self):
+        connections.databases["lagging"] = {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}
+        self.addCleanup(self.drop_replica)
+        Product.objects.create(id=1, title="FIFA 19", price="29.99", inventory_count=5)
+
+    def drop_replica(self):
+        connections["lagging"].close()
+        del connections.databases["lagging"]
+        delattr(connections._connections, "lagging")
+
+    def test_import(self):
+        """ Imported products matching a title update it instead of being created again """
+
+        self.assertEqual(upsert_batch([("FIFA 19", Decimal("19.99"), 3), ("Fallout 4", Decimal("39.99"), 5)]), (1, 1))
+        with use_primary():
+            self.assertEqual(Product.objects.count(), 2)
+
+    def test_check_cart_totals(self):
+        """ Drifted totals are fixed from the primary's lines """
+
+        cart = ShoppingCart.objects.create(id=1, total=0)
+        CartLine.objects.create(cart=cart, product_id=1, quantity=2)
+
+        call_command("checkcarttotals", "--fix", stdout=StringIO())
+        with use_primary():
+            self.assertEqual(ShoppingCart.objects.get(id=1).total, Decimal("59.98"))
+
+    def test_purge(self):
+        """ Orphaned carts are found on the primary """
+
+        ShoppingCart.objects.create(id=1, total=0)
+
+        self.assertEqual(purge(sleep=0, grace=timedelta(0)).carts, 1)
+        with use_primary():
+            self.assertFalse(ShoppingCart.objects.exists())
+
+    def test_sweep_reservations(self):
+        """ Expired holds claimed by the sweeper give their units back """
+
+        cart = ShoppingCart.objects.create(id=1, total=0)
+        with use_primary():
+            reserve(cart, {Product.objects.get(id=1): 2})
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(sweep_reservations(), 2)
+        with use_primary():
+            self.assertEqual(Product.objects.get(id=1).reserved_count, 0)
+
+    def test_cached_results(self):
+        """ Product results cached under the catalog version are read from the primary """
+
+        get_result_cache().clear()
+        result = schema.execute("query { product(id: 1) { inventoryCount } allProducts { edges { node { title } } } }")
+
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["product"], {"inventoryCount": 5})
+        self.assertEqual(result.data["allProducts"]["edges"], [{"node": {"title": "FIFA 19"}}])
+
+    def test_public_get(self):
+        """ Public responses tagged with the catalog version are read from the primary """
+
+        get_result_cache().clear()
+        response = self.client.get("/", {"query": "{ product(id: 1) { inventoryCount } }"}, HTTP_ACCEPT="application/json")
+
+        self.assertTrue(response.has_header("ETag"))
+        self.assertEqual(response.json(), {"data": {"product": {"inventoryCount": 5}}})
@@ -0,0 +1,214 @@
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.http.response import HttpResponseBadRequest
+from django.utils.cache import get_conditional_response
+from graphene_django.views import GraphQLView as BaseGraphQLView, HttpError
+from graphql.execution import ExecutionResult
+from .backend import LRUCachedBackend, query_hash
+from .cost import check_cost
+from .encoding import compress_response, dumps, response_encoding
+from .httpcache import catalog_etag, patch_private, patch_public, public_operation
+from .instrumentation import RequestTrace, trace_requested, trace_sampled
+from .routers import pin_session, session_pinned, use_primary
+
+PERSISTED_QUERY_PREFIX = "persisted-query:"
+
+backend = LRUCachedBackend(maxsize=getattr(settings, "GRAPHQL_DOCUMENT_CACHE_SIZE", 256))
+
+# The base dispatch sets the CSRF cookie graphiql needs, public responses mustn't set cookies or vary on them
+dispatch_without_csrf_cookie = BaseGraphQLView.dispatch.__wrapped__
+
+def persist_query(query):
+    """ Registers a query so clients can send its sha256 hash instead of the query text """
+
+    sha256Hash = query_hash(query)
+    cache.set(PERSISTED_QUERY_PREFIX + sha256Hash, query, timeout=None)
+    return sha256Hash
+
+class GraphQLView(BaseGraphQLView):
+    """ GraphQL endpoint with cached parsing and validation, and automatic persisted queries.
+
+        A client may send extensions.persistedQuery.sha256Hash without a query, if the hash is
+        unknown it gets a PersistedQueryNotFound error and retries with both the hash and the query.
+        Operations over the depth or cost limits of GRAPHQL_COST are rejected before they run.
+        Mutations, and every operation of a session for a while after it mutated, read from the primary db.
+        Traced requests (see shopify.instrumentation) return resolver timings in the response extensions.
+        GET queries of GRAPHQL_HTTP_CACHE['PUBLIC_FIELDS'] alone don't touch the session and can be cached
+        by proxies under an ETag of the catalog version, a matching If-None-Match gets a 304 without running
+        the query. Every other response is private and not stored. Responses are encoded with orjson when it
+        is installed, and compressed above a size with GRAPHQL_COMPRESSION """
+
+    def get_backend(self, request):
+        return backend
+
+    def dispatch(self, request, *args, **kwargs):
+        etag = self.public_etag(request)
+
+        if etag is None:
+            response = super().dispatch(request, *args, **kwargs)
+            patch_private(response)
+            return compress_response(request, response)
+
+        request.graphql_etag = etag
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = dispatch_without_csrf_cookie(self, request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            patch_public(response, etag)
+        else:
+            patch_private(response)
+
+        return compress_response(request, response)
+
+    def public_etag(self, request):
+        """ ETag of a GET request for a public query, None for requests whose response can't be shared """
+
+        if request.method != "GET" or self.batch or trace_requested(request):
+            return None
+
+        try:
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return None
+
+            query, variables, operation_name, id = self.get_graphql_params(request, data)
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            # The request runs the usual way and reports the error
+            return None
+
+        if not public_operation(self.schema, document.document_ast, operation_name):
+            return None
+
+        return catalog_etag(query, variables, operation_name, request.GET.get("pretty"), response_encoding(request))
+
+    def json_encode(self, request, d, pretty=False):
+        content = dumps(d, pretty=self.pretty or pretty or bool(request.GET.get("pretty")))
+
+        # The base dispatch joins batched responses as text
+        return content.decode("utf-8") if self.batch else content
+
+    def render_graphiql(self, request, **data):
+        # graphiql shows the result of the query in the page as text
+        if isinstance(data.get("result"), bytes):
+            data["result"] = data["result"].decode("utf-8")
+
+        return super().render_graphiql(request, **data)
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        document = None
+
+        if query:
+            try:
+                document = self.get_backend(request).document_from_string(self.schema, query)
+            except Exception:
+                document = None
+
+            costError = document and check_cost(self.schema, document.document_ast, operation_name, variables)
+            if costError:
+                return ExecutionResult(errors=[costError], invalid=True)
+
+        # Public queries read the same data for every session, they don't look at it. Their responses are
+        # tagged with the current catalog version, so they read the primary rather than a replica behind it
+        public = bool(getattr(request, "graphql_etag", None))
+        session = None if public else getattr(request, "session", None)
+        mutation = document is not None and document.get_operation_type(operation_name) == "mutation"
+
+        with use_primary(public or mutation or (session is not None and session_pinned(session))):
+            result = self.execute_traced(request, data, query, variables, operation_name, show_graphiql)
+
+        if mutation and session is not None:
+            pin_session(session)
+
+        return result
+
+    def execute_traced(self, request, data, query, variables, operation_name, show_graphiql=False):
+        requested = trace_requested(request)
+        sampled = trace_sampled()
+
+        if not (requested or sampled):
+            return super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+        trace = RequestTrace()
+        request.graphql_trace = trace
+        result = trace.run(lambda: super(GraphQLView, self).execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        ))
+
+        if sampled:
+            trace.log(operation_name)
+        if requested:
+            request.graphql_extensions = {"tracing": trace.as_dict()}
+
+        return result
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+
+        if not execution_result:
+            return None, 200
+
+        status_code = 200
+        response = {}
+
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+        if execution_result.invalid:
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+
+        extensions = getattr(request, "graphql_extensions", None)
+        if extensions:
+            response["extensions"] = extensions
+
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return self.json_encode(request, response, pretty=show_graphiql), status_code
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        persistedQuery = self.get_extensions(request, data).get("persistedQuery")
+
+        if not persistedQuery:
+            return query, variables, operation_name, id
+
+        sha256Hash = persistedQuery.get("sha256Hash")
+
+        if persistedQuery.get("version") != 1 or not sha256Hash:
+            raise HttpError(HttpResponseBadRequest("Unsupported persisted query version."))
+
+        if query:
+            if query_hash(query) != sha256Hash:
+                raise HttpError(HttpResponseBadRequest("Provided sha256Hash does not match query."))
+            cache.set(PERSISTED_QUERY_PREFIX + sha256Hash, query, timeout=None)
+            return query, variables, operation_name, id
+
+        query = cache.get(PERSISTED_QUERY_PREFIX + sha256Hash)
+        if query is None:
+            raise HttpError(HttpResponse(status=200), "PersistedQueryNotFound")
+
+        return query, variables, operation_name, id
+
+    @staticmethod
+    def get_extensions(request, data):
+        extensions = request.GET.get("extensions") or data.get("extensions") or {}
+
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+
+        if not isinstance(extensions, dict):
+            raise HttpError(HttpResponseBadRequest("Extensions must be a JSON object."))
+
+        return extensions
@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopify.settings')
 
 application = get_wsgi_application()
+
+from products.inventory import start_inventory_sync
+from shoppingCart.purge import start_purge_scheduler
+from shoppingCart.reservations import start_reservation_sweeper
+from .sessions import start_session_flusher
+
+start_session_flusher()
+start_purge_scheduler()
+start_reservation_sweeper()
+start_inventory_sync()
@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class ShoppingcartConfig(AppConfig):
     name = 'shoppingCart'
+
+    def ready(self):
+        # Carts live in sessions, a session engine losing them between processes loses the carts
+        from shopify.sessions import check_session_cache
+        from .purge import check_purge_sessions
+        from .schema import check_cart_id_cache
+        checks.register(check_session_cache, checks.Tags.caches)
+        checks.register(check_cart_id_cache, checks.Tags.caches)
+        checks.register(check_purge_sessions)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import DecimalField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from shopify.routers import use_primary
+from shoppingCart.models import CartLine, ShoppingCart, line_price
+
+class Command(BaseCommand):
+    """ Finds shopping carts whose stored total drifted from the prices and quantities of their lines """
+
+    help = "Compares every cart total with the SQL sum of its line prices times quantities, --fix rewrites drifted totals"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Rewrite the total of drifted carts")
+
+    def handle(self, *args, **options):
+        # Totals are compared with the primary's lines, --fix would write totals a lagging replica computed
+        with use_primary():
+            self.check_totals(options["fix"])
+
+    def check_totals(self, fix):
+        lines = CartLine.objects.filter(cart_id=OuterRef("pk")).values("cart_id")
+        itemsTotal = lines.annotate(expected=line_price()).values("expected")
+        expected = Coalesce(Subquery(itemsTotal), Value(0), output_field=DecimalField(decimal_places=2, max_digits=100))
+
+        drifted = 0
+        carts = ShoppingCart.objects.annotate(expected=expected).values_list("id", "total", "expected")
+
+        for cartId, total, expectedTotal in carts.iterator():
+            if total == expectedTotal:
+                continue
+
+            drifted = drifted + 1
+            self.stdout.write(f"Shopping Cart: {cartId}, total: {total}, expected: {expectedTotal}")
+
+            if fix:
+                ShoppingCart.objects.filter(id=cartId).update(total=expectedTotal)
+
+        if fix:
+            self.stdout.write(f"Fixed {drifted} drifted cart totals")
+        else:
+            self.stdout.write(f"Found {drifted} drifted cart totals")
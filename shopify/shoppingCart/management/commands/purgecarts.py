@@ -0,0 +1,22 @@
+from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from shoppingCart.purge import purge
+
+class Command(BaseCommand):
+    """ Deletes expired sessions and the carts no live session points to """
+
+    help = "Deletes expired sessions, then orphaned carts and their items in batches with a pause between batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows deleted per transaction")
+        parser.add_argument("--sleep", type=float, default=0.1, help="Seconds to pause between batches")
+        parser.add_argument("--grace", type=int, default=3600, help="Seconds a new cart is kept before it can be purged")
+
+    def handle(self, *args, **options):
+        try:
+            stats = purge(options["batch_size"], options["sleep"], timedelta(seconds=options["grace"]))
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+
+        self.stdout.write(str(stats))
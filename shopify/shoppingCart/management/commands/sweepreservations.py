@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from shoppingCart.reservations import sweep_reservations
+
+class Command(BaseCommand):
+    """ Gives the units held by expired cart reservations back to stock """
+
+    help = "Releases every expired cart reservation in bulk"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Released {sweep_reservations()} reserved units")
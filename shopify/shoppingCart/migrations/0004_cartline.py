@@ -0,0 +1,47 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_inventory_shards'),
+        ('shoppingCart', '0003_reservation'),
+    ]
+
+    operations = [
+        # The lines are the rows of the existing many to many table, only the state learns about the model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='CartLine',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('cart', models.ForeignKey(db_column='shoppingcart_id', on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='shoppingCart.ShoppingCart')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_lines', to='products.Product')),
+                    ],
+                    options={
+                        'db_table': 'shoppingCart_shoppingcart_items',
+                        'unique_together': {('cart', 'product')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='shoppingcart',
+                    name='items',
+                    field=models.ManyToManyField(related_name='_shoppingcart_items_+', through='shoppingCart.CartLine', to='products.Product'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cartline',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
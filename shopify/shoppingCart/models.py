@@ -1,23 +1,347 @@
-from django.db import models
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Sum, Value, When
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from products.catalog import bump_version
+from products.inventory import release_units, take_units
 from products.models import Product
 
+# Whether the carts being deleted had their holds released together beforehand
+cartsReleased = ContextVar("cartsReleased", default=False)
+
+class InventoryChanged(Exception):
+    """ Raised when stock of a cart item changed while the cart was being checked out """
+
+def per_product(units):
+    """ SQL expression for the units of each product of a {product id: units} dict, for queries restricted to
+        those products. A constant when every product has the same units, as for carts of single units """
+
+    counts = set(units.values())
+    if len(counts) == 1:
+        return Value(counts.pop(), output_field=IntegerField())
+
+    return Case(
+        *[When(id=productId, then=Value(count)) for productId, count in units.items()],
+        default=Value(0), output_field=IntegerField(),
+    )
+
+def line_price():
+    """ Sum of price times quantity over cart lines """
+
+    return Sum(F("product__price") * F("quantity"), output_field=DecimalField(decimal_places=2, max_digits=100))
+
 class ShoppingCart(models.Model):
     """ Shopping Cart entity """
 
     id = models.AutoField(primary_key=True)
-    items = models.ManyToManyField(Product, related_name='+')
+    items = models.ManyToManyField(Product, through="CartLine", related_name='+')
     total = models.DecimalField(decimal_places=2, max_digits=100)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     def calcTotal(self, **kwargs):
-        """ Calculate total cost of products in shopping cart """
+        """ Recalculate total cost of products in shopping cart with a single SQL SUM """
+
+        total = CartLine.objects.filter(cart_id=self.id).aggregate(total=line_price())["total"]
+
+        self.total = total or 0
+        self.save(update_fields=["total"])
+
+    def adjustTotal(self, delta):
+        """ Shift total cost of shopping cart by delta without reading its items """
+
+        ShoppingCart.objects.filter(id=self.id).update(total=F("total") + delta)
+        self.total = self.total + delta
+
+    def updateItems(self, quantities, add=False, replace=False):
+        """ Sets the quantity of every product id in quantities, 0 removes the product. With add the quantities
+            are added to the ones in the cart, with replace products missing from quantities are removed.
+            Stock of all the products is checked and held together, lines are written in bulk and the total
+            moves once, so the queries don't grow with the number of products. Returns the products whose
+            quantity couldn't be raised for lack of stock, they keep their old quantity """
+
+        with transaction.atomic():
+            lines = {line.product_id: line for line in CartLine.objects.filter(cart_id=self.id)}
+            current = {productId: line.quantity for productId, line in lines.items()}
+
+            targets = {productId: quantity + (current.get(productId, 0) if add else 0) for productId, quantity in quantities.items()}
+            if replace:
+                targets.update({productId: 0 for productId in lines if productId not in targets})
+
+            changed = {productId: quantity for productId, quantity in targets.items() if quantity != current.get(productId, 0)}
+            if not changed:
+                return []
+
+            products = Product.objects.in_bulk(list(changed))
+            missing = [str(productId) for productId in changed if productId not in products]
+            if missing:
+                raise Product.DoesNotExist(f"No products with ids {', '.join(missing)}")
+
+            # Lowered lines give their hold back and take it again at the new quantity
+            lowered = [productId for productId, quantity in changed.items() if quantity < current.get(productId, 0)]
+            if lowered:
+                release(Reservation.objects.filter(cart_id=self.id, product_id__in=lowered))
+
+            wanted = {products[productId]: quantity for productId, quantity in changed.items() if quantity > 0}
+            held = reserve(self, wanted) if wanted else {}
+
+            failed = [
+                products[productId] for productId, quantity in changed.items()
+                if quantity > current.get(productId, 0) and held.get(productId, 0) < quantity
+            ]
+            failedIds = set(product.id for product in failed)
+            applied = {productId: quantity for productId, quantity in changed.items() if productId not in failedIds}
 
-        total = 0
-        for product in self.items.all():
-            total = total + product.price
-        
-        self.total = total
-        self.save()
+            CartLine.objects.bulk_create(
+                CartLine(cart_id=self.id, product_id=productId, quantity=quantity)
+                for productId, quantity in applied.items() if quantity > 0 and productId not in lines
+            )
+
+            toUpdate = [lines[productId] for productId, quantity in applied.items() if quantity > 0 and productId in lines]
+            for line in toUpdate:
+                line.quantity = applied[line.product_id]
+            CartLine.objects.bulk_update(toUpdate, ["quantity"])
+
+            removed = [productId for productId, quantity in applied.items() if quantity == 0]
+            if removed:
+                CartLine.objects.filter(cart_id=self.id, product_id__in=removed).delete()
+
+            delta = sum(((quantity - current.get(productId, 0)) * products[productId].price for productId, quantity in applied.items()), 0)
+            if delta:
+                self.adjustTotal(delta)
+
+        return failed
+
+    def checkout(self):
+        """ Takes the quantity of every line out of stock and removes the sold lines in one transaction,
+            returns the products whose lines stay in the cart for lack of stock. Units the cart holds a
+            reservation for are used up, the rest of a line needs units nobody holds """
+
+        with transaction.atomic():
+            held = claim(Reservation.objects.filter(cart_id=self.id))
+            products = list(Product.objects.filter(cart_lines__cart_id=self.id).annotate(quantity=F("cart_lines__quantity")).order_by("id"))
+
+            # Sharded products take their units from shards, only the rows that count stock are locked
+            locked = Product.objects.select_for_update().in_bulk([product.id for product in products if not product.shard_count])
+            for product in products:
+                if product.id in locked:
+                    locked[product.id].quantity = product.quantity
+            products = [locked.get(product.id, product) for product in products]
+
+            reserved = {product.id: min(held.get(product.id, 0), product.quantity) for product in products}
+            sold = []
+
+            for product in products:
+                free = product.quantity - reserved[product.id]
+
+                if product.shard_count:
+                    inStock = take_units(product.id, reserved=reserved[product.id], free=free)
+                else:
+                    inStock = product.inventory_count - product.reserved_count >= free
+
+                if inStock:
+                    sold.append(product)
+
+            soldRows = [product for product in sold if not product.shard_count]
+            soldIds = set(product.id for product in sold)
+            failed = [product for product in products if product.id not in soldIds]
+
+            if soldRows:
+                free = per_product({product.id: product.quantity - reserved[product.id] for product in soldRows})
+                updated = Product.objects.filter(
+                    id__in=[product.id for product in soldRows], shard_count=0, inventory_count__gte=F("reserved_count") + free
+                ).update(
+                    inventory_count=F("inventory_count") - per_product({product.id: product.quantity for product in soldRows}),
+                    reserved_count=F("reserved_count") - per_product({product.id: reserved[product.id] for product in soldRows}),
+                )
+
+                if updated != len(soldRows):
+                    raise InventoryChanged(f"Inventory changed while completing shopping cart {self.id}")
+
+            # Units held for lines that didn't sell, or beyond the quantity of a line, go back to stock
+            unused = {productId: units - reserved.get(productId, 0) for productId, units in held.items()}
+            unused.update({product.id: held.get(product.id, 0) for product in failed})
+            unused = {productId: units for productId, units in unused.items() if units > 0}
+            if unused:
+                release_held(unused)
+
+            if held:
+                Reservation.objects.filter(claim=held.token).delete()
+
+            if sold:
+                bump_version([product.id for product in sold])
+                CartLine.objects.filter(cart_id=self.id, product_id__in=[product.id for product in sold]).delete()
+                self.adjustTotal(-sum(product.price * product.quantity for product in sold))
+
+        return failed
 
     def __str__(self):
         return f"Shopping Cart: {self.id}, items: {len(self.items.all())}, total: {self.total}"
 
+class CartLine(models.Model):
+    """ A product in a cart and the units of it the cart wants. Kept in the table of the plain many to many
+        relation the cart used to have, so its column is still named shoppingcart_id """
+
+    cart = models.ForeignKey(ShoppingCart, on_delete=models.CASCADE, related_name="lines", db_column="shoppingcart_id")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="cart_lines")
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        db_table = "shoppingCart_shoppingcart_items"
+        unique_together = [("cart", "product")]
+
+class Reservation(models.Model):
+    """ Units of a product held for a cart until expires_at. The units are counted in Product.reserved_count
+        from reserve until the reservation is claimed and released or used up by checkout """
+
+    cart = models.ForeignKey(ShoppingCart, on_delete=models.CASCADE, related_name="reservations")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    quantity = models.PositiveIntegerField(default=1)
+    expires_at = models.DateTimeField(db_index=True)
+    claim = models.CharField(max_length=32, null=True, db_index=True)
+
+    class Meta:
+        unique_together = [("cart", "product")]
+
+class Claimed(dict):
+    """ Units per product of the reservations taken by one claim """
+
+    def __init__(self, token, units):
+        super().__init__(units)
+        self.token = token
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, "RESERVATIONS", {}).get("TTL", 900))
+
+def reserve(cart, wanted):
+    """ Holds units of products for a saved cart, wanted maps each product to the units the cart should hold.
+        Holds the cart already has are extended, a product whose missing units aren't all available keeps the
+        hold it had. Returns the units held for every product with a hold """
+
+    expiresAt = timezone.now() + reservation_ttl()
+    products = {product.id: product for product in wanted}
+    targets = {product.id: units for product, units in wanted.items()}
+
+    with transaction.atomic(savepoint=False):
+        holds = {
+            reservation.product_id: reservation
+            for reservation in Reservation.objects.select_for_update().filter(cart_id=cart.id, product_id__in=list(products), claim__isnull=True)
+        }
+        missing = {productId: units - (holds[productId].quantity if productId in holds else 0) for productId, units in targets.items()}
+        missing = {productId: units for productId, units in missing.items() if units > 0}
+        taken = {}
+
+        free = [productId for productId in missing if not products[productId].shard_count]
+        if free:
+            stock = Product.objects.select_for_update().filter(id__in=free, shard_count=0).values_list("id", "inventory_count", "reserved_count")
+            taken = {productId: missing[productId] for productId, inventory, reserved in stock if inventory - reserved >= missing[productId]}
+
+            if taken:
+                updated = Product.objects.filter(
+                    id__in=list(taken), shard_count=0, inventory_count__gte=F("reserved_count") + per_product(taken)
+                ).update(reserved_count=F("reserved_count") + per_product(taken))
+
+                if updated != len(taken):
+                    raise InventoryChanged(f"Inventory changed while reserving items for shopping cart {cart.id}")
+
+        taken.update({
+            productId: units for productId, units in missing.items()
+            if products[productId].shard_count and take_units(productId, hold=units)
+        })
+
+        Reservation.objects.bulk_create(
+            Reservation(cart_id=cart.id, product_id=productId, quantity=units, expires_at=expiresAt)
+            for productId, units in taken.items() if productId not in holds
+        )
+
+        for reservation in holds.values():
+            reservation.quantity = reservation.quantity + taken.get(reservation.product_id, 0)
+            reservation.expires_at = expiresAt
+        Reservation.objects.bulk_update(list(holds.values()), ["quantity", "expires_at"])
+
+    held = {productId: reservation.quantity for productId, reservation in holds.items()}
+    held.update({productId: units for productId, units in taken.items() if productId not in holds})
+    return held
+
+def claim(reservations):
+    """ Takes the unclaimed reservations of a queryset with a single conditional update, so concurrent
+        releases and checkouts never act on the same reservation twice. Returns units per product """
+
+    token = uuid.uuid4().hex
+
+    if not reservations.filter(claim__isnull=True).update(claim=token):
+        return Claimed(token, {})
+
+    units = Reservation.objects.filter(claim=token).values_list("product_id").annotate(units=Sum("quantity"))
+    return Claimed(token, units)
+
+def release(reservations):
+    """ Gives the units held by the reservations of a queryset back to stock and deletes the reservations,
+        one update for every product. Returns the number of units released """
+
+    with transaction.atomic(savepoint=False):
+        held = claim(reservations)
+
+        if held:
+            release_held(held)
+            Reservation.objects.filter(claim=held.token).delete()
+
+    return sum(held.values())
+
+def release_held(held):
+    """ Gives the units of a claim back to stock, one update for every unsharded product and the shards
+        of sharded products """
+
+    updated = Product.objects.filter(id__in=held, shard_count=0).update(reserved_count=F("reserved_count") - per_product(held))
+
+    if updated < len(held):
+        for productId in Product.objects.filter(id__in=held, shard_count__gt=0).values_list("id", flat=True):
+            release_units(productId, held[productId])
+
+@contextmanager
+def deleting_carts(cartIds):
+    """ Releases the holds of cartIds with one release for a block deleting those carts, instead of one
+        release for every cart deleted """
+
+    release(Reservation.objects.filter(cart_id__in=cartIds))
+    token = cartsReleased.set(True)
+    try:
+        yield
+    finally:
+        cartsReleased.reset(token)
+
+@receiver(pre_delete, sender=ShoppingCart)
+def releaseCartReservations(sender, instance, **kwargs):
+    """ Deleted carts give their reserved units back, unless they were released together by deleting_carts """
+
+    if not cartsReleased.get():
+        release(Reservation.objects.filter(cart_id=instance.id))
+
+@receiver(m2m_changed, sender=CartLine)
+def updateCartTotal(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Keeps cart total up to date by the price of the lines added or removed through cart.items,
+        removed products give their reserved units back """
+
+    if reverse:
+        return
+
+    if action == "post_add" and pk_set:
+        delta = Product.objects.filter(id__in=pk_set).aggregate(delta=Sum("price"))["delta"]
+        if delta:
+            instance.adjustTotal(delta)
+
+    elif action == "pre_remove" and pk_set:
+        release(Reservation.objects.filter(cart_id=instance.id, product_id__in=pk_set))
+        delta = CartLine.objects.filter(cart_id=instance.id, product_id__in=pk_set).aggregate(delta=line_price())["delta"]
+        if delta:
+            instance.adjustTotal(-delta)
+
+    elif action == "post_clear":
+        release(Reservation.objects.filter(cart_id=instance.id))
+        instance.total = 0
+        instance.save(update_fields=["total"])
@@ -0,0 +1,152 @@
+import time
+from datetime import timedelta
+from importlib import import_module
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+from shopify.periodic import PeriodicTask
+from shopify.routers import use_primary
+from .models import CartLine, ShoppingCart, deleting_carts
+from .schema import SESSION_CART, SESSION_PENDING
+
+# Session engines that keep every live session in django_session, which is where the purge looks for the
+# carts in use. shopify.sessions writes its sessions there behind the cache, within the grace of new carts
+DB_SESSION_ENGINES = {
+    "django.contrib.sessions.backends.db",
+    "django.contrib.sessions.backends.cached_db",
+    "shopify.sessions",
+}
+
+class PurgeStats:
+    """ Rows deleted by a purge and how long it took """
+
+    def __init__(self):
+        self.sessions = 0
+        self.carts = 0
+        self.items = 0
+        self.batches = 0
+        self.start = time.perf_counter()
+        self.duration = 0.0
+
+    @property
+    def rows(self):
+        return self.sessions + self.carts + self.items
+
+    def __str__(self):
+        rate = self.rows / self.duration if self.duration else 0
+        return (
+            f"Deleted {self.sessions} expired sessions, {self.carts} carts and {self.items} cart items "
+            f"in {self.batches} batches, {self.duration:.1f}s ({rate:.0f} rows/s)"
+        )
+
+def check_session_engine():
+    """ Error message when the sessions of SESSION_ENGINE aren't in the db, None when carts can be purged """
+
+    if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        return None
+
+    return f"Carts can't be purged with SESSION_ENGINE {settings.SESSION_ENGINE}, its sessions aren't in the db so every cart would look orphaned"
+
+def check_purge_sessions(app_configs, **kwargs):
+    """ System check refusing a scheduled purge with a session engine it can't see the sessions of """
+
+    message = check_session_engine()
+    if message is None or not getattr(settings, "CART_PURGE", {}).get("INTERVAL"):
+        return []
+
+    return [checks.Error(message, hint="Unset CART_PURGE['INTERVAL'] or use a db backed session engine", id="shoppingCart.E002")]
+
+def live_cart_ids():
+    """ Ids of the saved carts unexpired sessions in the db point to """
+
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    sessions = Session.objects.filter(expire_date__gte=timezone.now()).values_list("session_data", flat=True)
+    cartIds = set()
+
+    for data in sessions.iterator():
+        session = store.decode(data)
+        if session.get(SESSION_CART) is not None and not session.get(SESSION_PENDING):
+            cartIds.add(session[SESSION_CART])
+
+    return cartIds
+
+def purge_sessions(stats, batchSize, sleep):
+    """ Deletes expired sessions batchSize rows at a time """
+
+    while True:
+        keys = list(Session.objects.filter(expire_date__lt=timezone.now()).values_list("session_key", flat=True)[:batchSize])
+        if not keys:
+            return
+
+        stats.sessions = stats.sessions + Session.objects.filter(session_key__in=keys).delete()[0]
+        stats.batches = stats.batches + 1
+        time.sleep(sleep)
+
+def purge_carts(stats, batchSize, sleep, grace):
+    """ Deletes carts older than grace that no live session points to, with their items, batchSize carts at a time """
+
+    liveIds = live_cart_ids()
+    candidates = ShoppingCart.objects.filter(created_at__lt=timezone.now() - grace).order_by("id").values_list("id", flat=True)
+    lastId = 0
+
+    while True:
+        ids = list(candidates.filter(id__gt=lastId)[:batchSize])
+        if not ids:
+            return
+
+        lastId = ids[-1]
+        orphans = [cartId for cartId in ids if cartId not in liveIds]
+        if not orphans:
+            continue
+
+        with transaction.atomic(), deleting_carts(orphans):
+            items = CartLine.objects.filter(cart_id__in=orphans).delete()[0]
+            carts = ShoppingCart.objects.filter(id__in=orphans).delete()[0]
+
+        stats.items = stats.items + items
+        stats.carts = stats.carts + carts
+        stats.batches = stats.batches + 1
+        time.sleep(sleep)
+
+def purge(batchSize=1000, sleep=0.1, grace=timedelta(hours=1)):
+    """ Deletes expired sessions, then carts no live session points to. Each batch is its own short
+        transaction followed by a pause of sleep seconds, so writers are never locked out for long.
+        Carts are scanned on the primary, a lagging replica could miss carts a session just took. Raises
+        ImproperlyConfigured when the live sessions aren't in the db """
+
+    message = check_session_engine()
+    if message is not None:
+        raise ImproperlyConfigured(message)
+
+    stats = PurgeStats()
+
+    with use_primary():
+        purge_sessions(stats, batchSize, sleep)
+        purge_carts(stats, batchSize, sleep, grace)
+    stats.duration = time.perf_counter() - stats.start
+
+    return stats
+
+def start_purge_scheduler():
+    """ Purges every CART_PURGE['INTERVAL'] seconds in this process, does nothing unless INTERVAL is set """
+
+    config = getattr(settings, "CART_PURGE", {})
+    interval = config.get("INTERVAL")
+
+    if not interval:
+        return None
+
+    message = check_session_engine()
+    if message is not None:
+        raise ImproperlyConfigured(message)
+
+    options = {
+        "batchSize": config.get("BATCH_SIZE", 1000),
+        "sleep": config.get("SLEEP", 0.1),
+        "grace": timedelta(seconds=config.get("GRACE", 3600)),
+    }
+
+    return PeriodicTask(lambda: purge(**options), interval, name="cart-purge", runOnStop=False).start()
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.utils import timezone
+from shopify.periodic import PeriodicTask
+from shopify.routers import use_primary
+from .models import Reservation, release
+
+def sweep_reservations():
+    """ Releases every expired reservation, returns the number of units given back to stock. Claimed
+        reservations are read back from the primary, a lagging replica would miss them and leak their units """
+
+    with use_primary():
+        return release(Reservation.objects.filter(expires_at__lt=timezone.now()))
+
+def start_reservation_sweeper():
+    """ Sweeps expired reservations every RESERVATIONS['SWEEP_INTERVAL'] seconds in this process """
+
+    interval = getattr(settings, "RESERVATIONS", {}).get("SWEEP_INTERVAL")
+
+    if not interval:
+        return None
+
+    return PeriodicTask(sweep_reservations, interval, name="reservation-sweeper", runOnStop=False).start()
@@ -1,42 +1,210 @@
+from contextlib import contextmanager
 import graphene
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.db.models import Max
 from graphql import GraphQLError
 from graphene_django import DjangoObjectType
+from promise import Promise
+from promise.dataloader import DataLoader
 from products.schema import ProductType
 from products.models import Product
-from .models import ShoppingCart
+from shopify.loaders import ManyToManyLoader, get_loader, clear_loader
+from shopify.pagination import connection_field, paginate
+from shopify.routers import use_primary
+from .models import CartLine, ShoppingCart, InventoryChanged, reserve
 
 SESSION_CART = "cartId"
+SESSION_PENDING = "cartPending"
+NEXT_CART_ID = "shoppingCart:next-id"
+
+class NothingAdded(Exception):
+    """ Raised to roll back the row of a pending cart whose first add left it empty """
+
+def cart_id_cache():
+    """ Cache holding the counter pending carts take their ids from, None when carts are saved as they are created """
+
+    alias = getattr(settings, "CART_ID_CACHE", None)
+    return caches[alias] if alias else None
+
+def check_cart_id_cache(app_configs, **kwargs):
+    """ System check refusing a local memory cache for the cart id counter, every process would count apart """
+
+    if not isinstance(cart_id_cache(), LocMemCache):
+        return []
+
+    return [checks.Error(
+        f"CART_ID_CACHE needs a cache shared by all server processes, the '{settings.CART_ID_CACHE}' cache is a local memory cache",
+        hint="Configure a shared cache (memcached, redis) as CART_ID_CACHE or set it to None",
+        id="shoppingCart.E001",
+    )]
+
+def allocate_cart_id(cache):
+    """ Id for a new cart from the counter in cache. A missing counter starts after the last saved cart """
+
+    try:
+        return cache.incr(NEXT_CART_ID)
+    except ValueError:
+        pass
+
+    with use_primary():
+        last = ShoppingCart.objects.aggregate(last=Max("id"))["last"] or 0
+
+    cache.add(NEXT_CART_ID, last)
+    return cache.incr(NEXT_CART_ID)
+
+def is_pending(cart):
+    """ Whether the cart has no row in the db yet """
+
+    return cart._state.adding
+
+def session_cart(session):
+    """ Cart in the session, None if there is none. A cart stays pending, with its id in the session
+        but no row in the db, until the first product is added to it """
+
+    if SESSION_CART not in session:
+        return None
+
+    cartId = session[SESSION_CART]
+    if session.get(SESSION_PENDING):
+        return ShoppingCart(id=cartId, total=0)
+
+    return ShoppingCart.objects.get(id=cartId)
+
+def start_cart(session):
+    """ New cart kept in the session. With CART_ID_CACHE it is pending with an id from the counter,
+        without it is saved straight away """
+
+    cache = cart_id_cache()
+
+    if cache is None:
+        cart = ShoppingCart.objects.create(total=0)
+        session[SESSION_CART] = cart.id
+        return cart
+
+    cart = ShoppingCart(id=allocate_cart_id(cache), total=0)
+    session[SESSION_CART] = cart.id
+    session[SESSION_PENDING] = True
+
+    return cart
+
+def save_cart(session, cart):
+    """ Writes a pending cart to the db under its id. An id that is taken, as when the counter was lost and
+        started again below ids pending carts hold, is replaced with a new one """
+
+    if not is_pending(cart):
+        return
+
+    while is_pending(cart):
+        try:
+            with transaction.atomic():
+                cart.save(force_insert=True)
+        except IntegrityError:
+            cart.id = allocate_cart_id(cart_id_cache())
+
+    session[SESSION_CART] = cart.id
+    session.pop(SESSION_PENDING, None)
+
+@contextmanager
+def adding_to(session, cart):
+    """ Runs a block adding products to the cart in one transaction, saving a pending cart first. When the
+        block raises or leaves a pending cart without items its row is rolled back and the cart stays pending """
+
+    pending = is_pending(cart)
+
+    try:
+        with transaction.atomic():
+            save_cart(session, cart)
+            yield
+
+            if pending and not cart.items.exists():
+                raise NothingAdded(cart.id)
+    except Exception as e:
+        if pending:
+            cart._state.adding = True
+            cart.total = 0
+            session[SESSION_CART] = cart.id
+            session[SESSION_PENDING] = True
+
+        if not isinstance(e, NothingAdded):
+            raise
+
+class CartItemsLoader(ManyToManyLoader):
+    """ Batches cart items lookups for every cart in a request into one query """
+
+    model = ShoppingCart
+    field_name = "items"
+
+class CartLinesLoader(DataLoader):
+    """ Batches cart lines lookups for every cart in a request into one query, keyed on cart id """
+
+    def batch_load_fn(self, keys):
+        lines = {key: [] for key in keys}
+
+        for line in CartLine.objects.filter(cart_id__in=keys).select_related("product").order_by("pk"):
+            lines[line.cart_id].append(line)
+
+        return Promise.resolve([lines[key] for key in keys])
+
+def clear_cart_loaders(info, cartId):
+    """ Drops the items and lines a request loaded for a cart it changed """
+
+    clear_loader(info, CartItemsLoader, cartId)
+    clear_loader(info, CartLinesLoader, cartId)
+
+class CartLineType(DjangoObjectType):
+    """ A product in a cart and the units of it the cart wants """
+
+    class Meta:
+        model = CartLine
+        only_fields = ("product", "quantity")
 
 class ShoppingCartType(DjangoObjectType):
+    items = graphene.List(ProductType)
+    lines = graphene.List(CartLineType, description="Products in the cart with their quantities")
+
     class Meta:
         model = ShoppingCart
 
+    def resolve_items(self, info, **kwargs):
+        if is_pending(self):
+            return []
+
+        return get_loader(info, CartItemsLoader).load(self.id)
+
+    def resolve_lines(self, info, **kwargs):
+        if is_pending(self):
+            return []
+
+        return get_loader(info, CartLinesLoader).load(self.id)
+
+class ShoppingCartConnection(graphene.relay.Connection):
+    class Meta:
+        node = ShoppingCartType
+
 #Queries
 class Query(graphene.ObjectType):
     """ All Queries declared in Shopping Cart API """
 
     shoppingCart = graphene.Field(ShoppingCartType)
-    all_shopping_carts = graphene.List(ShoppingCartType)
+    all_shopping_carts = connection_field(ShoppingCartConnection)
 
     def resolve_shoppingCart(self, info, **kwargs):
         """ Query for getting shopping cart by id """
         
-        session = info.context.session
-
-        if SESSION_CART in session:
-            cartId = session.get(SESSION_CART)
-            return ShoppingCart.objects.get(id=cartId)
-        else:
-            return None
+        return session_cart(info.context.session)
 
     def resolve_all_shopping_carts(self, info, **kwargs):
-        """ Helper Query for getting all shopping carts in db """
+        """ Helper Query for paging through all shopping carts in db """
 
-        return ShoppingCart.objects.all()
+        return paginate(ShoppingCartConnection, ShoppingCart.objects.all(), kwargs.get('first'), kwargs.get('after'))
 
 #Mutations
 class AddToCart(graphene.Mutation):
-    """ Adds a product to the shopping cart by id """
+    """ Adds a product to the shopping cart by id, holding a unit of it for the cart until the reservation expires """
 
     cart = graphene.Field(ShoppingCartType)
 
@@ -45,18 +213,19 @@ class AddToCart(graphene.Mutation):
 
     def mutate(self, info, **kwargs):
         session = info.context.session
+        cart = session_cart(session)
 
-        if SESSION_CART in session:
-            cartId = session.get(SESSION_CART)
-            cart = ShoppingCart.objects.get(id=cartId)
+        if cart is not None:
             productId = kwargs.get("productId")
 
             if productId is not None:
                 toAdd = Product.objects.get(id=productId)
 
-                if toAdd is not None and toAdd.inventory_count > 0:
-                    cart.items.add(toAdd)
-                    cart.calcTotal()
+                if toAdd is not None and (toAdd.shard_count or toAdd.inventory_count > toAdd.reserved_count):
+                    with adding_to(session, cart):
+                        if reserve(cart, {toAdd: 1}):
+                            cart.items.add(toAdd)
+                    clear_cart_loaders(info, cart.id)
                 
             return AddToCart(cart=cart)
         else:
@@ -71,19 +240,17 @@ class RemoveFromCart(graphene.Mutation):
         productId = graphene.Int(required=True)
 
     def mutate(self, info, **kwargs):
-        session = info.context.session
+        cart = session_cart(info.context.session)
 
-        if SESSION_CART in session:
-            cartId = session.get(SESSION_CART)
-            cart = ShoppingCart.objects.get(id=cartId)
+        if cart is not None:
             productId = kwargs.get("productId")
 
-            if productId is not None:
+            if productId is not None and not is_pending(cart):
                 toRemove = Product.objects.get(id=productId)
 
                 if toRemove is not None:
                     cart.items.remove(toRemove)  
-                    cart.calcTotal()
+                    clear_cart_loaders(info, cart.id)
                 
             return RemoveFromCart(cart=cart)
         else:
@@ -99,27 +266,96 @@ class CreateCart(graphene.Mutation):
     
     def mutate(self, info, **kwargs):
         session = info.context.session
+        cart = session_cart(session)
 
-        if SESSION_CART in session:
-            cartId = session.get(SESSION_CART)
-            print(cartId)
-            cart = ShoppingCart.objects.get(id=cartId)
-        else:
-            cart = ShoppingCart(total=0)
-            cart.save()
-            session[SESSION_CART] = cart.id
+        if cart is None:
+            cart = start_cart(session)
 
             itemsList = kwargs.get("items")
             if itemsList is not None:
-                for itemId in itemsList:
-                    if itemId > 0:
-                        product = Product.objects.get(id=itemId)
-                        if product.inventory_count > 0:
-                            cart.items.add(product)
-
-                cart.calcTotal()
+                products = Product.objects.in_bulk(itemId for itemId in itemsList if itemId > 0)
+                missing = [str(itemId) for itemId in sorted(set(itemsList)) if itemId > 0 and itemId not in products]
+                if missing:
+                    raise GraphQLError(message=f"No products with ids {', '.join(missing)}")
+
+                quantities = {
+                    itemId: 1 for itemId, product in products.items()
+                    if product.shard_count or product.inventory_count > product.reserved_count
+                }
+
+                if quantities:
+                    try:
+                        with adding_to(session, cart):
+                            cart.updateItems(quantities)
+                    except (InventoryChanged, Product.DoesNotExist) as e:
+                        raise GraphQLError(message=e.args[0])
+                    finally:
+                        clear_cart_loaders(info, cart.id)
         return CreateCart(cart=cart)        
 
+class CartItemInput(graphene.InputObjectType):
+    """ Units of a product for a cart """
+
+    product_id = graphene.Int(required=True)
+    quantity = graphene.Int(required=True)
+
+def edit_cart(info, items, replace):
+    """ Applies CartItemInputs to the cart in the session with a single updateItems, returns the cart,
+        None if the session has none, and the products left at their old quantity for lack of stock """
+
+    session = info.context.session
+    cart = session_cart(session)
+
+    if cart is None:
+        return None, []
+
+    quantities = {}
+    for item in items:
+        if item.quantity < 0:
+            raise GraphQLError(message=f"Quantity of product {item.product_id} must not be negative")
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    if is_pending(cart) and not any(quantities.values()):
+        return cart, []
+
+    try:
+        with adding_to(session, cart):
+            failed = cart.updateItems(quantities, add=not replace, replace=replace)
+    except (InventoryChanged, Product.DoesNotExist) as e:
+        raise GraphQLError(message=e.args[0])
+    finally:
+        clear_cart_loaders(info, cart.id)
+
+    return cart, failed
+
+class AddItemsToCart(graphene.Mutation):
+    """ Adds units of several products to the shopping cart in one transaction, holding them for the cart.
+        Products without enough units in stock keep their old quantity and are returned in failedItems """
+
+    cart = graphene.Field(ShoppingCartType)
+    failed_items = graphene.List(ProductType)
+
+    class Arguments:
+        items = graphene.List(graphene.NonNull(CartItemInput), required=True)
+
+    def mutate(self, info, **kwargs):
+        cart, failed = edit_cart(info, kwargs.get("items"), replace=False)
+        return AddItemsToCart(cart=cart, failed_items=failed)
+
+class SetCartItems(graphene.Mutation):
+    """ Makes the shopping cart hold exactly the given quantities in one transaction, products left out are
+        removed. Products without enough units in stock keep their old quantity and are returned in failedItems """
+
+    cart = graphene.Field(ShoppingCartType)
+    failed_items = graphene.List(ProductType)
+
+    class Arguments:
+        items = graphene.List(graphene.NonNull(CartItemInput), required=True)
+
+    def mutate(self, info, **kwargs):
+        cart, failed = edit_cart(info, kwargs.get("items"), replace=True)
+        return SetCartItems(cart=cart, failed_items=failed)
+
 class DeleteCart(graphene.Mutation):
     """ Deletes a cart from the db """
 
@@ -143,36 +379,36 @@ class DeleteCart(graphene.Mutation):
             return DeleteCart(message=msg)
 
 class SubmitCart(graphene.Mutation):
-    """ Completes the cart by reducing inventory and clearing cart of products """
+    """ Completes the cart by reducing inventory and clearing cart of products, out of stock products stay in the cart """
 
     cart = graphene.Field(ShoppingCartType)
     message = graphene.String()
+    failed_items = graphene.List(ProductType)
 
     class Arguments:
         pass
 
     def mutate(self, info, **kwargs):
         msg = ""
-        session = info.context.session
-
-        if SESSION_CART in session:
-            cartId = session.get(SESSION_CART)
-            cart = ShoppingCart.objects.get(id=cartId)
+        cart = session_cart(info.context.session)
 
-            if len(cart.items.all()) == 0:
+        if cart is not None:
+            if is_pending(cart) or not cart.items.exists():
                 msg = "No cart items to complete"
-                return SubmitCart(cart=cart, message=msg)
+                return SubmitCart(cart=cart, message=msg, failed_items=[])
+
+            try:
+                failed = cart.checkout()
+            except InventoryChanged as e:
+                raise GraphQLError(message=e.args[0])
+            finally:
+                clear_cart_loaders(info, cart.id)
+
+            if failed:
+                msg = "Shopping cart was completed, out of stock items were left in the cart"
             else:
-                for item in cart.items.all():
-                    product = Product.objects.get(id=item.id)
-                    if product.inventory_count > 0:
-                        product.inventory_count = product.inventory_count - 1
-                        product.save()
-                        cart.items.remove(product)
-
-                cart.calcTotal()
                 msg = "Shopping cart was successfully completed"
-                return SubmitCart(cart=cart, message=msg)
+            return SubmitCart(cart=cart, message=msg, failed_items=failed)
         else:
             msg = "No shopping cart to complete"
             return SubmitCart(cart=None, message=msg)
@@ -183,6 +419,8 @@ class Mutation(graphene.ObjectType):
     create_cart = CreateCart.Field()
     delete_cart = DeleteCart.Field()
     add_to_cart = AddToCart.Field()
+    add_items_to_cart = AddItemsToCart.Field()
+    set_cart_items = SetCartItems.Field()
     remove_from_cart = RemoveFromCart.Field()
     submit_cart = SubmitCart.Field()
     
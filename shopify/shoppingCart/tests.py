@@ -1,10 +1,25 @@
 import json
+from datetime import timedelta
+from io import StringIO
 from collections import OrderedDict
-from django.test import TestCase
+from decimal import Decimal
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, TestCase, override_settings
 from django.conf import settings
-from .models import ShoppingCart
-from products.models import Product
+from django.core.cache import cache
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+from .models import CartLine, Reservation, ShoppingCart, release, reserve
+from .purge import PurgeStats, check_purge_sessions, purge_carts
+from .reservations import sweep_reservations
+from .schema import check_cart_id_cache
+from products.catalog import get_version
+from products.inventory import set_shards, sync_totals
+from products.models import InventoryShard, Product
+from products.snapshot import get_snapshot
 from shopify.schema import schema
+from shopify.sessions import flush_sessions
 
 SESSION_CART = "cartId"
 
@@ -83,27 +98,37 @@ class ShoppingCartQueryTest(TestCase):
             {
                 allShoppingCarts
                 {
-                    id
-                    items
+                    edges
                     {
-                        id
-                        title
-                        price
+                        node
+                        {
+                            id
+                            items
+                            {
+                                id
+                                title
+                                price
+                            }
+                            total
+                        }
                     }
-                    total
                 }
             }
         """
         expected_result = """
             {
                 "data": {
-                    "allShoppingCarts": [
-                        {
-                            "id": "1",
-                            "items": [],
-                            "total": 0
-                        }
-                    ]
+                    "allShoppingCarts": {
+                        "edges": [
+                            {
+                                "node": {
+                                    "id": "1",
+                                    "items": [],
+                                    "total": 0
+                                }
+                            }
+                        ]
+                    }
                 }
             }
         """
@@ -114,9 +139,45 @@ class ShoppingCartQueryTest(TestCase):
         self.assertNotEqual(actual_result.errors, True)
         self.assertEqual(actual_result.data, expected_result)
 
+    def test_get_all_carts_batches_items(self):
+        """ Fetching items for many carts costs the same number of queries as for one """
+
+        query = """
+            query
+            {
+                allShoppingCarts
+                {
+                    edges
+                    {
+                        node
+                        {
+                            id
+                            items
+                            {
+                                id
+                            }
+                        }
+                    }
+                }
+            }
+        """
+
+        for i in range(2, 12):
+            cart = ShoppingCart.objects.create(id=i, total=0)
+            cart.items.add(Product.objects.get(id=1), Product.objects.get(id=2))
+
+        with self.assertNumQueries(2):
+            actual_result = schema.execute(query, context_value=self.client)
+
+        self.assertIsNone(actual_result.errors)
+        edges = actual_result.data["allShoppingCarts"]["edges"]
+        self.assertEqual(len(edges), 11)
+        self.assertEqual(edges[1]["node"]["items"], [{"id": "1"}, {"id": "2"}])
+
 class ShoppingCartMutationTest(TestCase):
     def setUp(self):
         initTestDB()
+        cache.clear()
 
         #initialize session for test
         session = self.client.session
@@ -165,6 +226,76 @@ class ShoppingCartMutationTest(TestCase):
         self.assertNotEqual(actual_result.errors, True)
         self.assertEqual(actual_result.data, expected_result)
 
+    @override_settings(CART_ID_CACHE="default")
+    def test_create_cart_is_lazy(self):
+        """ Empty carts live in the session only, the row is written under their id when the first product is added """
+
+        def post(query):
+            return self.client.post("/", json.dumps({"query": query}), content_type="application/json").json()["data"]
+
+        cartId = post("mutation { createCart(items: [4]) { cart { id } } }")["createCart"]["cart"]["id"]
+        self.assertEqual(post("query { shoppingCart { id items { id } total } }"), {"shoppingCart": {"id": cartId, "items": [], "total": 0.0}})
+        self.assertEqual(post("mutation { submitCart { message } }"), {"submitCart": {"message": "No cart items to complete"}})
+        self.assertEqual(ShoppingCart.objects.count(), 0)
+
+        cart = post("mutation { addToCart(productId: 1) { cart { id items { id } total } } }")["addToCart"]["cart"]
+        self.assertEqual(cart["id"], cartId)
+        self.assertEqual(cart["items"], [{"id": "1"}])
+        self.assertEqual(ShoppingCart.objects.get().id, int(cartId))
+        self.assertEqual(post("query { shoppingCart { id } }"), {"shoppingCart": {"id": cartId}})
+
+    @override_settings(CART_ID_CACHE="default")
+    def test_pending_cart_id_taken(self):
+        """ A pending cart whose id was saved by another cart meanwhile is saved under a new id """
+
+        def post(query):
+            return self.client.post("/", json.dumps({"query": query}), content_type="application/json").json()["data"]
+
+        cartId = post("mutation { createCart { cart { id } } }")["createCart"]["cart"]["id"]
+        ShoppingCart.objects.create(id=int(cartId), total=0)
+
+        cart = post("mutation { addToCart(productId: 1) { cart { id items { id } } } }")["addToCart"]["cart"]
+        self.assertEqual(cart, {"id": str(int(cartId) + 1), "items": [{"id": "1"}]})
+        self.assertEqual(ShoppingCart.objects.get(id=int(cartId)).items.count(), 0)
+
+    @override_settings(CART_ID_CACHE="default")
+    def test_failed_first_add(self):
+        """ A pending cart whose first add can't hold a unit stays pending, with no row, and keeps its id """
+
+        def post(query):
+            return self.client.post("/", json.dumps({"query": query}), content_type="application/json").json()["data"]
+
+        cartId = post("mutation { createCart { cart { id } } }")["createCart"]["cart"]["id"]
+        set_shards(4, 2)
+
+        self.assertEqual(post("mutation { addToCart(productId: 4) { cart { id items { id } total } } }"), {"addToCart": {"cart": {"id": cartId, "items": [], "total": 0.0}}})
+        self.assertEqual(post("mutation { addItemsToCart(items: [{productId: 4, quantity: 1}]) { cart { id } failedItems { id } } }"), {"addItemsToCart": {"cart": {"id": cartId}, "failedItems": [{"id": "4"}]}})
+        self.assertFalse(ShoppingCart.objects.exists())
+
+        self.assertEqual(post("mutation { addToCart(productId: 1) { cart { id items { id } } } }"), {"addToCart": {"cart": {"id": cartId, "items": [{"id": "1"}]}}})
+        self.assertEqual(ShoppingCart.objects.get().id, int(cartId))
+
+    @override_settings(CART_ID_CACHE="default")
+    def test_cart_ids_without_queries(self):
+        """ Pending carts take their ids from the counter, the last saved cart is only read to start it """
+
+        ShoppingCart.objects.create(id=7, total=0)
+        mutation = "mutation { createCart { cart { id } } }"
+
+        self.assertEqual(schema.execute(mutation, context_value=self.client).data, {"createCart": {"cart": {"id": "8"}}})
+        request = RequestFactory().get("/")
+        request.session = {}
+        with self.assertNumQueries(0):
+            self.assertEqual(schema.execute(mutation, context_value=request).data, {"createCart": {"cart": {"id": "9"}}})
+
+    def test_cart_id_cache_check(self):
+        """ The system check refuses a local memory cache for the cart id counter """
+
+        self.assertEqual(check_cart_id_cache(None), [])
+
+        with override_settings(CART_ID_CACHE="default"):
+            self.assertEqual([error.id for error in check_cart_id_cache(None)], ["shoppingCart.E001"])
+
     def test_create_cart_with_items(self):
         """ Create cart if it doesn't exist with list of items """
 
@@ -496,4 +627,422 @@ class ShoppingCartMutationTest(TestCase):
         actual_result = schema.execute(mutation, context_value=self.client)
 
         self.assertNotEqual(actual_result.errors, True)
-        self.assertEqual(actual_result.data, expected_result)
\ No newline at end of file
+        self.assertEqual(actual_result.data, expected_result)
+
+class ShoppingCartTotalTest(TestCase):
+    def setUp(self):
+        initTestDB()
+        self.cart = ShoppingCart.objects.create(id=1, total=0)
+
+    def test_total_follows_items(self):
+        """ Adding and removing items updates the total by delta """
+
+        self.cart.items.add(Product.objects.get(id=1), Product.objects.get(id=2))
+        self.cart.items.add(Product.objects.get(id=1))
+        self.assertEqual(ShoppingCart.objects.get(id=1).total, Decimal("69.98"))
+
+        product = Product.objects.get(id=2)
+        with self.assertNumQueries(5):
+            self.cart.items.remove(product)
+        self.assertEqual(ShoppingCart.objects.get(id=1).total, Decimal("29.99"))
+        self.assertEqual(self.cart.total, Decimal("29.99"))
+
+    def test_check_totals_fixes_drift(self):
+        """ Consistency check rewrites totals that no longer match the items """
+
+        self.cart.items.add(Product.objects.get(id=1), Product.objects.get(id=3))
+        ShoppingCart.objects.filter(id=1).update(total=5)
+
+        out = StringIO()
+        call_command("checkcarttotals", fix=True, stdout=out)
+
+        self.assertIn("Fixed 1 drifted cart totals", out.getvalue())
+        self.assertEqual(ShoppingCart.objects.get(id=1).total, Decimal("49.98"))
+
+        out = StringIO()
+        call_command("checkcarttotals", stdout=out)
+        self.assertIn("Found 0 drifted cart totals", out.getvalue())
+
+class ShoppingCartCheckoutTest(TestCase):
+    def setUp(self):
+        initTestDB()
+        self.cart = ShoppingCart.objects.create(id=1, total=0)
+
+    def test_checkout_reports_out_of_stock(self):
+        """ Items without stock stay in the cart, the rest are sold and removed """
+
+        Product.objects.filter(id=2).update(inventory_count=0)
+        self.cart.items.add(*Product.objects.filter(id__in=[1, 2, 3]))
+
+        schema.execute("query { product(id: 1) { inventoryCount } }")
+        failed = self.cart.checkout()
+
+        self.assertEqual([product.id for product in failed], [2])
+        self.assertEqual(schema.execute("query { product(id: 1) { inventoryCount } }").data, {"product": {"inventoryCount": 4}})
+        self.assertEqual(list(self.cart.items.values_list("id", flat=True)), [2])
+        self.assertEqual(ShoppingCart.objects.get(id=1).total, Decimal("39.99"))
+        self.assertEqual(dict(Product.objects.values_list("id", "inventory_count")), {1: 4, 2: 0, 3: 4, 4: 0})
+
+    def test_checkout_query_count_is_fixed(self):
+        """ Checkout costs the same number of queries for one item as for many """
+
+        self.cart.items.add(Product.objects.get(id=1))
+        with self.assertNumQueries(9):
+            self.cart.checkout()
+
+        for i in range(5, 55):
+            Product.objects.create(id=i, title=f"Product {i}", price="1.00", inventory_count=1)
+        self.cart.items.add(*Product.objects.filter(id__gte=5))
+        with self.assertNumQueries(9):
+            failed = self.cart.checkout()
+
+        self.assertEqual(failed, [])
+        self.assertFalse(Product.objects.filter(id__gte=5, inventory_count__gt=0).exists())
+
+class ShoppingCartLinesTest(TestCase):
+    def setUp(self):
+        initTestDB()
+        initCart(self.client.session)
+
+    def edit(self, mutation, items):
+        query = f"""
+            mutation Edit($items: [CartItemInput!]!) {{
+                {mutation}(items: $items) {{ cart {{ total lines {{ product {{ id }} quantity }} }} failedItems {{ id }} }}
+            }}
+        """
+        variables = {"items": [{"productId": productId, "quantity": quantity} for productId, quantity in items]}
+        result = schema.execute(query, variable_values=variables, context_value=self.client)
+        return result.errors[0].message if result.errors else result.data[mutation]
+
+    def lines(self, result):
+        return {int(line["product"]["id"]): line["quantity"] for line in result["cart"]["lines"]}
+
+    def held(self):
+        return dict(Reservation.objects.values_list("product_id", "quantity"))
+
+    def test_add_items_sums_quantities(self):
+        """ addItemsToCart adds to existing lines, holds every unit and keeps the total in step """
+
+        self.edit("addItemsToCart", [(1, 2), (2, 1), (1, 1)])
+        result = self.edit("addItemsToCart", [(2, 2), (3, 1)])
+
+        self.assertEqual(self.lines(result), {1: 3, 2: 3, 3: 1})
+        self.assertEqual(result["cart"]["total"], 229.93)
+        self.assertEqual(result["failedItems"], [])
+        self.assertEqual(self.held(), {1: 3, 2: 3, 3: 1})
+        self.assertEqual(ShoppingCart.objects.get(id=1).total, Decimal("229.93"))
+
+    def test_set_items_replaces_the_cart(self):
+        """ setCartItems lowers and removes lines, releases their units and leaves products short of stock alone """
+
+        self.edit("addItemsToCart", [(1, 3), (2, 2)])
+        result = self.edit("setCartItems", [(1, 1), (3, 6), (4, 1)])
+
+        self.assertEqual(self.lines(result), {1: 1})
+        self.assertEqual(result["cart"]["total"], 29.99)
+        self.assertEqual(sorted(item["id"] for item in result["failedItems"]), ["3", "4"])
+        self.assertEqual(self.held(), {1: 1})
+        self.assertEqual(dict(Product.objects.values_list("id", "reserved_count")), {1: 1, 2: 0, 3: 0, 4: 0})
+
+    def test_invalid_items(self):
+        """ Negative quantities and unknown products fail the whole mutation """
+
+        self.assertEqual(self.edit("addItemsToCart", [(1, 1), (2, -1)]), "Quantity of product 2 must not be negative")
+        self.assertEqual(self.edit("setCartItems", [(1, 1), (99, 1)]), "No products with ids 99")
+        self.assertFalse(CartLine.objects.exists())
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_query_count_is_fixed(self):
+        """ Editing one line costs the same number of queries as editing many """
+
+        for i in range(5, 55):
+            Product.objects.create(id=i, title=f"Product {i}", price="1.00", inventory_count=5)
+
+        cart = ShoppingCart.objects.get(id=1)
+        with self.assertNumQueries(10):
+            cart.updateItems({1: 2}, add=True)
+        with self.assertNumQueries(10):
+            cart.updateItems({i: 2 for i in range(5, 55)}, add=True)
+
+    def test_checkout_sells_quantities(self):
+        """ Checkout takes the units of every line, a line with more units than stock stays in the cart """
+
+        self.edit("addItemsToCart", [(1, 2), (2, 5)])
+        Product.objects.filter(id=2).update(inventory_count=4, reserved_count=0)
+        Reservation.objects.filter(product_id=2).delete()
+
+        failed = ShoppingCart.objects.get(id=1).checkout()
+
+        self.assertEqual([product.id for product in failed], [2])
+        self.assertEqual(dict(Product.objects.values_list("id", "inventory_count")), {1: 3, 2: 4, 3: 5, 4: 0})
+        self.assertEqual(list(CartLine.objects.values_list("product_id", "quantity")), [(2, 5)])
+        self.assertEqual(ShoppingCart.objects.get(id=1).total, Decimal("199.95"))
+
+class ShoppingCartPurgeTest(TestCase):
+    def setUp(self):
+        initTestDB()
+
+        #sessions queued by earlier tests would point to the carts below
+        flush_sessions()
+        Session.objects.all().delete()
+
+    def test_purge_orphaned_carts(self):
+        """ Expired sessions and old carts no live session points to are deleted with their items """
+
+        old = timezone.now() - timedelta(hours=2)
+        live = ShoppingCart.objects.create(id=1, total=0, created_at=old)
+        orphan = ShoppingCart.objects.create(id=2, total=0, created_at=old)
+        expired = ShoppingCart.objects.create(id=3, total=0, created_at=old)
+        ShoppingCart.objects.create(id=4, total=0)
+
+        for cart in (live, orphan, expired):
+            cart.items.add(1, 2)
+
+        session = self.client.session
+        session[SESSION_CART] = live.id
+        session.save()
+        Session.objects.create(session_key="expired", session_data=session.encode({SESSION_CART: expired.id}), expire_date=old)
+
+        flush_sessions()
+
+        out = StringIO()
+        call_command("purgecarts", batch_size=1, sleep=0, grace=3600, stdout=out)
+
+        self.assertIn("Deleted 1 expired sessions, 2 carts and 4 cart items", out.getvalue())
+        self.assertEqual(sorted(ShoppingCart.objects.values_list("id", flat=True)), [1, 4])
+        self.assertEqual(live.items.count(), 2)
+
+    def test_purge_releases_holds_together(self):
+        """ The holds of a whole batch of orphans are given back at once, not cart by cart """
+
+        old = timezone.now() - timedelta(hours=2)
+        for cartId in (1, 2, 3):
+            reserve(ShoppingCart.objects.create(id=cartId, total=0, created_at=old), {Product.objects.get(id=1): 1})
+
+        with self.assertNumQueries(14):
+            purge_carts(PurgeStats(), 3, 0, timedelta(hours=1))
+
+        self.assertEqual(Product.objects.values_list("reserved_count", flat=True).get(id=1), 0)
+        self.assertFalse(Reservation.objects.exists())
+        self.assertFalse(ShoppingCart.objects.exists())
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies", CART_PURGE={"INTERVAL": 60})
+    def test_refuses_sessions_outside_db(self):
+        """ Sessions the purge can't see would make every cart look orphaned, so it refuses to run """
+
+        ShoppingCart.objects.create(id=1, total=0, created_at=timezone.now() - timedelta(hours=2))
+
+        with self.assertRaises(CommandError):
+            call_command("purgecarts", batch_size=1, sleep=0, grace=3600, stdout=StringIO())
+
+        self.assertTrue(ShoppingCart.objects.filter(id=1).exists())
+        self.assertEqual([error.id for error in check_purge_sessions(None)], ["shoppingCart.E002"])
+
+class ShoppingCartReservationTest(TestCase):
+    def setUp(self):
+        initTestDB()
+        Product.objects.filter(id=1).update(inventory_count=1)
+        self.first = ShoppingCart.objects.create(id=1, total=0)
+        self.second = ShoppingCart.objects.create(id=2, total=0)
+
+    def stock(self, productId=1):
+        return Product.objects.values_list("inventory_count", "reserved_count").get(id=productId)
+
+    def test_reserved_units_are_not_available(self):
+        """ Only one cart can hold the last unit, until its hold expires and is swept """
+
+        self.assertTrue(reserve(self.first, {Product.objects.get(id=1): 1}))
+        self.assertTrue(reserve(self.first, {Product.objects.get(id=1): 1}))
+        self.assertFalse(reserve(self.second, {Product.objects.get(id=1): 1}))
+        self.assertEqual(self.stock(), (1, 1))
+        self.assertEqual(schema.execute("query { product(id: 1) { availableCount } }").data, {"product": {"availableCount": 0}})
+
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(sweep_reservations(), 1)
+        self.assertEqual(sweep_reservations(), 0)
+        self.assertEqual(self.stock(), (1, 0))
+        self.assertTrue(reserve(self.second, {Product.objects.get(id=1): 1}))
+
+    def test_reserve_many(self):
+        """ A batch holds a unit of every product still in stock and extends the cart's existing holds """
+
+        reserve(self.first, {Product.objects.get(id=1): 1})
+        reserve(self.second, {Product.objects.get(id=2): 1})
+
+        wanted = {product: 1 for product in Product.objects.order_by("id")}
+        self.assertEqual(reserve(self.second, wanted), {2: 1, 3: 1})
+        self.assertEqual(Reservation.objects.filter(cart=self.second).count(), 2)
+        self.assertEqual(self.stock(2), (5, 1))
+
+    def test_checkout_uses_reserved_unit(self):
+        """ The cart holding the last unit buys it, a cart without a hold can't """
+
+        for cart in (self.first, self.second):
+            reserve(cart, {Product.objects.get(id=1): 1})
+            cart.items.add(1)
+
+        self.assertEqual([product.id for product in self.second.checkout()], [1])
+        self.assertEqual(self.first.checkout(), [])
+        self.assertEqual(self.stock(), (0, 0))
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_removed_and_deleted_carts_release(self):
+        """ Removing an item or deleting the cart gives the held unit back, once """
+
+        reserve(self.first, {Product.objects.get(id=1): 1})
+        self.first.items.add(1)
+        reserve(self.first, {Product.objects.get(id=2): 1})
+        self.first.items.add(2)
+
+        self.first.items.remove(1)
+        self.assertEqual(self.stock(1), (1, 0))
+
+        self.first.delete()
+        self.assertEqual(self.stock(2), (5, 0))
+        self.assertEqual(release(Reservation.objects.all()), 0)
+
+    def test_add_to_cart_reserves(self):
+        """ addToCart leaves out products whose every unit is held by another cart """
+
+        reserve(self.second, {Product.objects.get(id=1): 1})
+        initCart(self.client.session)
+
+        result = schema.execute("mutation { addToCart(productId: 1) { cart { items { id } } } }", context_value=self.client)
+        self.assertEqual(result.data, {"addToCart": {"cart": {"items": []}}})
+
+        result = schema.execute("mutation { addToCart(productId: 2) { cart { items { id availableCount } } } }", context_value=self.client)
+        self.assertEqual(result.data, {"addToCart": {"cart": {"items": [{"id": "2", "availableCount": 4}]}}})
+
+    def test_cached_results_follow_holds(self):
+        """ Holds and releases reach product results cached before them without moving the catalog version """
+
+        query = "query { product(id: 2) { availableCount } allProducts { edges { node { id availableCount } } } }"
+
+        def available():
+            data = schema.execute(query).data
+            return data["product"]["availableCount"], data["allProducts"]["edges"][1]["node"]["availableCount"]
+
+        self.assertEqual(available(), (5, 5))
+        initCart(self.client.session)
+        version = get_version()
+
+        schema.execute("mutation { addToCart(productId: 2) { cart { id } } }", context_value=self.client)
+        self.assertEqual(self.stock(2), (5, 1))
+        self.assertEqual(available(), (4, 4))
+
+        schema.execute("mutation { removeFromCart(productId: 2) { cart { id } } }", context_value=self.client)
+        self.assertEqual(available(), (5, 5))
+        self.assertEqual(get_version(), version)
+
+    def test_snapshot_follows_holds(self):
+        """ Holds and releases reach the catalog snapshot, checkout takes the unit out of its stock """
+
+        query = "query { product(id: 2) { inventoryCount availableCount } }"
+
+        with self.settings(CATALOG_SNAPSHOT={"ENABLED": True}):
+            get_snapshot().clear()
+            schema.execute(query)
+
+            reserve(self.first, {Product.objects.get(id=2): 2})
+            self.assertEqual(schema.execute(query).data["product"], {"inventoryCount": 5, "availableCount": 3})
+
+            self.first.updateItems({2: 1})
+            self.first.checkout()
+            self.assertEqual(schema.execute(query).data["product"], {"inventoryCount": 4, "availableCount": 4})
+
+class ShardedInventoryTest(TestCase):
+    def setUp(self):
+        initTestDB()
+        Product.objects.filter(id=1).update(inventory_count=2)
+        self.first = ShoppingCart.objects.create(id=1, total=0)
+        self.second = ShoppingCart.objects.create(id=2, total=0)
+
+    def stock(self, productId=1):
+        query = "query Stock($id: Int) { product(id: $id) { inventoryCount availableCount } }"
+        return schema.execute(query, variable_values={"id": productId}, context_value=RequestFactory().get("/")).data["product"]
+
+    def test_set_shards_keeps_stock(self):
+        """ Sharding spreads the stock and held units evenly, unsharding adds them back up """
+
+        reserve(self.first, {Product.objects.get(id=2): 1})
+        set_shards(2, 3)
+
+        self.assertEqual(list(InventoryShard.objects.filter(product_id=2).order_by("index").values_list("count", "reserved")), [(2, 1), (2, 0), (1, 0)])
+        self.assertEqual(self.stock(2), {"inventoryCount": 5, "availableCount": 4})
+
+        set_shards(2, 0)
+        self.assertFalse(InventoryShard.objects.exists())
+        self.assertEqual(Product.objects.values_list("inventory_count", "reserved_count", "shard_count").get(id=2), (5, 1, 0))
+
+    def test_checkout_works_the_same_in_both_modes(self):
+        """ With and without shards the two carts get the two units, a third cart finds none and holds are used up """
+
+        for shards in (0, 4):
+            Product.objects.filter(id=1).update(inventory_count=2, reserved_count=0)
+            set_shards(1, shards)
+            carts = [ShoppingCart.objects.create(total=0) for i in range(3)]
+
+            self.assertTrue(reserve(carts[0], {Product.objects.get(id=1): 1}))
+            for cart in carts:
+                cart.items.add(1)
+
+            self.assertEqual(carts[1].checkout(), [])
+            self.assertEqual([product.id for product in carts[2].checkout()], [1])
+            self.assertEqual(carts[0].checkout(), [])
+            self.assertFalse(Reservation.objects.exists())
+
+            set_shards(1, 0)
+            self.assertEqual(Product.objects.values_list("inventory_count", "reserved_count").get(id=1), (0, 0))
+            ShoppingCart.objects.all().delete()
+
+    def test_reservations_of_sharded_products(self):
+        """ A sharded product holds units for carts until every unit is held, releases give them back """
+
+        set_shards(1, 2)
+
+        self.assertTrue(reserve(self.first, {Product.objects.get(id=1): 1}))
+        self.assertTrue(reserve(self.second, {Product.objects.get(id=1): 1}))
+        self.assertFalse(reserve(ShoppingCart.objects.create(total=0), {Product.objects.get(id=1): 1}))
+
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(sweep_reservations(), 2)
+        self.assertEqual(InventoryShard.objects.filter(reserved__gt=0).count(), 0)
+
+    def test_submit_cart_and_sync(self):
+        """ submitCart takes the unit from a shard, the cached total and the product row catch up """
+
+        set_shards(1, 4)
+        self.stock()
+        initCart(self.client.session)
+
+        result = schema.execute("mutation { addToCart(productId: 1) { cart { items { id } } } }", context_value=self.client)
+        self.assertEqual(result.data, {"addToCart": {"cart": {"items": [{"id": "1"}]}}})
+
+        result = schema.execute("mutation { submitCart { failedItems { id } message } }", context_value=self.client)
+        self.assertEqual(result.data, {"submitCart": {"failedItems": [], "message": "Shopping cart was successfully completed"}})
+
+        self.assertEqual(Product.objects.get(id=1).inventory_count, 2)
+        self.assertEqual(sync_totals(), 1)
+        self.assertEqual(Product.objects.get(id=1).inventory_count, 1)
+        self.assertEqual(sync_totals(), 0)
+
+        cache.clear()
+        self.assertEqual(self.stock(), {"inventoryCount": 1, "availableCount": 1})
+
+    def test_stock_right_after_checkout(self):
+        """ Holds, releases and checkouts of a sharded product drop its cached total straight away """
+
+        set_shards(1, 4)
+        self.assertEqual(self.stock(), {"inventoryCount": 2, "availableCount": 2})
+        initCart(self.client.session)
+
+        schema.execute("mutation { addToCart(productId: 1) { cart { id } } }", context_value=self.client)
+        self.assertEqual(self.stock(), {"inventoryCount": 2, "availableCount": 1})
+
+        schema.execute("mutation { removeFromCart(productId: 1) { cart { id } } }", context_value=self.client)
+        self.assertEqual(self.stock(), {"inventoryCount": 2, "availableCount": 2})
+
+        schema.execute("mutation { addToCart(productId: 1) { cart { id } } }", context_value=self.client)
+        schema.execute("mutation { submitCart { message } }", context_value=self.client)
+        self.assertEqual(self.stock(), {"inventoryCount": 1, "availableCount": 1})
+